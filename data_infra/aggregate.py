@@ -1,7 +1,12 @@
 import logging
 import psycopg
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from . import config
 from . import db
+from .kline import TIMEFRAMES
 
 # 配置日志
 logging.basicConfig(
@@ -11,64 +16,266 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_aggregation(force_backfill=False):
+# 创建与刷新顺序：上层视图依赖日线
+LEVELS = ("daily", "weekly", "monthly")
+
+# 日线：唯一直接扫描分钟线的一层（{source} 为 stock_1min_qfq，基准测试时为时间窗口子查询）
+DAILY_SELECT = """
+    SELECT
+        time_bucket('1 day', time) AS day,
+        code,
+        -- 名称不在聚合中计算：查询时关联维表 stock_name（见 names.py）
+        first(open, time) as open,
+        max(high) as high,
+        min(low) as low,
+        last(close, time) as close,
+        sum(volume) as volume,
+        sum(amount) as amount
+    FROM {source}
+    WHERE volume >= 0  -- 隐式过滤 NULL
+      AND amount >= 0
+
+      -- 以下逻辑不检查价格正负，以支持前复权负价格
+      AND high >= GREATEST(open, close)
+      AND low <= LEAST(open, close)
+    GROUP BY day, code
+"""
+
+# 周线/月线：在日线之上汇总（分层持续聚合，需要 TimescaleDB >= 2.9）
+ROLLUP_SELECT = """
+    SELECT
+        time_bucket('{bucket}', day) AS {column},
+        code,
+        first(open, day) as open,
+        max(high) as high,
+        min(low) as low,
+        last(close, day) as close,
+        sum(volume) as volume,
+        sum(amount) as amount
+    FROM {source}
+    GROUP BY {column}, code
+"""
+
+# 旧版单层月线（直接扫描分钟线），仅用于基准对比
+FLAT_MONTHLY_SELECT = DAILY_SELECT.replace("'1 day'", "'1 month'").replace("AS day", "AS month") \
+    .replace("GROUP BY day", "GROUP BY month")
+
+# 自动刷新策略：(start_offset, end_offset, schedule_interval)
+POLICIES = {
+    "daily": ("3 months", "1 hour", "30 minutes"),
+    "weekly": ("3 months", "1 hour", "1 hour"),
+    "monthly": ("3 months", "1 hour", "1 hour"),
+}
+
+HIERARCHY_MIN_VERSION = (2, 9)
+
+# 全量回填的起点
+BACKFILL_START = datetime(2000, 1, 1)
+
+# 回填进度：每个视图的每个时间窗口一行，重跑时跳过已完成（DONE）的窗口
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS aggregate_backfill (
+        view_name TEXT NOT NULL,
+        window_start TIMESTAMP NOT NULL,
+        window_end TIMESTAMP NOT NULL,
+        status TEXT NOT NULL,           -- 'PENDING', 'DONE', 'FAILED'
+        seconds DOUBLE PRECISION,
+        error_msg TEXT,
+        updated_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (view_name, window_start, window_end)
+    );
+"""
+
+def select_sql(name: str, source: str = None) -> str:
+    """某一层的聚合查询；source 缺省为该层的数据来源（分钟线或日线视图）。"""
+    tf = TIMEFRAMES[name]
+    if tf.source is None:
+        return DAILY_SELECT.format(source=source or "stock_1min_qfq")
+    return ROLLUP_SELECT.format(bucket=tf.bucket, column=tf.column,
+                                source=source or TIMEFRAMES[tf.source].view)
+
+def _view_exists(cur, view: str) -> bool:
+    cur.execute("SELECT 1 FROM timescaledb_information.continuous_aggregates WHERE view_name = %s", (view,))
+    return cur.fetchone() is not None
+
+def _is_flat_monthly(cur) -> bool:
+    """月线视图是否仍是旧版单层定义（直接聚合 stock_1min_qfq）。"""
+    cur.execute("""
+        SELECT view_definition FROM timescaledb_information.continuous_aggregates
+        WHERE view_name = 'stock_monthly_kline'
+    """)
+    row = cur.fetchone()
+    return row is not None and TIMEFRAMES["daily"].view not in row[0]
+
+def _check_hierarchy_support(cur):
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'timescaledb'")
+    row = cur.fetchone()
+    version = tuple(int(p) for p in row[0].split("-")[0].split(".")[:2]) if row else (0, 0)
+    if version < HIERARCHY_MIN_VERSION:
+        raise RuntimeError(f"Hierarchical continuous aggregates need TimescaleDB >= 2.9 (installed: "
+                           f"{row[0] if row else 'none'}).")
+
+def add_months(month: datetime, n: int) -> datetime:
+    return datetime(month.year + (month.month - 1 + n) // 12, (month.month - 1 + n) % 12 + 1, 1)
+
+def backfill_windows(start: datetime, end: datetime, months: int):
+    """把回填区间 [start, end) 切成每段 months 个月的窗口（按月对齐，最后一段截止到 end）。"""
+    windows = []
+    while start < end:
+        windows.append((start, min(add_months(start, months), end)))
+        start = windows[-1][1]
+    return windows
+
+def _has_pending(cur, view: str) -> bool:
+    """是否有未完成的回填窗口（上次回填被中断或失败）。"""
+    cur.execute("SELECT 1 FROM aggregate_backfill WHERE view_name = %s AND status <> 'DONE' LIMIT 1", (view,))
+    return cur.fetchone() is not None
+
+def _backfill_end(cur) -> datetime:
+    """回填终点 NOW()：与刷新时的会话时区一致（Asia/Shanghai），源表为 timestamp without time zone。"""
+    cur.execute("SELECT (NOW() AT TIME ZONE 'Asia/Shanghai')::timestamp")
+    return cur.fetchone()[0]
+
+def _plan_backfill(conn, view: str, windows, restart: bool):
     """
-    执行月线聚合视图的创建与历史数据回填。
-    基于逻辑幂等设计，可重复运行。
+    登记本次回填的窗口并返回待执行的窗口。已完成（DONE）的窗口跳过，除非 restart。
+    旧的未完成记录先删除：最后一个窗口的终点随 NOW() 变化。
+    """
+    with conn.cursor() as cur:
+        if restart:
+            cur.execute("DELETE FROM aggregate_backfill WHERE view_name = %s", (view,))
+        else:
+            cur.execute("DELETE FROM aggregate_backfill WHERE view_name = %s AND status <> 'DONE'", (view,))
+        cur.executemany("""
+            INSERT INTO aggregate_backfill (view_name, window_start, window_end, status)
+            VALUES (%s, %s, %s, 'PENDING')
+            ON CONFLICT (view_name, window_start, window_end) DO NOTHING
+        """, [(view, start, end) for start, end in windows])
+        cur.execute("""
+            SELECT window_start, window_end FROM aggregate_backfill
+            WHERE view_name = %s AND status <> 'DONE'
+            ORDER BY window_start
+        """, (view,))
+        return cur.fetchall()
+
+def _refresh_window(name: str, start: datetime, end: datetime) -> float:
+    """在独立的 autocommit 连接上刷新一个窗口并记录进度。返回耗时（秒）。"""
+    view = TIMEFRAMES[name].view
+    t0 = time.perf_counter()
+    with db.get_db_connection() as conn:
+        # 必须开启 autocommit：CALL refresh_continuous_aggregate 不能在事务块内运行
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            try:
+                cur.execute(f"CALL refresh_continuous_aggregate('{view}', %s, %s);", bucket_window(name, start, end))
+            except psycopg.Error as e:
+                cur.execute("""
+                    UPDATE aggregate_backfill SET status = 'FAILED', error_msg = %s, updated_at = NOW()
+                    WHERE view_name = %s AND window_start = %s AND window_end = %s
+                """, (str(e), view, start, end))
+                raise
+            seconds = time.perf_counter() - t0
+            cur.execute("""
+                UPDATE aggregate_backfill SET status = 'DONE', seconds = %s, error_msg = NULL, updated_at = NOW()
+                WHERE view_name = %s AND window_start = %s AND window_end = %s
+            """, (seconds, view, start, end))
+    return seconds
+
+def backfill(name: str, restart: bool = False, window_months: int = None, workers: int = None) -> int:
+    """
+    分窗口、并行、可断点续跑地回填一层视图：[BACKFILL_START, NOW()) 按 window_months 个月切窗，
+    最多 workers 个连接同时刷新，完成的窗口记入 aggregate_backfill，重跑时跳过。
+    每个窗口完成时记录耗时和预计剩余时间。返回失败的窗口数。
+    """
+    window_months = window_months or config.BACKFILL_WINDOW_MONTHS
+    workers = workers or config.BACKFILL_WORKERS
+    view = TIMEFRAMES[name].view
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            now = _backfill_end(cur)
+        windows = backfill_windows(BACKFILL_START, now, window_months)
+        pending = _plan_backfill(conn, view, windows, restart)
+        conn.commit()
+
+    logger.info(f"Backfilling {view}: {len(pending)} of {len(windows)} windows pending "
+                f"({window_months} months each, {workers} connections).")
+    failed = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_refresh_window, name, start, end): (start, end) for start, end in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            start, end = futures[future]
+            try:
+                seconds = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"[{view}] Window [{start:%Y-%m-%d}, {end:%Y-%m-%d}) failed: {e}")
+                continue
+            elapsed = time.perf_counter() - t0
+            eta = timedelta(seconds=round(elapsed / done * (len(pending) - done)))
+            logger.info(f"[{view}] Window [{start:%Y-%m-%d}, {end:%Y-%m-%d}) refreshed in {seconds:.1f}s "
+                        f"({done}/{len(pending)}, ETA {eta}).")
+    return failed
+
+def run_aggregation(force_backfill=False, rebuild_monthly=False):
+    """
+    执行日线/周线/月线分层聚合视图的创建与历史数据回填。
+    日线聚合分钟线，周线与月线在日线之上汇总。基于逻辑幂等设计，可重复运行。
+    已存在的旧版单层月线保持不变，除非 rebuild_monthly（删除后在日线之上重建，只需回填日线数据）。
     """
     logger.info("Starting Phase 1: Metadata Definition (DDL)...")
-    view_created = False
-    
+    created = []
+
     # Phase 1: 元数据定义 (事务模式)
     try:
         with db.get_db_connection() as conn:
             # Phase 1 不需要特殊的 autocommit，使用标准事务确保 DDL 原子性
             with conn.cursor() as cur:
-                # 1. 检查是否存在 (实现逻辑幂等)
-                cur.execute("SELECT 1 FROM timescaledb_information.continuous_aggregates WHERE view_name = 'stock_monthly_kline'")
-                if cur.fetchone():
-                    logger.info("Continuous aggregate view 'stock_monthly_kline' already exists.")
-                else:
-                    # 2. 创建持续聚合视图
-                    logger.info("Creating materialized view 'stock_monthly_kline'...")
-                    cur.execute("""
-                        CREATE MATERIALIZED VIEW stock_monthly_kline
-                        WITH (timescaledb.continuous) AS
-                        SELECT
-                            time_bucket('1 month', time) AS month,
-                            code,
-                            last(name, time) as name,  -- 取该月最后一条记录的股票名称 (处理更名)
-                            first(open, time) as open,
-                            max(high) as high,
-                            min(low) as low,
-                            last(close, time) as close,
-                            sum(volume) as volume,
-                            sum(amount) as amount
-                        FROM stock_1min_qfq
-                        WHERE volume >= 0  -- 隐式过滤 NULL
-                          AND amount >= 0
-
-                          -- 以下逻辑不检查价格正负，以支持前复权负价格
-                          AND high >= GREATEST(open, close)
-                          AND low <= LEAST(open, close)
-                        GROUP BY month, code
-                        WITH NO DATA;
+                _check_hierarchy_support(cur)
+                cur.execute(PROGRESS_DDL)
+                for name in LEVELS:
+                    tf = TIMEFRAMES[name]
+                    # 1. 检查是否存在 (实现逻辑幂等)
+                    exists = _view_exists(cur, tf.view)
+                    if exists and name == "monthly" and _is_flat_monthly(cur):
+                        if rebuild_monthly:
+                            logger.warning("Dropping the single-level stock_monthly_kline to rebuild it on "
+                                           "stock_daily_kline.")
+                            cur.execute("DROP MATERIALIZED VIEW stock_monthly_kline;")
+                            exists = False
+                        else:
+                            logger.warning("stock_monthly_kline still aggregates stock_1min_qfq; run with "
+                                           "--rebuild-monthly to build it on stock_daily_kline.")
+                    if exists:
+                        logger.info(f"Continuous aggregate view '{tf.view}' already exists.")
+                    else:
+                        # 2. 创建持续聚合视图
+                        logger.info(f"Creating materialized view '{tf.view}'...")
+                        cur.execute(f"CREATE MATERIALIZED VIEW {tf.view} WITH (timescaledb.continuous) AS "
+                                    f"{select_sql(name)} WITH NO DATA;")
+                        created.append(name)
+
+                    # 3. 创建索引 (幂等操作)
+                    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_code_time "
+                                f"ON {tf.view} (code, {tf.column} DESC);")
+
+                    # 4. 添加自动刷新策略 (幂等操作)
+                    start_offset, end_offset, schedule = POLICIES[name]
+                    cur.execute(f"""
+                        SELECT add_continuous_aggregate_policy('{tf.view}',
+                            start_offset => INTERVAL '{start_offset}',
+                            end_offset => INTERVAL '{end_offset}',
+                            schedule_interval => INTERVAL '{schedule}',
+                            if_not_exists => TRUE);
                     """)
-                    logger.info("Materialized View definition created.")
-                    view_created = True
+                logger.info("Views, indexes and refresh policies checked/created.")
 
-                # 3. 创建索引 (幂等操作)
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_code_time ON stock_monthly_kline (code, month DESC);")
-                
-                # 4. 添加自动刷新策略 (幂等操作)
-                cur.execute("""
-                    SELECT add_continuous_aggregate_policy('stock_monthly_kline',
-                        start_offset => INTERVAL '3 months',
-                        end_offset => INTERVAL '1 hour',
-                        schedule_interval => INTERVAL '30 minutes',
-                        if_not_exists => TRUE);
-                """)
-                logger.info("Index and Refresh Policy checked/created.")
+                # 5. 与建视图同一事务登记新视图的回填窗口：回填中断后（哪怕还在回填日线），
+                #    重跑仍能从 aggregate_backfill 看到周线/月线待回填
+                if created:
+                    windows = backfill_windows(BACKFILL_START, _backfill_end(cur), config.BACKFILL_WINDOW_MONTHS)
+                    for name in created:
+                        _plan_backfill(conn, TIMEFRAMES[name].view, windows, restart=True)
 
             # 显式提交事务 (虽然 with 块结束会自动提交，但 DDL 建议明确)
             conn.commit()
@@ -80,41 +287,148 @@ def run_aggregation(force_backfill=False):
         logger.error(f"Unexpected error during Phase 1: {e}")
         raise
 
-    # Phase 2: 历史数据回填 (Autocommit 模式)
-    # CALL refresh_continuous_aggregate 必须在事务块之外运行
-    if view_created or force_backfill:
-        logger.info("Starting Phase 2: Full Historical Backfill (2000-Now)...")
-        if force_backfill and not view_created:
-            logger.warning("Force backfill requested for an existing view.")
-            
-        logger.warning("This is a HEAVY long-running task for 7B+ records. DO NOT INTERRUPT.")
-        
-        try:
-            with db.get_db_connection() as conn:
-                # 必须开启 autocommit 以支持存储过程中的事务控制
-                conn.autocommit = True
-                with conn.cursor() as cur:
-                    # 设置会话时区以对齐 NOW()
-                    cur.execute("SET TIME ZONE 'Asia/Shanghai';")
-                    logger.info("Executing CALL refresh_continuous_aggregate...")
-                    # 修正：显式转换 NOW() 为 timestamp (without time zone) 以匹配源表类型
-                    cur.execute("CALL refresh_continuous_aggregate('stock_monthly_kline', '2000-01-01', NOW()::timestamp);")
-            logger.info("Phase 2: History backfill completed successfully.")
-        except psycopg.Error as e:
-            logger.error(f"Backfill failed: {e}")
-            logger.error("Tip: You can resume by running with --force-backfill.")
-            raise
-    else:
-        logger.info("Step 2: Skipping backfill (view already exists and no --force-backfill).")
+    # Phase 2: 历史数据回填（分窗口并行，见 backfill），按层级顺序：上层只读取已回填的日线
+    # 新建的视图与 --force-backfill 从头回填；上次中断留下未完成窗口的视图自动续跑
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            levels = [name for name in LEVELS
+                      if force_backfill or name in created or _has_pending(cur, TIMEFRAMES[name].view)]
+    if not levels:
+        logger.info("Step 2: Skipping backfill (views already exist and no --force-backfill).")
+        return
+
+    logger.info(f"Starting Phase 2: Historical Backfill (2000-Now) of {', '.join(levels)}...")
+    if force_backfill:
+        logger.warning("Force backfill requested for existing views.")
+    if "daily" in levels:
+        logger.warning("The daily backfill is a HEAVY long-running task for 7B+ records. "
+                       "It can be interrupted: a rerun resumes with the unfinished windows.")
+    for name in levels:
+        failed = backfill(name, restart=force_backfill or name in created)
+        if failed:
+            logger.error(f"Backfill of {TIMEFRAMES[name].view} left {failed} failed windows.")
+            logger.error("Tip: Rerun (without --force-backfill) to resume with the unfinished windows.")
+            raise RuntimeError(f"{failed} backfill windows of {TIMEFRAMES[name].view} failed")
+        logger.info(f"Backfilled {TIMEFRAMES[name].view}.")
+    logger.info("Phase 2: History backfill completed successfully.")
+
+def _next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def month_ranges(months):
+    """
+    将受影响的月份（任意 date/datetime，取所在月）合并为连续区间 [start, end)，
+    每个区间只需一次 refresh 调用。
+    """
+    ranges = []
+    for month in sorted({datetime(m.year, m.month, 1) for m in months}):
+        if ranges and ranges[-1][1] == month:
+            ranges[-1][1] = _next_month(month)
+        else:
+            ranges.append([month, _next_month(month)])
+    return [tuple(r) for r in ranges]
+
+def bucket_window(name: str, start: datetime, end: datetime):
+    """
+    把 [start, end) 扩展到该层桶边界：refresh_continuous_aggregate 只刷新完全落在窗口内的桶。
+    日线与月线在月边界上天然对齐；周线桶从周一开始。
+    """
+    if name != "weekly":
+        return start, end
+    return start - timedelta(days=start.weekday()), end + timedelta(days=(7 - end.weekday()) % 7)
+
+def refresh_months(months):
+    """
+    只刷新受影响月份的 K 线聚合（例如复权数据按天重写之后），而不是全量回填。
+    按层级顺序刷新日线、周线、月线；尚未创建的视图跳过。返回刷新的区间列表。
+    """
+    ranges = month_ranges(months)
+    if not ranges:
+        return []
+    with db.get_db_connection() as conn:
+        # CALL refresh_continuous_aggregate 必须在事务块之外运行
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for name in LEVELS:
+                view = TIMEFRAMES[name].view
+                cur.execute(f"SELECT to_regclass('public.{view}')")
+                if cur.fetchone()[0] is None:
+                    logger.info(f"{view} does not exist, skipping refresh.")
+                    continue
+                for start, end in ranges:
+                    window = bucket_window(name, start, end)
+                    logger.info(f"Refreshing {view} for [{start:%Y-%m}, {end:%Y-%m})...")
+                    cur.execute(f"CALL refresh_continuous_aggregate('{view}', %s, %s);", window)
+    return ranges
+
+def benchmark(start: datetime, end: datetime) -> list:
+    """
+    在 [start, end) 窗口内对比单层月线与分层聚合的计算成本（临时表，结束时回滚）：
+    旧版月线直接扫描分钟线；分层方案先算日线，再由日线汇总周线和月线。
+    同时核对两种月线结果是否一致。返回 [{step, rows, seconds}]。
+    """
+    window = f"(SELECT * FROM stock_1min_qfq WHERE time >= '{start:%Y-%m-%d}' AND time < '{end:%Y-%m-%d}') AS m"
+    steps = [
+        ("monthly (1min, single level)", "bench_flat_monthly", FLAT_MONTHLY_SELECT.format(source=window)),
+        ("daily (1min)", "bench_daily", select_sql("daily", window)),
+        ("weekly (daily)", "bench_weekly", select_sql("weekly", "bench_daily")),
+        ("monthly (daily)", "bench_monthly", select_sql("monthly", "bench_daily")),
+    ]
+    results = []
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {window}")
+            results.append({"step": "1min rows in window", "rows": cur.fetchone()[0], "seconds": 0.0})
+            for step, table, query in steps:
+                t0 = time.perf_counter()
+                cur.execute(f"CREATE TEMP TABLE {table} AS {query}")
+                seconds = time.perf_counter() - t0
+                cur.execute(f"SELECT count(*) FROM {table}")
+                results.append({"step": step, "rows": cur.fetchone()[0], "seconds": seconds})
+            # 两种月线应逐行一致（NUMERIC 存储下精确相等；DOUBLE 求和顺序不同可能有末位差异）
+            cur.execute("""
+                SELECT count(*) FROM (
+                    (SELECT * FROM bench_flat_monthly EXCEPT SELECT * FROM bench_monthly)
+                    UNION ALL
+                    (SELECT * FROM bench_monthly EXCEPT SELECT * FROM bench_flat_monthly)
+                ) d
+            """)
+            results.append({"step": "monthly rows that differ", "rows": cur.fetchone()[0], "seconds": 0.0})
+        conn.rollback()
+    return results
+
+def format_benchmark(results) -> str:
+    lines = [f"{'step':<32}{'rows':>14}{'seconds':>10}"]
+    for r in results:
+        lines.append(f"{r['step']:<32}{r['rows']:>14}{r['seconds']:>10.2f}")
+    return "\n".join(lines)
 
 if __name__ == "__main__":
     import argparse
-    parser = argparse.ArgumentParser(description="Stock Monthly Aggregation Loader")
-    parser.add_argument("--force-backfill", action="store_true", help="Force run full historical backfill")
+    parser = argparse.ArgumentParser(description="Stock K-line (daily/weekly/monthly) Aggregation Loader")
+    parser.add_argument("--force-backfill", action="store_true",
+                        help="Force run full historical backfill (a plain rerun resumes an interrupted one)")
+    parser.add_argument("--window-months", type=int, default=config.BACKFILL_WINDOW_MONTHS,
+                        help="Backfill window size in months (default: BACKFILL_WINDOW_MONTHS)")
+    parser.add_argument("--workers", type=int, default=config.BACKFILL_WORKERS,
+                        help="Windows refreshed concurrently (default: BACKFILL_WORKERS)")
+    parser.add_argument("--rebuild-monthly", action="store_true",
+                        help="Rebuild a single-level stock_monthly_kline on stock_daily_kline")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare single-level and hierarchical aggregation cost on a window, then exit")
+    parser.add_argument("--bench-start", type=lambda v: datetime.strptime(v, "%Y-%m"),
+                        default=datetime(datetime.now().year - 1, 1, 1), help="First month of the window (YYYY-MM)")
+    parser.add_argument("--bench-end", type=lambda v: datetime.strptime(v, "%Y-%m"),
+                        default=datetime(datetime.now().year, 1, 1), help="Month after the window (YYYY-MM)")
     args = parser.parse_args()
+    config.BACKFILL_WINDOW_MONTHS = args.window_months
+    config.BACKFILL_WORKERS = args.workers
 
     try:
-        run_aggregation(force_backfill=args.force_backfill)
+        if args.benchmark:
+            print(format_benchmark(benchmark(args.bench_start, args.bench_end)))
+            sys.exit(0)
+        run_aggregation(force_backfill=args.force_backfill, rebuild_monthly=args.rebuild_monthly)
         logger.info("Aggregation task finished.")
     except KeyboardInterrupt:
         logger.warning("Task interrupted by user.")
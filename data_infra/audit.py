@@ -0,0 +1,120 @@
+"""
+Database-free archive audit (main --validate-only).
+
+Parses and validates every archive exactly like a load (loader.iter_clean_rows,
+VALIDATION_ENGINE and all) on AUDIT_WORKERS processes, without opening a
+database connection, and writes a JSON report:
+
+    {"totals": {rows, skipped, rejects, codes, files, failed, elapsed, rows_per_sec, ...},
+     "files": [{file, status, rows, skipped, rejects: {rule: n}, codes: {code: rows},
+                min_time, max_time, elapsed, rows_per_sec, error}, ...]}
+
+rejects counts skipped rows by validation rule (loader.REJECT_RULES); codes
+counts the valid rows per code. status is the WARNING/FAILED decision a load
+would record, so bad archives show up before a multi-hour load. The rows/sec
+figures measure pure parse + validation throughput.
+
+    python -m data_infra.main --validate-only --report audit.json
+"""
+import json
+import logging
+import os
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+from . import config
+from . import loader
+
+logger = logging.getLogger(__name__)
+
+
+def audit_archive(zip_path: str) -> dict:
+    """Parse and validate one archive (worker entry). Never raises."""
+    filename = os.path.basename(zip_path)
+    stats = loader.ParseStats()
+    codes = Counter()
+    min_time = max_time = None
+    error = None
+    t0 = time.perf_counter()
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            for row in loader.iter_clean_rows(z, filename, stats):
+                codes[row[loader.IDX_CODE]] += 1
+                t = loader.sortable_time(row[loader.IDX_TIME])
+                if min_time is None or t < min_time:
+                    min_time = t
+                if max_time is None or t > max_time:
+                    max_time = t
+        status, error = loader.evaluate_status(stats.total_rows, stats.skipped_count)
+    except Exception as e:
+        logger.error(f"[{filename}] Audit failed: {e}")
+        status, error = "FAILED", str(e)
+    elapsed = time.perf_counter() - t0
+    return {
+        "file": filename, "status": status, "rows": stats.total_rows, "skipped": stats.skipped_count,
+        "rejects": dict(stats.rejects), "codes": dict(sorted(codes.items())),
+        "min_time": min_time, "max_time": max_time,
+        "decompressed_bytes": stats.decompressed.bytes,
+        "elapsed": round(elapsed, 3),
+        "rows_per_sec": round(stats.total_rows / elapsed, 1) if elapsed else 0.0,
+        "error": error,
+    }
+
+
+def summarize(results, wall_seconds: float) -> dict:
+    """Run totals of audit_archive results (rows_per_sec is over wall-clock time)."""
+    rejects, codes = Counter(), Counter()
+    for r in results:
+        rejects.update(r["rejects"])
+        codes.update(r["codes"])
+    rows = sum(r["rows"] for r in results)
+    return {
+        "files": len(results),
+        "failed": sum(r["status"] == "FAILED" for r in results),
+        "warning": sum(r["status"] == "WARNING" for r in results),
+        "rows": rows,
+        "skipped": sum(r["skipped"] for r in results),
+        "rejects": dict(rejects.most_common()),
+        "codes": dict(sorted(codes.items())),
+        "decompressed_bytes": sum(r["decompressed_bytes"] for r in results),
+        "elapsed": round(wall_seconds, 3),
+        "rows_per_sec": round(rows / wall_seconds, 1) if wall_seconds else 0.0,
+    }
+
+
+def format_summary(totals: dict, results) -> str:
+    lines = [f"Audited {totals['files']} archives: {totals['rows']} rows, {totals['skipped']} rejected, "
+             f"{len(totals['codes'])} codes, {totals['rows_per_sec']:.0f} rows/s "
+             f"({totals['decompressed_bytes'] / 1e6 / totals['elapsed'] if totals['elapsed'] else 0:.1f} MB/s "
+             f"decompressed) on {config.AUDIT_WORKERS} workers."]
+    for rule, count in totals["rejects"].items():
+        lines.append(f"  {rule:<16}{count:>12}")
+    for r in results:
+        if r["status"] != "SUCCESS":
+            detail = ", ".join(f"{k}={v}" for k, v in sorted(r["rejects"].items())) or r["error"]
+            lines.append(f"  {r['status']:<8}{r['file']}: {r['skipped']}/{r['rows']} rejected ({detail})")
+    return "\n".join(lines)
+
+
+def run_audit(zip_paths, report_path: str = None) -> dict:
+    """Audit the archives in parallel, write the JSON report and log a summary. Returns the report."""
+    report_path = report_path or config.AUDIT_REPORT
+    logger.info(f"Validating {len(zip_paths)} archives on {config.AUDIT_WORKERS} workers (no database)...")
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=config.AUDIT_WORKERS) as executor:
+        futures = [executor.submit(audit_archive, zip_path) for zip_path in zip_paths]
+        for future in tqdm(as_completed(futures), total=len(futures), unit="file"):
+            results.append(future.result())
+    results.sort(key=lambda r: r["file"])
+
+    report = {"totals": summarize(results, time.perf_counter() - t0), "files": results}
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    logger.info(format_summary(report["totals"], results))
+    logger.info(f"Audit report written to {report_path}")
+    return report
@@ -0,0 +1,142 @@
+"""
+Benchmark the ingest variants of loader.process_zip_file on one synthetic zip.
+
+A variant is INGEST_MODE:COPY_FORMAT (e.g. 'buffer:text', 'stream:binary').
+Each variant runs in a fresh (spawned) process against an empty
+stock_1min_qfq, and reports wall time, rows/sec, the worker's peak RSS and,
+when the pg_stat_statements extension is installed, the server-side execution
+time of the COPY and merge statements (a proxy for server CPU per zip).
+
+The target tables are TRUNCATEd between runs, so --dsn must point at a
+throwaway database (it may not be the configured DB_DSN).
+
+Usage:
+    python -m data_infra.bench_ingest --dsn postgresql://postgres:pw@localhost:5432/bench_db
+    python -m data_infra.bench_ingest --dsn ... --stocks 50 --days 20 --variants stream:text stream:binary
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from . import config, synth
+except ImportError:
+    # Support direct execution: python data_infra/bench_ingest.py
+    project_root = Path(__file__).resolve().parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from data_infra import config, synth
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+def write_synthetic_zip(path: str, stocks: int, days: int, seed: int = 42) -> int:
+    """
+    Write a '*_1min.zip' with one CSV member per stock (see synth.py). Returns the data row count.
+    """
+    return synth.write_archive(path, 2001, stocks, days, seed=seed).rows
+
+
+def _reset_tables(dsn: str):
+    import psycopg
+    with psycopg.connect(dsn) as conn:
+        conn.execute("TRUNCATE TABLE stock_1min_qfq;")
+        conn.execute("TRUNCATE TABLE load_log;")
+
+
+def _count_rows(dsn: str) -> int:
+    import psycopg
+    with psycopg.connect(dsn) as conn:
+        return conn.execute("SELECT count(*) FROM stock_1min_qfq").fetchone()[0]
+
+
+def _reset_statement_stats(dsn: str) -> bool:
+    """Reset pg_stat_statements; False if the extension is not available."""
+    import psycopg
+    try:
+        with psycopg.connect(dsn) as conn:
+            conn.execute("SELECT pg_stat_statements_reset()")
+        return True
+    except psycopg.Error:
+        return False
+
+
+def _server_ms(dsn: str) -> float:
+    """Server execution time of the loader's COPY and merge statements since the last reset."""
+    import psycopg
+    with psycopg.connect(dsn) as conn:
+        return conn.execute("""
+            SELECT COALESCE(sum(total_exec_time), 0)
+            FROM pg_stat_statements
+            WHERE query ILIKE 'COPY%tmp_stock_1min_qfq%'
+               OR query ILIKE '%INSERT INTO stock_1min_qfq%'
+        """).fetchone()[0]
+
+
+def _run_variant(dsn: str, mode: str, copy_format: str, zip_path: str):
+    """Child process entry: load one zip with the given variant, return (seconds, peak RSS KiB)."""
+    from data_infra import config as child_config
+    from data_infra import loader
+
+    child_config.DB_DSN = dsn
+    child_config.INGEST_MODE = mode
+    child_config.COPY_FORMAT = copy_format
+    t0 = time.perf_counter()
+    loader.process_zip_file(zip_path)
+    elapsed = time.perf_counter() - t0
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loader ingest variants on a synthetic zip.")
+    parser.add_argument("--dsn", required=True, help="DSN of a throwaway database (tables are truncated).")
+    parser.add_argument("--zip", help="Use an existing zip instead of generating one.")
+    parser.add_argument("--stocks", type=int, default=20, help="Synthetic stocks (one CSV member each).")
+    parser.add_argument("--days", type=int, default=50, help="Synthetic trading days per stock.")
+    parser.add_argument("--variants", nargs="+", default=["buffer:text", "stream:text", "stream:binary", "pipeline:text"],
+                        help="INGEST_MODE:COPY_FORMAT pairs to compare.")
+    args = parser.parse_args()
+
+    if args.dsn == config.DB_DSN:
+        parser.error("--dsn must not be the configured DB_DSN: the benchmark truncates stock_1min_qfq.")
+
+    from data_infra import db
+    config.DB_DSN = args.dsn
+    db.init_db()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = args.zip
+        if not zip_path:
+            zip_path = os.path.join(tmp, "2001_1min.zip")
+            n = write_synthetic_zip(zip_path, args.stocks, args.days)
+            logger.info(f"Generated {zip_path}: {n} rows, {os.path.getsize(zip_path) / 1e6:.1f} MB")
+
+        results = []
+        ctx = multiprocessing.get_context("spawn")
+        for variant in args.variants:
+            mode, _, copy_format = variant.partition(":")
+            _reset_tables(args.dsn)
+            has_stats = _reset_statement_stats(args.dsn)
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                elapsed, peak_kb = executor.submit(
+                    _run_variant, args.dsn, mode, copy_format or "text", zip_path
+                ).result()
+            rows = _count_rows(args.dsn)
+            server = f"{_server_ms(args.dsn) / 1000:.2f}" if has_stats else "n/a"
+            results.append((variant, rows, elapsed, rows / elapsed if elapsed else 0.0, peak_kb / 1024, server))
+            logger.info(f"[{variant}] {rows} rows in {elapsed:.2f}s")
+
+    print(f"\n{'variant':<16}{'rows':>12}{'seconds':>10}{'rows/sec':>12}{'peak RSS MB':>14}{'server s':>10}")
+    for variant, rows, elapsed, rps, rss_mb, server in results:
+        print(f"{variant:<16}{rows:>12}{elapsed:>10.2f}{rps:>12.0f}{rss_mb:>14.1f}{server:>10}")
+
+
+if __name__ == "__main__":
+    main()
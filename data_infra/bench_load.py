@@ -0,0 +1,255 @@
+"""
+End-to-end loader benchmark: synthetic archives (synth.py) through
+`python -m data_infra.main` against a throwaway PostgreSQL/TimescaleDB.
+
+For every variant (a label plus environment overrides, e.g.
+'stream-binary:INGEST_MODE=stream,COPY_FORMAT=binary') the target database is
+dropped and recreated, main runs as a subprocess on the generated DATA_DIR,
+and the run records:
+
+    rows, seconds, rows_per_sec     rows in stock_1min_qfq over wall-clock time of main
+    peak_rss_mb                     peak summed RSS of main and its workers (sampled from /proc)
+    db_mb, table_mb                 pg_database_size and hypertable_size('stock_1min_qfq')
+    stage seconds                   parse/validate/copy/merge totals (telemetry.py)
+
+Results are appended as JSON lines to --results together with the git
+revision and the data spec. A variant whose rows/sec falls more than
+--max-regression below its previous result for the same spec is reported and
+makes the run exit with status 1, so it can gate a change before it meets a
+production load.
+
+The database in --dsn is DROPPED: it must be a throwaway database and may not
+be the configured DB_DSN.
+
+Usage:
+    python -m data_infra.bench_load --dsn postgresql://postgres:pw@localhost:5432/bench_db
+    python -m data_infra.bench_load --dsn ... --years 2001 2002 --stocks 300 --days 40 \\
+        --variant default: --variant stream-binary:INGEST_MODE=stream,COPY_FORMAT=binary
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from . import config, synth, telemetry
+except ImportError:
+    # Support direct execution: python data_infra/bench_load.py
+    project_root = Path(__file__).resolve().parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from data_infra import config, synth, telemetry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_variant(text: str):
+    """'label:KEY=VALUE,KEY=VALUE' -> (label, {KEY: VALUE})."""
+    label, _, overrides = text.partition(":")
+    env = {}
+    for item in filter(None, overrides.split(",")):
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Bad override '{item}' in variant '{text}' (expected KEY=VALUE)")
+        env[key.strip()] = value.strip()
+    return label or "default", env
+
+
+def recreate_database(dsn: str):
+    """DROP and CREATE the database of `dsn` through the server's 'postgres' database."""
+    import psycopg
+    from psycopg import sql
+    from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+    dbname = conninfo_to_dict(dsn)["dbname"]
+    with psycopg.connect(make_conninfo(dsn, dbname="postgres"), autocommit=True) as conn:
+        conn.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(dbname)))
+        conn.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
+
+
+def database_stats(dsn: str) -> dict:
+    import psycopg
+    with psycopg.connect(dsn) as conn:
+        rows = conn.execute("SELECT count(*) FROM stock_1min_qfq").fetchone()[0]
+        db_bytes = conn.execute("SELECT pg_database_size(current_database())").fetchone()[0]
+        table_bytes = conn.execute("SELECT hypertable_size('stock_1min_qfq')").fetchone()[0]
+    return {"rows": rows, "db_mb": round(db_bytes / 1e6, 1), "table_mb": round((table_bytes or 0) / 1e6, 1)}
+
+
+def _tree_rss_kb(pid: int) -> int:
+    """Summed VmRSS of a process and its descendants (Linux /proc; 0 if unavailable)."""
+    total = 0
+    todo = [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                todo.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    """Peak summed RSS of a process tree, sampled every `interval` seconds."""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_kb = max(self.peak_kb, _tree_rss_kb(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_variant(dsn: str, data_dir: str, label: str, overrides: dict, workdir: str) -> dict:
+    """Load data_dir into a fresh database with `python -m data_infra.main`; returns the measurements."""
+    recreate_database(dsn)
+    metrics_file = os.path.join(workdir, f"{label}.metrics.jsonl")
+    env = {**os.environ, "DB_DSN": dsn, "DATA_DIR": data_dir, "METRICS_FILE": metrics_file, **overrides,
+           "PYTHONPATH": os.pathsep.join(filter(None, [str(PROJECT_ROOT), os.environ.get("PYTHONPATH")]))}
+    reporter = telemetry.MetricsReporter(metrics_file, prom_path="")
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "data_infra.main", "--force"], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    sampler = RssSampler(proc.pid)
+    sampler.start()
+    _, stderr = proc.communicate()
+    elapsed = time.perf_counter() - t0
+    sampler.stop()
+    if proc.returncode != 0:
+        raise RuntimeError(f"data_infra.main failed for variant {label}:\n{stderr[-2000:]}")
+
+    reporter.poll()
+    totals = reporter.total()
+    result = database_stats(dsn)
+    result.update({
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(result["rows"] / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(sampler.peak_kb / 1024, 1),
+        "skipped": totals["skipped"],
+        **{f"{s}_s": round(totals[f"{s}_s"], 2) for s in telemetry.STAGES},
+    })
+    return result
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_results(path: str, spec: dict) -> dict:
+    """Latest recorded result per variant label for the same data spec."""
+    previous = {}
+    if not os.path.exists(path):
+        return previous
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("spec") == spec:
+                previous[record["variant"]] = record
+    return previous
+
+
+def regressions(records, previous: dict, max_regression: float):
+    """[(variant, previous rows/s, current rows/s)] that slowed down by more than max_regression."""
+    slow = []
+    for record in records:
+        before = previous.get(record["variant"])
+        if before and record["rows_per_sec"] < before["rows_per_sec"] * (1 - max_regression):
+            slow.append((record["variant"], before["rows_per_sec"], record["rows_per_sec"]))
+    return slow
+
+
+def format_results(records) -> str:
+    lines = [f"{'variant':<20}{'rows':>12}{'seconds':>10}{'rows/sec':>12}{'peak RSS MB':>13}"
+             f"{'DB MB':>10}{'table MB':>10}{'parse s':>9}{'copy s':>9}{'merge s':>9}"]
+    for r in records:
+        lines.append(f"{r['variant']:<20}{r['rows']:>12}{r['seconds']:>10.2f}{r['rows_per_sec']:>12.0f}"
+                     f"{r['peak_rss_mb']:>13.1f}{r['db_mb']:>10.1f}{r['table_mb']:>10.1f}"
+                     f"{r['parse_s']:>9.1f}{r['copy_s']:>9.1f}{r['merge_s']:>9.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end loader benchmark on synthetic archives.")
+    parser.add_argument("--dsn", required=True, help="DSN of a throwaway database (it is dropped and recreated).")
+    parser.add_argument("--data-dir", help="Use existing archives instead of generating them.")
+    parser.add_argument("--years", type=int, nargs="+", default=[2001], help="Synthetic archives (one per year).")
+    parser.add_argument("--stocks", type=int, default=100, help="Synthetic stocks per archive.")
+    parser.add_argument("--days", type=int, default=20, help="Synthetic trading days per archive.")
+    parser.add_argument("--bad-ratio", type=float, default=0.0005, help="Share of synthetic rows broken on purpose.")
+    parser.add_argument("--variant", action="append", dest="variants",
+                        help="'label:KEY=VALUE,...' environment overrides for main (repeatable; default: 'default:').")
+    parser.add_argument("--results", default="bench_results.jsonl", help="JSON lines history of the results.")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Fail if rows/sec drops by more than this share against the previous result.")
+    args = parser.parse_args()
+
+    if args.dsn == config.DB_DSN:
+        parser.error("--dsn must not be the configured DB_DSN: the benchmark drops its database.")
+
+    variants = [parse_variant(v) for v in (args.variants or ["default:"])]
+    spec = {"data_dir": args.data_dir} if args.data_dir else {
+        "years": args.years, "stocks": args.stocks, "days": args.days, "bad_ratio": args.bad_ratio}
+    previous = previous_results(args.results, spec)
+    revision = _git_revision()
+
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if not data_dir:
+            data_dir = os.path.join(tmp, "data")
+            synth.generate(data_dir, args.years, args.stocks, args.days, args.bad_ratio)
+        for label, overrides in variants:
+            logger.info(f"[{label}] loading {data_dir} with {overrides or 'the default configuration'}...")
+            result = run_variant(args.dsn, data_dir, label, overrides, tmp)
+            record = {"ts": round(time.time()), "revision": revision, "variant": label,
+                      "overrides": overrides, "spec": spec, **result}
+            records.append(record)
+            logger.info(f"[{label}] {result['rows']} rows in {result['seconds']:.2f}s")
+
+    with open(args.results, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    print("\n" + format_results(records))
+    slow = regressions(records, previous, args.max_regression)
+    for variant, before, after in slow:
+        logger.error(f"[{variant}] rows/sec regressed: {before:.0f} -> {after:.0f} "
+                     f"(more than {args.max_regression:.0%} slower than the previous result)")
+    if slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Bulk initial load of stock_1min_qfq with the (code, time) unique key deferred.
+
+Driven by `python -m data_infra.main --bulk-initial-load`:
+1. prepare_bulk_load() drops the unique key, so workers COPY straight into the
+   hypertable (db.direct_insert) without a staging table or ON CONFLICT.
+2. Archives are loaded and checkpointed in load_log / load_member_log exactly
+   like a normal run.
+3. finalize_bulk_load() removes duplicate (code, time) rows chunk by chunk on
+   BULK_WORKERS parallel connections, then rebuilds the unique index.
+
+A bulk load only starts on an empty stock_1min_qfq (bulk_load_blocker): its
+de-duplication assumes every chunk holds only rows of this load, appended in
+load order. Resuming one (unique key already dropped) is always allowed.
+
+Both phases resume. De-duplicated chunks are recorded in bulk_load_progress
+and skipped on a rerun; while the key is missing, main refuses normal loads
+(ON CONFLICT needs the key) and `--bulk-finalize-only` finishes the job.
+
+TimescaleDB cannot attach chunk indexes built on the side to a hypertable
+index, so the rebuild is a single CREATE UNIQUE INDEX with
+timescaledb.transaction_per_chunk (one short transaction per chunk); each
+chunk's B-tree build is parallelized by PostgreSQL's maintenance workers.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from psycopg import sql
+from tqdm import tqdm
+
+from . import config
+from . import db
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS bulk_load_progress (
+        chunk_name TEXT PRIMARY KEY, -- schema-qualified chunk
+        duplicates_removed BIGINT,
+        deduped_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+# Keep the physically first copy of each (code, time), like ON CONFLICT DO NOTHING
+# keeps the first loaded row (chunks of a load into an empty table are
+# append-only, so ctid order is load order; in a chunk the compression policy
+# compressed mid-load, decompression rewrote the rows and an arbitrary copy stays).
+DEDUPE_SQL = """
+    DELETE FROM {chunk} t
+    USING (
+        SELECT ctid
+        FROM (
+            SELECT ctid, row_number() OVER (PARTITION BY code, time ORDER BY ctid) AS rn
+            FROM {chunk}
+        ) ranked
+        WHERE ranked.rn > 1
+    ) dup
+    WHERE t.ctid = dup.ctid
+"""
+
+
+def bulk_load_blocker(conn):
+    """
+    Why a bulk load must not start, or None. A new one (unique key present)
+    needs an empty stock_1min_qfq: direct COPY would add duplicates of the
+    existing rows, also into compressed chunks, and the key could not be rebuilt.
+    """
+    if not db.has_unique_key(conn):
+        return None     # resuming an interrupted bulk load
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM stock_1min_qfq)")
+        if cur.fetchone()[0]:
+            return ("stock_1min_qfq already holds rows: --bulk-initial-load is only for loading an empty "
+                    "table. Load into it without --bulk-initial-load.")
+    return None
+
+
+def prepare_bulk_load(new_data: bool = True):
+    """
+    Drop the unique key before a bulk load. Raises RuntimeError if it must
+    not start (bulk_load_blocker).
+
+    new_data=True clears the de-duplication progress: chunks finished by an
+    earlier, interrupted finalize may receive rows again.
+    """
+    with db.get_db_connection() as conn:
+        blocker = bulk_load_blocker(conn)
+        if blocker:
+            raise RuntimeError(blocker)
+        with conn.cursor() as cur:
+            cur.execute(PROGRESS_DDL)
+            if new_data:
+                cur.execute("TRUNCATE TABLE bulk_load_progress;")
+        conn.commit()
+
+        if db.has_unique_key(conn):
+            logger.info(f"Dropping unique key {db.UNIQUE_KEY_NAME} for the bulk load...")
+            db.drop_unique_key(conn)
+
+
+def list_chunks(conn):
+    """Chunks of stock_1min_qfq in time order: [(schema, name, is_compressed)]."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT chunk_schema, chunk_name, is_compressed
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = 'stock_1min_qfq'
+            ORDER BY range_start;
+        """)
+        return cur.fetchall()
+
+
+def dedupe_chunk(schema: str, name: str, compressed: bool = False) -> int:
+    """
+    Delete duplicate (code, time) rows of one chunk and record it as done,
+    in a single transaction. A compressed chunk is decompressed first (and
+    left for the usual compression). Returns the number of rows removed.
+    """
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if compressed:
+                cur.execute("SELECT decompress_chunk(%s::regclass, if_compressed => TRUE)", (f"{schema}.{name}",))
+            cur.execute("SELECT set_config('work_mem', %s, true)", (config.BULK_SORT_MEM,))
+            cur.execute(sql.SQL(DEDUPE_SQL).format(chunk=sql.Identifier(schema, name)))
+            removed = cur.rowcount
+            cur.execute("""
+                INSERT INTO bulk_load_progress (chunk_name, duplicates_removed, deduped_at)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (chunk_name)
+                DO UPDATE SET duplicates_removed=EXCLUDED.duplicates_removed,
+                              deduped_at=NOW();
+            """, (f"{schema}.{name}", removed))
+        conn.commit()
+    return removed
+
+
+def rebuild_unique_index(workers: int):
+    """Create the (code, time) unique index chunk by chunk (no-op if it is already valid)."""
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        if db.has_unique_key(conn):
+            logger.info(f"Unique key {db.UNIQUE_KEY_NAME} already present.")
+            return
+
+        index = sql.Identifier(db.UNIQUE_KEY_NAME)
+        with conn.cursor() as cur:
+            # An interrupted transaction_per_chunk build leaves an invalid index behind
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(index))
+            cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (config.BULK_SORT_MEM,))
+            cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(workers),))
+            logger.info(f"Building unique index {db.UNIQUE_KEY_NAME} chunk by chunk...")
+            cur.execute(sql.SQL("""
+                CREATE UNIQUE INDEX {} ON stock_1min_qfq (code, time)
+                WITH (timescaledb.transaction_per_chunk);
+            """).format(index))
+
+        if not db.has_unique_key(conn):
+            raise RuntimeError(f"Unique index {db.UNIQUE_KEY_NAME} is invalid after the rebuild")
+
+
+def finalize_bulk_load(workers: int = None) -> bool:
+    """
+    De-duplicate every chunk not yet recorded in bulk_load_progress, then
+    rebuild the unique key. Returns False if any chunk failed (rerun to resume).
+    """
+    workers = workers or config.BULK_WORKERS
+
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(PROGRESS_DDL)
+            cur.execute("SELECT chunk_name FROM bulk_load_progress;")
+            done = {r[0] for r in cur.fetchall()}
+        conn.commit()
+        chunks = list_chunks(conn)
+
+    todo = []
+    for schema, name, is_compressed in chunks:
+        if f"{schema}.{name}" in done:
+            continue
+        if is_compressed:
+            # The bulk load started on an empty table: compressed mid-load (compression policy)
+            logger.warning(f"Decompressing {schema}.{name} to de-duplicate it")
+        todo.append((schema, name, is_compressed))
+
+    logger.info(f"Chunks to de-duplicate: {len(todo)}. Already done (resumed): {len(done)}")
+
+    removed_total = 0
+    failed = []
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(dedupe_chunk, schema, name, compressed): f"{schema}.{name}"
+                       for schema, name, compressed in todo}
+            with tqdm(total=len(todo), unit="chunk") as pbar:
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    try:
+                        removed = future.result()
+                        removed_total += removed
+                        if removed:
+                            logger.info(f"{chunk}: removed {removed} duplicate rows")
+                    except Exception as e:
+                        logger.error(f"De-duplication failed for {chunk}: {e}")
+                        failed.append(chunk)
+                    finally:
+                        pbar.update(1)
+
+    logger.info(f"Duplicate rows removed: {removed_total}")
+    if failed:
+        logger.error(f"{len(failed)} chunks failed; the unique key stays dropped. Rerun to resume.")
+        return False
+
+    rebuild_unique_index(workers)
+
+    with db.get_db_connection() as conn:
+        conn.execute("TRUNCATE TABLE bulk_load_progress;")
+        conn.commit()
+    logger.info("Bulk load finalized: unique key restored.")
+    return True
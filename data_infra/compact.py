@@ -0,0 +1,326 @@
+"""
+Compact numeric storage of stock_1min_qfq (NUMERIC_STORAGE='double') and the
+online migration of an existing NUMERIC table.
+
+Prices, amounts and percents become DOUBLE PRECISION: fixed 8 bytes, and
+first/max/min/last/sum run on floats instead of variable-length NUMERIC.
+Every stored value has at most 4 decimals and fits in 15 significant digits,
+so it round-trips exactly (round(value::numeric, 4)), negative qfq prices
+included. The checksums below verify that for every row. Queries (monthly
+aggregate, screening, plots) are unchanged.
+
+The migration copies the hypertable chunk by chunk into
+stock_1min_qfq_compact while loads keep writing to stock_1min_qfq:
+
+    python -m data_infra.compact --copy                 # resumable; --recheck re-verifies copied chunks
+    python -m data_infra.compact --benchmark --bench-start 2023-01 --bench-end 2023-12
+    python -m data_infra.compact --swap [--rebuild-aggregate]
+
+--copy records every chunk range in compact_migration with its row count and
+checksum (count and sum of per-row hashes of the values rounded to 4
+decimals, computed on both tables). A range whose checksums differ is marked
+MISMATCH and recopied on the next run. Target chunks are compressed when the
+source chunk is.
+
+--swap blocks writers (EXCLUSIVE lock, reads continue), recopies the ranges
+loaded since they were copied (load_log / load_member_log provenance) and
+verifies them, then renames stock_1min_qfq to stock_1min_qfq_numeric and the
+compact table to stock_1min_qfq. The K-line views (kline.py) are dropped (they
+are bound to the old table); --rebuild-aggregate recreates them. Do not run reload.py
+during the swap: it does not write load_log. The old table is kept for
+rollback; drop it once the new one is trusted.
+
+--benchmark compares every bar table present: table size, monthly aggregation
+of the window into a temporary stock_monthly_kline (the refresh work), and the
+flatbottom screening query on that aggregate.
+"""
+import argparse
+import logging
+import time
+from datetime import date, datetime
+
+from psycopg import sql
+from tqdm import tqdm
+
+from . import compression
+from . import config
+from . import db
+from . import kline
+
+logger = logging.getLogger(__name__)
+
+COMPACT_TABLE = "stock_1min_qfq_compact"
+LEGACY_TABLE = "stock_1min_qfq_numeric"
+
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS compact_migration (
+        range_start TIMESTAMP PRIMARY KEY,  -- chunk range of stock_1min_qfq
+        range_end TIMESTAMP NOT NULL,
+        row_count BIGINT,
+        checksum NUMERIC,                   -- see CHECKSUM_SQL
+        status TEXT,                        -- 'VERIFIED', 'MISMATCH'
+        copied_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+# Row count and sum of per-row hashes; values rounded to 4 decimals so NUMERIC and DOUBLE agree
+CHECKSUM_SQL = """
+    SELECT count(*), coalesce(sum(hashtextextended(ROW({values})::text, 0)::numeric), 0)
+    FROM {table}
+    WHERE time >= %s AND time < %s
+"""
+
+# Monthly aggregation as in stock_monthly_kline, into a temporary table shadowing it (pg_temp comes first)
+MONTHLY_TEMP_SQL = """
+    CREATE TEMP TABLE stock_monthly_kline AS
+    SELECT time_bucket('1 month', time) AS month, code,
+           first(open, time) AS open, max(high) AS high, min(low) AS low, last(close, time) AS close,
+           sum(volume) AS volume, sum(amount) AS amount
+    FROM {table}
+    WHERE time >= {start} AND time < {end}
+      AND volume >= 0 AND amount >= 0
+      AND high >= GREATEST(open, close) AND low <= LEAST(open, close)
+    GROUP BY month, code
+"""
+
+
+def ensure_tables(conn):
+    """Create the compact hypertable and the progress table (caller commits)."""
+    with conn.cursor() as cur:
+        for stmt in db.table_ddl(COMPACT_TABLE, "double"):
+            cur.execute(stmt)
+        cur.execute(PROGRESS_DDL)
+
+
+def _checksum_values() -> str:
+    value_columns = db.VALUE_COLUMN_TYPES["double"]
+    return ", ".join(f"round({c}::numeric, 4)" if c in value_columns else c for c in db.table_columns())
+
+
+def checksum(conn, table: str, start, end):
+    """(row count, hash sum) of `table` in [start, end)."""
+    with conn.cursor() as cur:
+        cur.execute(CHECKSUM_SQL.format(values=_checksum_values(), table=table), (start, end))
+        count, total = cur.fetchone()
+    return count, total
+
+
+def source_chunks(conn):
+    """[(range_start, range_end, is_compressed)] of stock_1min_qfq."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT range_start, range_end, is_compressed
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = 'stock_1min_qfq'
+            ORDER BY range_start
+        """)
+        return cur.fetchall()
+
+
+def copy_range(conn, admin, start, end) -> bool:
+    """
+    Replace [start, end) of the compact table with the rows of stock_1min_qfq
+    and record the verification in compact_migration (caller commits).
+    Compressed target chunks are decompressed on `admin` (autocommit) and
+    queued for recompression. True if the checksums match.
+    """
+    compression.decompress_for_load(admin, start, end, COMPACT_TABLE)
+    columns = ", ".join(db.table_columns())
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {COMPACT_TABLE} WHERE time >= %s AND time < %s", (start, end))
+        cur.execute(f"""
+            INSERT INTO {COMPACT_TABLE} ({columns})
+            SELECT {columns} FROM stock_1min_qfq
+            WHERE time >= %s AND time < %s
+        """, (start, end))
+    source = checksum(conn, "stock_1min_qfq", start, end)
+    verified = checksum(conn, COMPACT_TABLE, start, end) == source
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO compact_migration (range_start, range_end, row_count, checksum, status, copied_at)
+            VALUES (%s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (range_start) DO UPDATE SET
+                range_end=EXCLUDED.range_end, row_count=EXCLUDED.row_count, checksum=EXCLUDED.checksum,
+                status=EXCLUDED.status, copied_at=NOW();
+        """, (start, end, *source, "VERIFIED" if verified else "MISMATCH"))
+    if not verified:
+        logger.error(f"Checksum mismatch for {start:%Y-%m-%d} .. {end:%Y-%m-%d} (source: {source[0]} rows).")
+    return verified
+
+
+def _compress_range(admin, start, end):
+    """Compress the compact table's chunks overlapping [start, end) (autocommit connection)."""
+    chunks = admin.execute("""
+        SELECT format('%%I.%%I', chunk_schema, chunk_name)
+        FROM timescaledb_information.chunks
+        WHERE hypertable_name = %s AND NOT is_compressed AND range_start < %s AND range_end > %s
+    """, (COMPACT_TABLE, end, start)).fetchall()
+    for (chunk,) in chunks:
+        compression.compress_chunk(admin, chunk)
+
+
+def copy_all(recheck: bool = False) -> dict:
+    """
+    Copy and verify every chunk range not yet VERIFIED (with recheck=True,
+    verified ranges whose checksums changed since are recopied too).
+    Returns counts of copied, skipped and mismatched ranges.
+    """
+    totals = {"copied": 0, "skipped": 0, "mismatched": 0}
+    with db.get_db_connection() as conn, db.get_db_connection() as admin:
+        admin.autocommit = True
+        admin.execute(compression.QUEUE_DDL)
+        ensure_tables(conn)
+        conn.commit()
+        chunks = source_chunks(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT range_start, row_count, checksum FROM compact_migration WHERE status = 'VERIFIED'")
+            verified = {start: (count, total) for start, count, total in cur.fetchall()}
+        conn.commit()
+
+        for start, end, compressed in tqdm(chunks, unit="chunk", desc="compact"):
+            if start in verified and (not recheck or checksum(conn, "stock_1min_qfq", start, end) == verified[start]):
+                totals["skipped"] += 1
+                conn.commit()
+                continue
+            ok = copy_range(conn, admin, start, end)
+            conn.commit()
+            totals["copied"] += 1
+            totals["mismatched"] += not ok
+            if compressed:
+                _compress_range(admin, start, end)
+    compression.recompress_queued()
+    logger.info(f"Compact copy: {totals['copied']} ranges copied, {totals['skipped']} already verified, "
+                f"{totals['mismatched']} mismatched.")
+    return totals
+
+
+def dirty_ranges(conn):
+    """Chunk ranges of stock_1min_qfq not verified, or loaded into since they were copied."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.range_start, c.range_end
+            FROM timescaledb_information.chunks c
+            LEFT JOIN compact_migration m ON m.range_start = c.range_start
+            WHERE c.hypertable_name = 'stock_1min_qfq'
+              AND (m.status IS DISTINCT FROM 'VERIFIED'
+                   OR EXISTS (SELECT 1 FROM load_log l
+                              WHERE l.processed_at >= m.copied_at
+                                AND l.min_time < c.range_end AND l.max_time >= c.range_start)
+                   OR EXISTS (SELECT 1 FROM load_member_log l
+                              WHERE l.processed_at >= m.copied_at
+                                AND l.min_time < c.range_end AND l.max_time >= c.range_start))
+            ORDER BY c.range_start
+        """)
+        return cur.fetchall()
+
+
+def swap(rebuild_aggregate: bool = False):
+    """Catch up and verify under a write lock, then swap the tables (see module docstring)."""
+    with db.get_db_connection() as conn, db.get_db_connection() as admin:
+        admin.autocommit = True
+        admin.execute(compression.QUEUE_DDL)
+        ensure_tables(conn)
+        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE stock_1min_qfq IN EXCLUSIVE MODE")
+        dirty = dirty_ranges(conn)
+        logger.info(f"Writes blocked; catching up {len(dirty)} chunk ranges...")
+        # Decompress up front: once conn has written to the compact table, admin would wait on it
+        for start, end in dirty:
+            compression.decompress_for_load(admin, start, end, COMPACT_TABLE)
+        failed = [start for start, end in dirty if not copy_range(conn, admin, start, end)]
+        if failed:
+            conn.rollback()
+            raise RuntimeError(f"Checksum mismatch in {len(failed)} ranges (first: {failed[0]}); tables not swapped.")
+
+        with conn.cursor() as cur:
+            logger.warning("Dropping the K-line views: they are bound to the NUMERIC table.")
+            kline.drop_views(cur)
+            cur.execute(f"ALTER TABLE stock_1min_qfq RENAME TO {LEGACY_TABLE};")
+            cur.execute(f"ALTER INDEX IF EXISTS {db.UNIQUE_KEY_NAME} RENAME TO {LEGACY_TABLE}_code_time_key;")
+            cur.execute(f"ALTER TABLE {COMPACT_TABLE} RENAME TO stock_1min_qfq;")
+            cur.execute(f"ALTER INDEX {COMPACT_TABLE}_code_time_key RENAME TO {db.UNIQUE_KEY_NAME};")
+        conn.commit()
+    config.NUMERIC_STORAGE = "double"
+    logger.info(f"Swapped: stock_1min_qfq is now DOUBLE PRECISION; the old table is {LEGACY_TABLE}.")
+
+    compression.recompress_queued()
+    if rebuild_aggregate:
+        # Imported here: aggregate configures logging when imported
+        from . import aggregate
+        aggregate.run_aggregation()
+
+
+def _month_start(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def benchmark(start: date, end: date) -> list:
+    """
+    Size, monthly aggregation time of [start, end) and screening time per bar
+    table present. Returns [{table, storage, size, refresh_seconds, screen_seconds, candidates}].
+    """
+    # Imported here: the screening query lives in the flatbottom pipeline
+    from flatbottom_pipeline.selection.find_flatbottom import FlatbottomScreener
+    screener = FlatbottomScreener()
+
+    results = []
+    with db.get_db_connection() as conn:
+        screener.detect_security_master(conn, require_names=False)
+        screen_sql = screener._build_sql_query()
+        for table in ("stock_1min_qfq", COMPACT_TABLE, LEGACY_TABLE):
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0] is None:
+                    continue
+                cur.execute("SELECT hypertable_size(%s::regclass)", (table,))
+                size = cur.fetchone()[0]
+                t0 = time.perf_counter()
+                cur.execute(sql.SQL(MONTHLY_TEMP_SQL).format(
+                    table=sql.Identifier(table), start=sql.Literal(start), end=sql.Literal(end)))
+                cur.execute("CREATE INDEX ON stock_monthly_kline (code, month DESC)")
+                refresh = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                cur.execute(screen_sql)
+                candidates = len(cur.fetchall())
+                screen = time.perf_counter() - t0
+            conn.rollback()     # drops the temporary aggregate
+            results.append({"table": table, "storage": db.numeric_storage(conn, table), "size": size,
+                            "refresh_seconds": refresh, "screen_seconds": screen, "candidates": candidates})
+    return results
+
+
+def format_benchmark(results) -> str:
+    lines = [f"{'table':<26}{'storage':>9}{'size MB':>12}{'refresh s':>11}{'screen s':>10}{'candidates':>12}"]
+    for r in results:
+        lines.append(f"{r['table']:<26}{r['storage']:>9}{r['size'] / 1e6:>12.1f}"
+                     f"{r['refresh_seconds']:>11.2f}{r['screen_seconds']:>10.2f}{r['candidates']:>12}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Migrate stock_1min_qfq to DOUBLE PRECISION value columns.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--copy", action="store_true", help="Copy and verify the chunks not yet copied.")
+    group.add_argument("--swap", action="store_true", help="Catch up under a write lock and swap the tables.")
+    group.add_argument("--benchmark", action="store_true", help="Compare size, refresh and screening times.")
+    parser.add_argument("--recheck", action="store_true", help="With --copy: re-verify copied chunks too.")
+    parser.add_argument("--rebuild-aggregate", action="store_true",
+                        help="With --swap: recreate the K-line views on the new table (full backfill).")
+    parser.add_argument("--bench-start", type=_month_start, default=date(date.today().year - 1, 1, 1),
+                        help="First month of the benchmark window (YYYY-MM).")
+    parser.add_argument("--bench-end", type=_month_start, default=date(date.today().year, 1, 1),
+                        help="Month after the benchmark window (YYYY-MM).")
+    args = parser.parse_args()
+    db.init_db()
+    with db.get_db_connection() as conn:
+        config.NAME_STORAGE = "column" if db.has_name_column(conn) else "dimension"
+        if db.numeric_storage(conn) == "double" and not args.benchmark:
+            parser.error("stock_1min_qfq already uses DOUBLE PRECISION.")
+    if args.copy:
+        copy_all(args.recheck)
+    elif args.swap:
+        swap(args.rebuild_aggregate)
+    else:
+        print(format_benchmark(benchmark(args.bench_start, args.bench_end)))
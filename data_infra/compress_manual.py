@@ -1,6 +1,30 @@
+"""
+并行压缩 stock_1min_qfq 的旧 chunk（结束时间早于 7 天前且未压缩）。
+
+每个 chunk 的状态记在 compression_jobs，中断后重跑只处理剩余的 chunk：
+
+    python -m data_infra.compress_manual [--workers 4] [--max-retries 5] [--retry-failed]
+
+与 compression.py 的 compression_queue 的关系：装载时 CompressionCoordinator 会解压
+目标 chunk，记入 compression_queue，并在没有任务再写入时重新压缩（残留的在下次装载结束
+或 `python -m data_infra.compression` 时压缩）。这两张表互不读写：
+- 被装载解压过的 chunk 在 compression_jobs 里仍是 DONE/SKIPPED，下次运行本脚本时
+  _plan 会把它重新排为 PENDING；
+- 本脚本压缩了仍在 compression_queue 里的 chunk 时，队列中的记录要等 compression.py
+  压缩它（if_not_compressed，无实际工作）时才删除；
+- 不要在装载进行时运行本脚本：它可能压缩装载正在写入的 chunk，使插入变慢。
+"""
+import argparse
 import logging
-import psycopg
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+import psycopg
+
+from . import config
 from . import db
 
 # 配置日志
@@ -11,75 +35,230 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_manual_compression():
+# 每个 chunk 的压缩状态，跨运行保留（断点续跑 + 空间统计）
+JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS compression_jobs (
+        chunk_name TEXT PRIMARY KEY,    -- schema-qualified chunk
+        status TEXT NOT NULL,           -- 'PENDING', 'DONE', 'SKIPPED', 'FAILED'
+        attempts INT NOT NULL DEFAULT 0,
+        before_bytes BIGINT,
+        after_bytes BIGINT,
+        seconds DOUBLE PRECISION,
+        error_msg TEXT,
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+# 可重试的错误：死锁与 lock_timeout 超时
+RETRYABLE = (psycopg.errors.DeadlockDetected, psycopg.errors.LockNotAvailable)
+
+
+@dataclass
+class ChunkResult:
+    chunk: str
+    status: str                         # 'DONE', 'SKIPPED', 'FAILED'，重试用尽为 'PENDING'
+    attempts: int = 0
+    before_bytes: Optional[int] = None
+    after_bytes: Optional[int] = None
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def retry_delay(attempt: int, base: float) -> float:
+    """第 attempt 次重试前的等待：指数退避，加 ±50% 抖动避免并行 worker 再次同时撞锁。"""
+    return base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+
+def _fmt_mb(n) -> str:
+    return f"{(n or 0) / 1e6:,.1f} MB"
+
+
+def list_chunks(conn):
+    """待压缩的 chunk（未压缩且结束时间早于 7 天前），按时间倒序。"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT format('%I.%I', c.chunk_schema, c.chunk_name)
+            FROM timescaledb_information.chunks c
+            WHERE c.hypertable_name = 'stock_1min_qfq'
+              AND c.is_compressed = FALSE
+              AND c.range_end < NOW() - INTERVAL '7 days'
+            ORDER BY c.range_end DESC;
+        """)
+        return [r[0] for r in cur.fetchall()]
+
+
+def _plan(conn, chunks, retry_failed: bool):
+    """
+    登记待压缩的 chunk 并返回本次要处理的部分。上次中断或重试用尽的 chunk 仍为 PENDING；
+    已是 DONE/SKIPPED 却又未压缩的 chunk（装载时被解压过）重新排队；
+    FAILED（非锁类错误）跳过，除非 retry_failed。
+    """
+    requeue = "('DONE', 'SKIPPED', 'FAILED')" if retry_failed else "('DONE', 'SKIPPED')"
+    with conn.cursor() as cur:
+        cur.executemany(f"""
+            INSERT INTO compression_jobs (chunk_name, status) VALUES (%s, 'PENDING')
+            ON CONFLICT (chunk_name) DO UPDATE
+                SET status = 'PENDING', attempts = 0, before_bytes = NULL, after_bytes = NULL,
+                    seconds = NULL, error_msg = NULL, updated_at = NOW()
+                WHERE compression_jobs.status IN {requeue}
+        """, [(c,) for c in chunks])
+        cur.execute("SELECT chunk_name FROM compression_jobs WHERE status = 'PENDING' AND chunk_name = ANY(%s)",
+                    (chunks,))
+        pending = {r[0] for r in cur.fetchall()}
+    return [c for c in chunks if c in pending]
+
+
+def chunk_bytes(cur, chunk: str):
+    """压缩前后的总字节数（chunk_compression_stats）。"""
+    cur.execute("""
+        SELECT before_compression_total_bytes, after_compression_total_bytes
+        FROM chunk_compression_stats('stock_1min_qfq')
+        WHERE format('%%I.%%I', chunk_schema, chunk_name) = %s
+    """, (chunk,))
+    row = cur.fetchone()
+    return tuple(row) if row else (None, None)
+
+
+def total_bytes(cur):
+    """整张超表已压缩 chunk 的 (chunk 数, 压缩前字节, 压缩后字节)。"""
+    cur.execute("""
+        SELECT count(*), sum(before_compression_total_bytes), sum(after_compression_total_bytes)
+        FROM chunk_compression_stats('stock_1min_qfq')
+        WHERE compression_status = 'Compressed'
+    """)
+    return cur.fetchone()
+
+
+def _record(cur, r: ChunkResult):
+    cur.execute("""
+        UPDATE compression_jobs
+        SET status = %s, attempts = %s, before_bytes = %s, after_bytes = %s, seconds = %s,
+            error_msg = %s, updated_at = NOW()
+        WHERE chunk_name = %s
+    """, (r.status, r.attempts, r.before_bytes, r.after_bytes, r.seconds, r.error, r.chunk))
+
+
+def compress_one(chunk: str, max_retries: int, retry_base: float) -> ChunkResult:
+    """在独立的 autocommit 连接上压缩一个 chunk；死锁/锁超时按指数退避重试 max_retries 次。"""
+    result = ChunkResult(chunk, "PENDING")
+    t0 = time.perf_counter()
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # 设置较长的锁等待时间，减少死锁概率
+            cur.execute("SET lock_timeout = '60s';")
+            while True:
+                result.attempts += 1
+                try:
+                    cur.execute("SELECT compress_chunk(%s::regclass, if_not_compressed => TRUE);", (chunk,))
+                    result.status, result.error = "DONE", None
+                    break
+                except psycopg.errors.DuplicateObject:
+                    # 对应的就是 "already compressed" 错误
+                    result.status, result.error = "SKIPPED", None
+                    break
+                except RETRYABLE as e:
+                    result.error = str(e).strip()
+                    if result.attempts > max_retries:
+                        # 保持 PENDING：下次运行继续
+                        break
+                    delay = retry_delay(result.attempts, retry_base)
+                    logger.warning(f"{chunk}: {type(e).__name__}, retry {result.attempts}/{max_retries} "
+                                   f"in {delay:.1f}s")
+                    time.sleep(delay)
+                except psycopg.Error as e:
+                    if "already compressed" in str(e):
+                        result.status, result.error = "SKIPPED", None
+                    else:
+                        result.status, result.error = "FAILED", str(e).strip()
+                    break
+            result.seconds = time.perf_counter() - t0
+            if result.status == "DONE":
+                # 统计读取失败不影响压缩结果：保持 DONE，字节数留空
+                try:
+                    result.before_bytes, result.after_bytes = chunk_bytes(cur, chunk)
+                except psycopg.Error as e:
+                    logger.warning(f"{chunk}: compressed, but reading chunk_compression_stats failed: {e}")
+            _record(cur, result)
+    return result
+
+
+def run_manual_compression(workers: int = None, max_retries: int = None, retry_failed: bool = False):
+    """
+    用 workers 个并行连接压缩 stock_1min_qfq 的旧 chunk。每个 chunk 的结果记入 compression_jobs，
+    中断后重跑只处理剩余的 chunk。每压缩完一个 chunk 记录压缩前后大小和本次累计回收的空间，
+    结束时输出整张超表的压缩比。返回 ChunkResult 列表。
+    """
+    workers = workers or config.COMPRESS_WORKERS
+    max_retries = config.COMPRESS_MAX_RETRIES if max_retries is None else max_retries
     logger.info("Starting robust manual compression...")
-    
+
     # 1. 获取待压缩列表
-    chunks_to_compress = []
     try:
         with db.get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT c.chunk_schema, c.chunk_name
-                    FROM timescaledb_information.chunks c
-                    WHERE c.hypertable_name = 'stock_1min_qfq'
-                      AND c.is_compressed = FALSE
-                      AND c.range_end < NOW() - INTERVAL '7 days'
-                    ORDER BY c.range_end DESC;
-                """)
-                chunks_to_compress = cur.fetchall()
-        logger.info(f"Found {len(chunks_to_compress)} chunks needing compression.")
+                cur.execute(JOBS_DDL)
+            chunks = list_chunks(conn)
+            pending = _plan(conn, chunks, retry_failed)
+            conn.commit()
     except Exception as e:
         logger.error(f"Failed to fetch chunk list: {e}")
-        return
-
-    # 2. 逐个压缩 (每个都是独立事务)
-    success_count = 0
-    skip_count = 0
-    fail_count = 0
-
-    for i, (schema, name) in enumerate(chunks_to_compress):
-        full_name = f"{schema}.{name}"
-        progress = f"[{i+1}/{len(chunks_to_compress)}]"
-        
-        try:
-            # 每次循环使用新的连接，确保 autocommit
-            with db.get_db_connection() as conn:
-                conn.autocommit = True
-                with conn.cursor() as cur:
-                    # 设置较长的锁等待时间，减少死锁概率
-                    cur.execute("SET lock_timeout = '60s';")
-                    
-                    logger.info(f"{progress} Compressing {full_name}...")
-                    cur.execute(f"SELECT compress_chunk('{full_name}', if_not_compressed => TRUE);")
-                    
-            logger.info(f"{progress} SUCCESS: {full_name}")
-            success_count += 1
-            
-        except psycopg.errors.DuplicateObject:
-            # 对应的就是 "already compressed" 错误
-            logger.warning(f"{progress} SKIPPED: {full_name} (Already compressed)")
-            skip_count += 1
-            
-        except psycopg.errors.DeadlockDetected:
-            logger.error(f"{progress} DEADLOCK: {full_name} - Retrying in 10s...")
-            time.sleep(10)
-            # 简单重试逻辑 (可选)
-            fail_count += 1
-            
-        except Exception as e:
-            if "already compressed" in str(e):
-                 logger.warning(f"{progress} SKIPPED: {full_name} (Captured by text match)")
-                 skip_count += 1
+        return []
+    logger.info(f"Found {len(chunks)} chunks needing compression, {len(pending)} scheduled "
+                f"({len(chunks) - len(pending)} previously failed, rerun with --retry-failed); "
+                f"{workers} workers.")
+
+    # 2. 并行压缩 (每个 chunk 一个独立的 autocommit 连接)
+    results = []
+    reclaimed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(compress_one, chunk, max_retries, config.COMPRESS_RETRY_BASE_SECONDS): chunk
+                   for chunk in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            progress = f"[{done}/{len(pending)}]"
+            try:
+                r = future.result()
+            except Exception as e:
+                r = ChunkResult(futures[future], "FAILED", error=str(e))
+            results.append(r)
+            if r.status == "DONE":
+                reclaimed += (r.before_bytes or 0) - (r.after_bytes or 0)
+                ratio = f"{r.before_bytes / r.after_bytes:.1f}x" if r.before_bytes and r.after_bytes else "n/a"
+                logger.info(f"{progress} SUCCESS: {r.chunk} {_fmt_mb(r.before_bytes)} -> {_fmt_mb(r.after_bytes)} "
+                            f"({ratio}, {r.seconds:.1f}s, {r.attempts} attempts); reclaimed so far: {_fmt_mb(reclaimed)}")
+            elif r.status == "SKIPPED":
+                logger.warning(f"{progress} SKIPPED: {r.chunk} (Already compressed)")
+            elif r.status == "PENDING":
+                logger.error(f"{progress} GAVE UP: {r.chunk} after {r.attempts} attempts - {r.error} "
+                             f"(left pending for the next run)")
             else:
-                logger.error(f"{progress} FAILED: {full_name} - {e}")
-                fail_count += 1
+                logger.error(f"{progress} FAILED: {r.chunk} - {r.error}")
 
+    # 3. 汇总
+    counts = {s: sum(r.status == s for r in results) for s in ("DONE", "SKIPPED", "PENDING", "FAILED")}
     logger.info("="*30)
     logger.info(f"Compression Task Finished.")
-    logger.info(f"Success: {success_count}")
-    logger.info(f"Skipped: {skip_count}")
-    logger.info(f"Failed:  {fail_count}")
+    logger.info(f"Success: {counts['DONE']}")
+    logger.info(f"Skipped: {counts['SKIPPED']}")
+    logger.info(f"Retry later: {counts['PENDING']}")
+    logger.info(f"Failed:  {counts['FAILED']}")
+    logger.info(f"Reclaimed this run: {_fmt_mb(reclaimed)}")
+    try:
+        with db.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                n, before, after = total_bytes(cur)
+        if before and after:
+            logger.info(f"stock_1min_qfq: {n} compressed chunks, {_fmt_mb(before)} -> {_fmt_mb(after)} "
+                        f"(ratio {before / after:.1f}x)")
+    except Exception as e:
+        logger.error(f"Failed to read chunk_compression_stats: {e}")
+    return results
 
 if __name__ == "__main__":
-    run_manual_compression()
+    parser = argparse.ArgumentParser(description="Compress old stock_1min_qfq chunks in parallel.")
+    parser.add_argument("--workers", type=int, help=f"Parallel connections (default {config.COMPRESS_WORKERS}).")
+    parser.add_argument("--max-retries", type=int,
+                        help=f"Retries after a deadlock or lock timeout (default {config.COMPRESS_MAX_RETRIES}).")
+    parser.add_argument("--retry-failed", action="store_true", help="Also retry chunks that failed in earlier runs.")
+    args = parser.parse_args()
+    run_manual_compression(args.workers, args.max_retries, args.retry_failed)
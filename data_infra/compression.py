@@ -0,0 +1,204 @@
+"""
+Coordinate loading with chunk compression.
+
+Inserting into a compressed chunk is very slow (or fails on older
+TimescaleDB), e.g. when an archive is reloaded after compress_manual.py ran.
+CompressionCoordinator hooks into scheduling.run_tasks:
+
+- before a task is submitted, the compressed chunks of its time range are
+  decompressed (one batch per task, on one connection kept for the run; time
+  ranges already handled for an earlier task are skipped) and recorded in
+  compression_queue;
+- when no pending or running task writes into a chunk any more, a background
+  thread compresses it while the next files load. Chunks we decompressed are
+  always recompressed; with compress_new=True (--compress-after-load) the
+  freshly loaded chunks older than COMPRESS_MIN_AGE_DAYS are compressed too,
+  so a fresh load never holds the whole uncompressed history at once.
+
+compression_queue survives a crash: leftovers are recompressed at the end of
+the next run (or with `python -m data_infra.compression`).
+"""
+import logging
+import queue
+import threading
+from collections import Counter
+from datetime import timedelta
+
+import psycopg
+
+from . import config
+from . import db
+from .scheduling import chunk_keys, key_window
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DDL = """
+    CREATE TABLE IF NOT EXISTS compression_queue (
+        chunk_name TEXT PRIMARY KEY, -- schema-qualified chunk decompressed for loading
+        queued_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+_STOP = object()
+
+
+def find_compressed_chunks(conn, start, end, table: str = "stock_1min_qfq"):
+    """Schema-qualified compressed chunks of `table` overlapping [start, end)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT format('%%I.%%I', chunk_schema, chunk_name)
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = %s
+              AND is_compressed
+              AND range_start < %s
+              AND range_end > %s
+            ORDER BY range_start;
+        """, (table, end, start))
+        return [r[0] for r in cur.fetchall()]
+
+
+def decompress_for_load(conn, start, end, table: str = "stock_1min_qfq") -> int:
+    """
+    Decompress the compressed chunks of `table` overlapping [start, end)
+    (autocommit connection), queueing them in compression_queue for
+    recompression. Returns the number of chunks decompressed.
+    """
+    chunks = find_compressed_chunks(conn, start, end, table)
+    for chunk in chunks:
+        conn.execute("""
+            INSERT INTO compression_queue (chunk_name) VALUES (%s)
+            ON CONFLICT (chunk_name) DO NOTHING
+        """, (chunk,))
+        logger.info(f"Decompressing {chunk} for loading...")
+        conn.execute("SELECT decompress_chunk(%s::regclass, if_compressed => TRUE)", (chunk,))
+    return len(chunks)
+
+
+def compress_chunk(conn, chunk: str) -> bool:
+    """Compress one chunk (autocommit connection) and drop it from the queue. False on failure."""
+    try:
+        conn.execute("SELECT compress_chunk(%s::regclass, if_not_compressed => TRUE)", (chunk,))
+        conn.execute("DELETE FROM compression_queue WHERE chunk_name = %s", (chunk,))
+        return True
+    except psycopg.Error as e:
+        logger.error(f"Compression failed for {chunk}: {e}")
+        return False
+
+
+class CompressionCoordinator:
+    """
+    See module docstring. Pass before_submit as run_tasks(on_submit=...) and
+    call task_done(keys) for every finished task, then close().
+    """
+
+    def __init__(self, tasks, compress_new: bool = False):
+        # Chunk key -> tasks still to finish that write into it
+        self.remaining = Counter(k for _, keys in tasks for k in keys)
+        self.compress_new = compress_new
+        self.decompressed = 0
+        self.compressed = 0
+        self.failed = 0
+        self._finished = set()
+        # Chunk keys whose chunks were already decompressed; they stay uncompressed
+        # until no task writes into them, so later tasks need no round-trip
+        self._handled = set()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wakeups = queue.Queue()
+
+        with db.get_db_connection() as conn:
+            conn.execute(QUEUE_DDL)
+            conn.commit()
+        self._thread = threading.Thread(target=self._compress_worker, name="compress-after-load", daemon=True)
+        self._thread.start()
+
+    def _connection(self):
+        """The autocommit connection before_submit reuses across tasks (opened on first use)."""
+        if self._conn is None or self._conn.closed:
+            self._conn = db.get_db_connection()
+            self._conn.autocommit = True
+        return self._conn
+
+    def before_submit(self, args, keys):
+        """Decompress the compressed chunks of a task's time range before it starts writing."""
+        todo = set(keys) - self._handled
+        if not todo:
+            return
+        start, end = key_window(todo)
+        self.decompressed += decompress_for_load(self._connection(), start, end)
+        self._handled |= todo
+
+    def task_done(self, keys):
+        """Wake the compressor when chunks no remaining task writes into appear."""
+        with self._lock:
+            for k in keys:
+                self.remaining[k] -= 1
+                if self.remaining[k] == 0:
+                    self._finished.add(k)
+        if keys:
+            self._wakeups.put(True)
+
+    def _compress_worker(self):
+        try:
+            with db.get_db_connection() as conn:
+                conn.autocommit = True
+                conn.execute("SET lock_timeout = '60s';")
+                while self._wakeups.get() is not _STOP:
+                    self._compress_ready(conn)
+        except Exception as e:
+            logger.error(f"Background compression stopped: {e}")
+
+    def _compress_ready(self, conn):
+        queued = {r[0] for r in conn.execute("SELECT chunk_name FROM compression_queue").fetchall()}
+        rows = conn.execute("""
+            SELECT format('%%I.%%I', chunk_schema, chunk_name), range_start, range_end,
+                   range_end < NOW() - make_interval(days => %s)
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = 'stock_1min_qfq'
+              AND NOT is_compressed
+            ORDER BY range_start;
+        """, (config.COMPRESS_MIN_AGE_DAYS,)).fetchall()
+
+        for chunk, start, end, old_enough in rows:
+            keys = chunk_keys((start, end - timedelta(microseconds=1)))
+            with self._lock:
+                busy = any(self.remaining[k] > 0 for k in keys)
+                loaded = bool(keys & self._finished)
+            if busy:
+                continue
+            # Recent chunks are left to the usual compression policy, like compress_manual.py
+            if chunk in queued or (self.compress_new and loaded and old_enough):
+                if compress_chunk(conn, chunk):
+                    self.compressed += 1
+                else:
+                    self.failed += 1
+
+    def close(self):
+        """Finish background compression, then recompress leftovers (also from earlier runs)."""
+        self._wakeups.put(_STOP)
+        self._thread.join()
+        if self._conn is not None:
+            self._conn.close()
+        recompress_queued()
+        logger.info(f"Compression: {self.decompressed} chunks decompressed for loading, "
+                    f"{self.compressed} compressed during the load, {self.failed} failed.")
+
+
+def recompress_queued() -> int:
+    """Compress every chunk still listed in compression_queue. Returns the number compressed."""
+    done = 0
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        conn.execute(QUEUE_DDL)
+        conn.execute("SET lock_timeout = '60s';")
+        leftovers = [r[0] for r in conn.execute("SELECT chunk_name FROM compression_queue ORDER BY chunk_name").fetchall()]
+        if leftovers:
+            logger.info(f"Recompressing {len(leftovers)} chunks left in compression_queue...")
+        for chunk in leftovers:
+            done += compress_chunk(conn, chunk)
+    return done
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    recompress_queued()
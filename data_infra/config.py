@@ -11,6 +11,9 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS", "")
 DB_NAME = os.getenv("DB_NAME", "fin_db")
 
+# application_name prefix of loader connections ('<prefix>-<pid>')
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "fin_loader")
+
 # Construct DSN (Data Source Name)
 # Priority: DB_DSN env var > Constructed string
 _env_dsn = os.getenv("DB_DSN")
@@ -31,6 +34,13 @@ else:
     # Recommended for 8-core DB server
     MAX_WORKERS = 8
 
+# Threads stat'ing and fingerprinting archives during the checkpoint scan
+_env_scan_workers = os.getenv("SCAN_WORKERS")
+if _env_scan_workers:
+    SCAN_WORKERS = int(_env_scan_workers)
+else:
+    SCAN_WORKERS = 16
+
 # Batch size for DB transactions (number of rows)
 _env_batch = os.getenv("BATCH_SIZE")
 if _env_batch:
@@ -38,6 +48,186 @@ if _env_batch:
 else:
     BATCH_SIZE = 50000
 
+# Ingest mode for process_zip_file
+# 'buffer': format each batch into a CSV StringIO, then COPY the whole string (legacy)
+# 'stream': write cleaned rows straight into COPY while the zip is still being parsed
+# 'pipeline': a parser thread validates batches into a bounded queue while the
+#             worker streams the previous batch into COPY and commits
+INGEST_MODE = os.getenv("INGEST_MODE", "buffer")
+
+# Max parsed batches waiting for COPY in 'pipeline' mode (backpressure)
+_env_queue = os.getenv("PIPELINE_QUEUE_SIZE")
+if _env_queue:
+    PIPELINE_QUEUE_SIZE = int(_env_queue)
+else:
+    PIPELINE_QUEUE_SIZE = 2
+
+# COPY wire format
+# 'text': values sent as strings, parsed again by PostgreSQL
+# 'binary': typed values (timestamp/numeric/int8) via psycopg binary COPY; implies INGEST_MODE 'stream'
+COPY_FORMAT = os.getenv("COPY_FORMAT", "text")
+
+# Row validation engine
+# 'row': clean_row_data once per row (legacy)
+# 'vectorized': validation.clean_block on blocks of VALIDATION_BLOCK_SIZE rows
+VALIDATION_ENGINE = os.getenv("VALIDATION_ENGINE", "row")
+
+_env_block = os.getenv("VALIDATION_BLOCK_SIZE")
+if _env_block:
+    VALIDATION_BLOCK_SIZE = int(_env_block)
+else:
+    VALIDATION_BLOCK_SIZE = 100000
+
+# Unit of parallel work in data_infra.main
+# 'zip': one archive per task (legacy)
+# 'member': one CSV member per task, checkpointed in load_member_log
+TASK_UNIT = os.getenv("TASK_UNIT", "zip")
+
+# Task ordering in data_infra.main
+# 'fifo': archives/members in file name order (legacy)
+# 'chunk': chunk affinity, i.e. prefer tasks whose time range (hence hypertable
+#          chunks) does not overlap the tasks already running
+SCHEDULING = os.getenv("SCHEDULING", "chunk")
+
+# Seconds between pg_stat_activity samples for the per-worker lock-wait report (0 = off)
+_env_lock_sample = os.getenv("LOCK_SAMPLE_INTERVAL")
+if _env_lock_sample:
+    LOCK_SAMPLE_INTERVAL = float(_env_lock_sample)
+else:
+    LOCK_SAMPLE_INTERVAL = 0.5
+
+# Compress each chunk in the background once no remaining task writes into it
+# (main --compress-after-load). Chunks decompressed for a reload are always recompressed.
+COMPRESS_AFTER_LOAD = os.getenv("COMPRESS_AFTER_LOAD", "false").lower() in ("1", "true", "yes")
+
+# Chunks whose range ends less than this many days ago are left uncompressed
+_env_compress_age = os.getenv("COMPRESS_MIN_AGE_DAYS")
+if _env_compress_age:
+    COMPRESS_MIN_AGE_DAYS = int(_env_compress_age)
+else:
+    COMPRESS_MIN_AGE_DAYS = 7
+
+# Local staging of archives (see staging.py); empty = read straight from DATA_DIR
+STAGE_DIR = os.getenv("STAGE_DIR", "")
+
+# Archives copied ahead of the workers
+_env_stage_ahead = os.getenv("STAGE_AHEAD")
+if _env_stage_ahead:
+    STAGE_AHEAD = int(_env_stage_ahead)
+else:
+    STAGE_AHEAD = 2
+
+# Disk-space cap of the stage directory (GB)
+_env_stage_gb = os.getenv("STAGE_MAX_GB")
+if _env_stage_gb:
+    STAGE_MAX_GB = float(_env_stage_gb)
+else:
+    STAGE_MAX_GB = 50.0
+
+# Multi-node work queue (see work_queue.py), seconds unless noted
+_env_lease = os.getenv("QUEUE_LEASE_SECONDS")
+if _env_lease:
+    QUEUE_LEASE_SECONDS = int(_env_lease)
+else:
+    QUEUE_LEASE_SECONDS = 600
+
+_env_heartbeat = os.getenv("QUEUE_HEARTBEAT_SECONDS")
+if _env_heartbeat:
+    QUEUE_HEARTBEAT_SECONDS = int(_env_heartbeat)
+else:
+    QUEUE_HEARTBEAT_SECONDS = 60
+
+# Claims per archive before it is marked FAILED (each expired lease counts)
+_env_attempts = os.getenv("QUEUE_MAX_ATTEMPTS")
+if _env_attempts:
+    QUEUE_MAX_ATTEMPTS = int(_env_attempts)
+else:
+    QUEUE_MAX_ATTEMPTS = 3
+
+# Idle workers re-check the queue at this interval while other leases are live
+_env_poll = os.getenv("QUEUE_POLL_SECONDS")
+if _env_poll:
+    QUEUE_POLL_SECONDS = int(_env_poll)
+else:
+    QUEUE_POLL_SECONDS = 10
+
+# Bulk initial load (main --bulk-initial-load)
+# Parallel connections used to de-duplicate chunks after the load
+_env_bulk_workers = os.getenv("BULK_WORKERS")
+if _env_bulk_workers:
+    BULK_WORKERS = int(_env_bulk_workers)
+else:
+    BULK_WORKERS = MAX_WORKERS
+
+# Sort memory per connection for the de-duplication (work_mem) and the
+# unique index rebuild (maintenance_work_mem)
+BULK_SORT_MEM = os.getenv("BULK_SORT_MEM", "512MB")
+
+# Where stock names are stored
+# 'column': in every stock_1min_qfq row (legacy) and in the stock_name dimension table
+# 'dimension': only in stock_name (after `python -m data_infra.names --migrate`);
+#              main follows the actual table layout if it differs
+NAME_STORAGE = os.getenv("NAME_STORAGE", "column")
+
+# Types of the price/amount/percent columns of a new stock_1min_qfq
+# 'numeric': NUMERIC(16,4)/NUMERIC(20,4)/NUMERIC(10,4) (exact, variable-length)
+# 'double': DOUBLE PRECISION (fixed 8 bytes, faster aggregation; 4-decimal values,
+#           negative qfq prices included, round-trip exactly, see compact.py)
+# Existing tables are converted with `python -m data_infra.compact`; main follows
+# the actual table layout if it differs
+NUMERIC_STORAGE = os.getenv("NUMERIC_STORAGE", "numeric")
+
+# Loader telemetry (see telemetry.py): every finished load appends one JSON line to
+# METRICS_FILE (empty = off, no per-row timing); main rewrites METRICS_PROM_FILE
+# (Prometheus text format, optional) every METRICS_INTERVAL seconds
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "")
+_env_metrics_interval = os.getenv("METRICS_INTERVAL")
+if _env_metrics_interval:
+    METRICS_INTERVAL = float(_env_metrics_interval)
+else:
+    METRICS_INTERVAL = 10.0
+
+# Database-free archive audit (main --validate-only, see audit.py):
+# worker processes (default: all cores) and the JSON report path
+_env_audit_workers = os.getenv("AUDIT_WORKERS")
+if _env_audit_workers:
+    AUDIT_WORKERS = int(_env_audit_workers)
+else:
+    AUDIT_WORKERS = os.cpu_count() or 1
+AUDIT_REPORT = os.getenv("AUDIT_REPORT", "audit_report.json")
+
+# K-line view backfill (aggregate.py): window size in months and concurrent
+# autocommit connections refreshing windows
+_env_backfill_window = os.getenv("BACKFILL_WINDOW_MONTHS")
+if _env_backfill_window:
+    BACKFILL_WINDOW_MONTHS = int(_env_backfill_window)
+else:
+    BACKFILL_WINDOW_MONTHS = 12
+_env_backfill_workers = os.getenv("BACKFILL_WORKERS")
+if _env_backfill_workers:
+    BACKFILL_WORKERS = int(_env_backfill_workers)
+else:
+    BACKFILL_WORKERS = 4
+
+# Manual compression (compress_manual.py): parallel workers, retries of a
+# chunk after a deadlock or lock timeout, and the first backoff delay (doubled per retry)
+_env_compress_workers = os.getenv("COMPRESS_WORKERS")
+if _env_compress_workers:
+    COMPRESS_WORKERS = int(_env_compress_workers)
+else:
+    COMPRESS_WORKERS = 4
+_env_compress_retries = os.getenv("COMPRESS_MAX_RETRIES")
+if _env_compress_retries:
+    COMPRESS_MAX_RETRIES = int(_env_compress_retries)
+else:
+    COMPRESS_MAX_RETRIES = 5
+_env_compress_backoff = os.getenv("COMPRESS_RETRY_BASE_SECONDS")
+if _env_compress_backoff:
+    COMPRESS_RETRY_BASE_SECONDS = float(_env_compress_backoff)
+else:
+    COMPRESS_RETRY_BASE_SECONDS = 5.0
+
 # Error Tolerance Thresholds
 MAX_SKIPPED_ROWS = 1000
 MAX_SKIPPED_RATIO = 0.01 # 1%
@@ -3,68 +3,132 @@ from psycopg import sql
 from contextlib import contextmanager
 from typing import Generator
 import logging
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
 
 from . import config
+from . import telemetry
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """Establish a connection to the database."""
-    return psycopg.connect(config.DB_DSN, autocommit=False)
+# Column order of every COPY into stock_1min_qfq (and its staging table)
+COPY_COLUMNS = ["time", "code", "name", "open", "close", "high", "low", "volume", "amount", "change_pct", "amplitude"]
+# PostgreSQL types of COPY_COLUMNS for binary COPY (no server-side casts are applied)
+COPY_COLUMN_TYPES = ["timestamp", "text", "text", "numeric", "numeric", "numeric", "numeric", "int8", "numeric", "numeric", "numeric"]
+# SQL types of the price/amount/percent columns per NUMERIC_STORAGE
+VALUE_COLUMN_TYPES = {
+    "numeric": {"open": "NUMERIC(16, 4)", "high": "NUMERIC(16, 4)", "low": "NUMERIC(16, 4)",
+                "close": "NUMERIC(16, 4)", "amount": "NUMERIC(20, 4)",
+                "change_pct": "NUMERIC(10, 4)", "amplitude": "NUMERIC(10, 4)"},
+    "double": {c: "DOUBLE PRECISION" for c in ("open", "high", "low", "close", "amount", "change_pct", "amplitude")},
+}
+# Name of the (code, time) uniqueness: the table constraint created by init_db,
+# or the unique index rebuilt after a bulk initial load (see bulk_load.py)
+UNIQUE_KEY_NAME = "stock_1min_qfq_code_time_key"
+# chunk_time_interval of the stock_1min_qfq hypertable: the default of a new
+# table; CLIs sync it from the table at startup (chunk_interval), since a layout
+# migration may have changed it
+CHUNK_INTERVAL = timedelta(days=7)
+# Per-load provenance columns of load_log and load_member_log (see loader.Provenance);
+# a rerun overwrites them, so they describe the last run of a file or member
+PROVENANCE_DDL = [
+    "total_rows BIGINT",
+    "rows_inserted BIGINT",        # rows actually written (ON CONFLICT skips excluded)
+    "rows_conflict BIGINT",        # valid rows skipped because (code, time) already existed
+    "min_time TIMESTAMP",
+    "max_time TIMESTAMP",
+    "code_count INTEGER",          # distinct codes in the loaded rows
+    "elapsed_seconds DOUBLE PRECISION",
+]
+PROVENANCE_COLUMNS = [c.split()[0] for c in PROVENANCE_DDL]
 
-@contextmanager
-def get_cursor(conn) -> Generator[psycopg.Cursor, None, None]:
-    """Context manager for database cursor."""
-    with conn.cursor() as cur:
-        yield cur
+def table_columns():
+    """COPY_COLUMNS as stored: without name when names live only in stock_name (NAME_STORAGE)."""
+    if config.NAME_STORAGE == "dimension":
+        return [c for c in COPY_COLUMNS if c != "name"]
+    return COPY_COLUMNS
 
-def init_db():
-    """Initialize database tables and TimescaleDB extension."""
-    logger.info("Initializing database...")
-    
-    ddl_statements = [
-        # 1. Ensure TimescaleDB extension exists
-        "CREATE EXTENSION IF NOT EXISTS timescaledb CASCADE;",
-        
-        # 2. Create the main table
-        """
-        CREATE TABLE IF NOT EXISTS stock_1min_qfq (
+def copy_column_types():
+    """Binary COPY types of table_columns(): float8 instead of numeric with NUMERIC_STORAGE='double'."""
+    types = dict(zip(COPY_COLUMNS, COPY_COLUMN_TYPES))
+    if config.NUMERIC_STORAGE == "double":
+        types = {c: "float8" if t == "numeric" else t for c, t in types.items()}
+    return [types[c] for c in table_columns()]
+
+def table_ddl(table: str = "stock_1min_qfq", numeric_storage: str = None, chunk_days: int = None,
+              segmentby: str = "code", orderby: str = "time DESC"):
+    """
+    CREATE TABLE, hypertable and compression statements of a bar table with the
+    layout of stock_1min_qfq (name per NAME_STORAGE, value columns per
+    `numeric_storage`, default NUMERIC_STORAGE). chunk_days, segmentby and
+    orderby override the storage layout (see layout.py).
+    """
+    chunk_days = chunk_days or CHUNK_INTERVAL.days
+    value_types = VALUE_COLUMN_TYPES[numeric_storage or config.NUMERIC_STORAGE]
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
             time        TIMESTAMP NOT NULL,
-            code        TEXT NOT NULL,
-            name        TEXT,
-            open        NUMERIC(16, 4),
-            high        NUMERIC(16, 4),
-            low         NUMERIC(16, 4),
-            close       NUMERIC(16, 4),
+            code        TEXT NOT NULL,{"""
+            name        TEXT,""" if config.NAME_STORAGE == "column" else ""}
+            open        {value_types["open"]},
+            high        {value_types["high"]},
+            low         {value_types["low"]},
+            close       {value_types["close"]},
             volume      BIGINT,
-            amount      NUMERIC(20, 4),
-            change_pct  NUMERIC(10, 4),
-            amplitude   NUMERIC(10, 4),
+            amount      {value_types["amount"]},
+            change_pct  {value_types["change_pct"]},
+            amplitude   {value_types["amplitude"]},
             UNIQUE (code, time)
         );
         """,
-        
-        # 3. Convert to Hypertable (TimescaleDB)
-        """
+        f"""
         DO $$
         BEGIN
             IF NOT EXISTS (
                 SELECT 1 FROM timescaledb_information.hypertables 
-                WHERE hypertable_name = 'stock_1min_qfq'
+                WHERE hypertable_name = '{table}'
             ) THEN
-                PERFORM create_hypertable('stock_1min_qfq', 'time', chunk_time_interval => INTERVAL '7 days');
+                PERFORM create_hypertable('{table}', 'time', chunk_time_interval => INTERVAL '{chunk_days} days');
             END IF;
         END $$;
         """,
-        
-        # 4. Enable Compression
-        """
-        ALTER TABLE stock_1min_qfq SET (
+        f"""
+        ALTER TABLE {table} SET (
             timescaledb.compress,
-            timescaledb.compress_segmentby = 'code',
-            timescaledb.compress_orderby = 'time DESC'
+            timescaledb.compress_segmentby = '{segmentby}',
+            timescaledb.compress_orderby = '{orderby}'
         );
         """,
+    ]
+
+def get_db_connection():
+    """
+    Establish a connection to the database.
+    The application_name carries the process id, so server-side activity can be
+    attributed to a loader worker (see scheduling.LockWaitSampler).
+    """
+    return psycopg.connect(config.DB_DSN, autocommit=False,
+                           application_name=f"{config.DB_APPLICATION_NAME}-{os.getpid()}")
+
+@contextmanager
+def get_cursor(conn) -> Generator[psycopg.Cursor, None, None]:
+    """Context manager for database cursor."""
+    with conn.cursor() as cur:
+        yield cur
+
+def init_db():
+    """Initialize database tables and TimescaleDB extension."""
+    logger.info("Initializing database...")
+    
+    ddl_statements = [
+        # 1. Ensure TimescaleDB extension exists
+        "CREATE EXTENSION IF NOT EXISTS timescaledb CASCADE;",
+        
+        # 2-4. Main table (name per NAME_STORAGE, value types per NUMERIC_STORAGE),
+        #      converted to a hypertable (TimescaleDB) with compression enabled
+        *table_ddl(),
         
         # 5. Create Load Log table for checkpointing
         """
@@ -77,7 +141,69 @@ def init_db():
             file_size BIGINT,
             last_modified TIMESTAMP
         );
+        """,
+
+        # 6. Per-member checkpoints (TASK_UNIT='member'): one row per CSV inside an archive
         """
+        CREATE TABLE IF NOT EXISTS load_member_log (
+            filename TEXT NOT NULL,
+            member TEXT NOT NULL,
+            processed_at TIMESTAMP DEFAULT NOW(),
+            status TEXT, -- 'SUCCESS', 'WARNING', 'FAILED'
+            total_rows BIGINT DEFAULT 0,
+            skipped_lines INTEGER DEFAULT 0,
+            error_msg TEXT,
+            file_size BIGINT,     -- archive size/mtime when the member was loaded
+            last_modified TIMESTAMP,
+            PRIMARY KEY (filename, member)
+        );
+        """,
+
+        # 7. Content fingerprint of the archive (central directory CRC32s/sizes, see loader.archive_fingerprint)
+        "ALTER TABLE load_log ADD COLUMN IF NOT EXISTS fingerprint TEXT;",
+        "ALTER TABLE load_member_log ADD COLUMN IF NOT EXISTS fingerprint TEXT;",
+
+        # 8. Load provenance (see loader.Provenance): progress and coverage
+        #    reports read these instead of scanning stock_1min_qfq
+        *[f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column};"
+          for table in ("load_log", "load_member_log")
+          for column in PROVENANCE_DDL],
+
+        # 9. Name dimension (see names.py): the runs of bars carrying the same name
+        """
+        CREATE TABLE IF NOT EXISTS stock_name (
+            code TEXT NOT NULL,
+            valid_from TIMESTAMP NOT NULL,  -- first bar with this name
+            valid_to TIMESTAMP NOT NULL,    -- last bar with this name
+            name TEXT NOT NULL,
+            PRIMARY KEY (code, valid_from)
+        );
+        """,
+        "ALTER TABLE stock_name ADD COLUMN IF NOT EXISTS is_st BOOLEAN;",
+
+        # 10. Security master (see security_master.py): per-code facts kept up to date by every load
+        """
+        CREATE TABLE IF NOT EXISTS security_master (
+            code TEXT PRIMARY KEY,
+            code6 TEXT,
+            exchange TEXT,                  -- 'SH', 'SZ', 'BJ' (stock_code.classify_cn_stock)
+            board TEXT,                     -- 'SH_MAIN', 'STAR', 'SZ_MAIN', 'SME', 'CHINEXT', 'BSE'
+            first_bar TIMESTAMP,
+            last_bar TIMESTAMP,
+            months_of_history INTEGER DEFAULT 0,
+            name TEXT,                      -- current name (latest stock_name run)
+            is_st BOOLEAN,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS security_month (
+            code TEXT NOT NULL,
+            month DATE NOT NULL,            -- months with at least one bar
+            PRIMARY KEY (code, month)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_security_master_board ON security_master (exchange, board);",
     ]
 
     with get_db_connection() as conn:
@@ -103,35 +229,191 @@ def init_db():
                         raise e
     logger.info("Database initialized successfully.")
 
+def _create_temp_table(cur):
+    """Create the session-scoped staging table used by COPY."""
+    cur.execute("""
+        CREATE TEMP TABLE tmp_stock_1min_qfq (
+            LIKE stock_1min_qfq INCLUDING DEFAULTS
+        ) ON COMMIT DROP;
+    """)
+
+def _merge_temp_table(cur) -> int:
+    """
+    Merge staged rows into the hypertable, keeping existing (code, time) rows.
+    Returns the number of rows inserted.
+    """
+    columns = ", ".join(table_columns())
+    with telemetry.clock.stage("merge"):
+        cur.execute(f"""
+            INSERT INTO stock_1min_qfq ({columns})
+            SELECT {columns}
+            FROM tmp_stock_1min_qfq
+            ON CONFLICT (code, time) DO NOTHING;
+        """)
+    return cur.rowcount
+
 def bulk_insert(conn, data_io):
     """
     Execute bulk insert using COPY -> Temp Table -> INSERT ON CONFLICT.
+    Returns the number of rows inserted.
     """
     with conn.cursor() as cur:
         # 1. Create Temp Table (Session-scoped)
-        cur.execute("""
-            CREATE TEMP TABLE tmp_stock_1min_qfq (
-                LIKE stock_1min_qfq INCLUDING DEFAULTS
-            ) ON COMMIT DROP;
-        """)
+        _create_temp_table(cur)
         
         # 2. COPY data to Temp Table
-        with cur.copy(
-            """
+        with telemetry.clock.stage("copy"), cur.copy(
+            f"""
             COPY tmp_stock_1min_qfq (
-                time, code, name, open, close, high, low, volume, amount, change_pct, amplitude
+                {", ".join(table_columns())}
             ) FROM STDIN WITH (FORMAT CSV, HEADER FALSE, NULL '')
             """
         ) as copy:
             copy.write(data_io.getvalue())
             
         # 3. Merge from Temp to Target (Explicit columns)
+        return _merge_temp_table(cur)
+
+def to_typed_row(row, number=Decimal):
+    """
+    Convert a cleaned row (strings, see loader.clean_row_data) to the Python
+    types expected by binary COPY. Empty strings become NULL. `number` converts
+    the price/amount/percent fields (float for NUMERIC_STORAGE='double').
+    """
+    time_str, code, name, o, c, h, l, vol, amt, pct, amp = row
+    try:
+        ts = datetime.fromisoformat(time_str)
+    except ValueError:
+        # strptime also accepts non zero-padded fields
+        ts = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+    return [
+        ts,
+        code,
+        name if name != '' else None,
+        number(o), number(c), number(h), number(l),
+        int(vol) if vol != '' else None,
+        number(amt) if amt != '' else None,
+        number(pct) if pct != '' else None,
+        number(amp) if amp != '' else None,
+    ]
+
+def copy_rows(cur, table: str, rows) -> int:
+    """
+    COPY cleaned rows (COPY_COLUMNS order) into `table` using write_row.
+
+    The wire format follows config.COPY_FORMAT:
+    - 'text': strings are sent as-is and parsed by the server (empty -> NULL)
+    - 'binary': rows go through to_typed_row and are sent as typed binary values,
+      so PostgreSQL does not parse NUMERIC/TIMESTAMP text again.
+    With NAME_STORAGE='dimension' the name field is not sent (see table_columns).
+    With NUMERIC_STORAGE='double' binary values are sent as float8.
+
+    psycopg only keeps a small write buffer and flushes it to the server as it
+    fills, so rows are never materialized as one big string in Python.
+    Returns the number of rows copied.
+    """
+    binary = config.COPY_FORMAT == "binary"
+    columns = table_columns()
+    drop_name = len(columns) < len(COPY_COLUMNS)
+    name_idx = COPY_COLUMNS.index("name")
+    stmt = sql.SQL("COPY {} ({}) FROM STDIN{}").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
+        sql.SQL(" WITH (FORMAT BINARY)" if binary else ""),
+    )
+    count = 0
+    with telemetry.clock.stage("copy"), cur.copy(stmt) as copy:
+        if binary:
+            copy.set_types(copy_column_types())
+            number = float if config.NUMERIC_STORAGE == "double" else Decimal
+            for row in rows:
+                values = to_typed_row(row, number)
+                if drop_name:
+                    del values[name_idx]
+                copy.write_row(values)
+                count += 1
+        else:
+            # Text format (write_row does not support CSV)
+            for row in rows:
+                values = [None if v == '' else v for v in row]
+                if drop_name:
+                    del values[name_idx]
+                copy.write_row(values)
+                count += 1
+    return count
+
+def stream_insert(conn, rows) -> int:
+    """
+    Streaming variant of bulk_insert: COPY -> Temp Table -> INSERT ON CONFLICT.
+
+    Rows (cleaned lists in COPY column order) are handed to copy_rows one by
+    one, so the server ingests while the caller is still parsing.
+    Returns the number of rows inserted (rows already present are not counted).
+    """
+    with conn.cursor() as cur:
+        _create_temp_table(cur)
+        copy_rows(cur, "tmp_stock_1min_qfq", rows)
+        return _merge_temp_table(cur)
+
+def direct_insert(conn, rows) -> int:
+    """
+    Bulk initial load: COPY rows straight into stock_1min_qfq, no staging table
+    and no ON CONFLICT. Only valid while the (code, time) unique key is dropped
+    (see drop_unique_key); duplicates are removed afterwards per chunk.
+    Returns the number of rows copied (all of them count as inserted).
+    """
+    with conn.cursor() as cur:
+        return copy_rows(cur, "stock_1min_qfq", rows)
+
+def has_unique_key(conn) -> bool:
+    """True if stock_1min_qfq has a valid (code, time) unique constraint/index."""
+    with conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO stock_1min_qfq (
-                time, code, name, open, close, high, low, volume, amount, change_pct, amplitude
-            )
-            SELECT 
-                time, code, name, open, close, high, low, volume, amount, change_pct, amplitude
-            FROM tmp_stock_1min_qfq
-            ON CONFLICT (code, time) DO NOTHING;
-        """)
\ No newline at end of file
+            SELECT i.indisvalid
+            FROM pg_index i
+            WHERE i.indexrelid = to_regclass(%s)
+              AND i.indrelid = 'stock_1min_qfq'::regclass
+              AND i.indisunique
+        """, (UNIQUE_KEY_NAME,))
+        row = cur.fetchone()
+    return bool(row and row[0])
+
+def has_name_column(conn) -> bool:
+    """True if stock_1min_qfq still stores the name of every bar."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'stock_1min_qfq' AND column_name = 'name'
+        """)
+        return cur.fetchone() is not None
+
+def numeric_storage(conn, table: str = "stock_1min_qfq") -> str:
+    """NUMERIC_STORAGE of an existing bar table: 'double' if its prices are DOUBLE PRECISION."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = %s AND column_name = 'open'
+        """, (table,))
+        row = cur.fetchone()
+    return "double" if row and row[0] == "double precision" else "numeric"
+
+def chunk_interval(conn, table: str = "stock_1min_qfq") -> timedelta:
+    """chunk_time_interval of an existing hypertable (CHUNK_INTERVAL if it does not exist)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT time_interval FROM timescaledb_information.dimensions
+            WHERE hypertable_name = %s AND column_name = 'time'
+        """, (table,))
+        row = cur.fetchone()
+    return row[0] if row and row[0] else CHUNK_INTERVAL
+
+def drop_unique_key(conn):
+    """
+    Drop the (code, time) uniqueness of stock_1min_qfq (constraint or index,
+    including the chunk-level copies) and commit.
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ALTER TABLE stock_1min_qfq DROP CONSTRAINT IF EXISTS {}").format(
+            sql.Identifier(UNIQUE_KEY_NAME)))
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(UNIQUE_KEY_NAME)))
+    conn.commit()
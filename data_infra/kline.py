@@ -0,0 +1,50 @@
+"""
+K-line timeframes: the continuous aggregate behind each bar size.
+
+    daily    stock_daily_kline    (day)     on stock_1min_qfq
+    weekly   stock_weekly_kline   (week)    on stock_daily_kline
+    monthly  stock_monthly_kline  (month)   on stock_daily_kline
+
+Only the daily view reads minute bars; weekly and monthly roll up the daily
+rows (hierarchical continuous aggregates, TimescaleDB >= 2.9), so their
+refreshes and backfills scan ~240x fewer rows. aggregate.py creates and
+refreshes them; readers pick a timeframe here. A stock_monthly_kline created
+before the hierarchy still aggregates stock_1min_qfq until it is rebuilt
+(`python -m data_infra.aggregate --rebuild-monthly`).
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Timeframe:
+    name: str
+    view: str
+    column: str                 # bucket column of the view
+    bucket: str                 # time_bucket width
+    source: Optional[str]       # timeframe the view aggregates (None: stock_1min_qfq)
+
+
+TIMEFRAMES = {
+    "daily": Timeframe("daily", "stock_daily_kline", "day", "1 day", None),
+    "weekly": Timeframe("weekly", "stock_weekly_kline", "week", "1 week", "daily"),
+    "monthly": Timeframe("monthly", "stock_monthly_kline", "month", "1 month", "daily"),
+}
+
+DEFAULT_TIMEFRAME = "monthly"
+
+
+def timeframe(name: str = None) -> Timeframe:
+    """Timeframe by name (default: monthly). Raises ValueError for unknown names."""
+    name = name or DEFAULT_TIMEFRAME
+    if name not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe '{name}' (choose from {', '.join(TIMEFRAMES)})")
+    return TIMEFRAMES[name]
+
+
+def drop_views(cur):
+    """Drop the K-line views that exist, dependents first (before replacing stock_1min_qfq)."""
+    for tf in sorted(TIMEFRAMES.values(), key=lambda tf: tf.source is None):
+        cur.execute(f"SELECT to_regclass('public.{tf.view}')")
+        if cur.fetchone()[0] is not None:
+            cur.execute(f"DROP MATERIALIZED VIEW {tf.view};")
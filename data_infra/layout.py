@@ -0,0 +1,434 @@
+"""
+Storage layout benchmark for stock_1min_qfq and the online migration to a
+chosen layout.
+
+A layout is the chunk_time_interval, compress_segmentby, compress_orderby and
+extra indexes of the minute hypertable; today's is 7 days / 'code' /
+'time DESC' / none. --benchmark copies one sample into a scratch hypertable
+per layout (layout_bench_<label>), compresses it and replays the project's
+workloads on it:
+
+    refresh   daily aggregation of the sample (aggregate.select_sql) and the
+              monthly rollup on it: the work of refreshing the K-line views
+    scan      single-code range scans of minute bars, one month of a random
+              sample code each (the rows behind one code's chart in plot_kline)
+    screen    the flatbottom screening SQL on that monthly aggregate. It reads
+              the aggregate, not the minute bars, so its latency should stay
+              flat; its candidate count must be equal across layouts.
+
+and reports rows, chunks, load time, size before and after compression,
+compression time, refresh time, scan p50/p95 and screening time. The sample
+is [--start, --end) of stock_1min_qfq (optionally --codes random codes) or,
+with --synthetic, bars generated by synth.py. Scratch tables are dropped at
+the end unless --keep.
+
+    python -m data_infra.layout --benchmark --start 2023-01 --end 2023-07 --codes 300
+    python -m data_infra.layout --benchmark --synthetic --stocks 200 --days 120 \\
+        --layout current --layout chunk-30d --layout 'seg-asc:chunk=30;orderby=time'
+    python -m data_infra.layout --migrate chunk-30d [--apply]
+
+Layout specs are presets (PRESETS) or 'label:chunk=30;segmentby=code;
+orderby=time DESC;index=code,time DESC' (keys optional, index repeatable).
+
+--migrate prints the steps from the current layout to the given one and runs
+them with --apply, without copying the table:
+
+- chunk interval: set_chunk_time_interval, so only new chunks get it
+  (existing chunks keep 7 days; re-chunking history needs a copy and swap
+  as in compact.py);
+- extra indexes: built chunk by chunk (timescaledb.transaction_per_chunk);
+- segmentby/orderby: the compression settings are changed, then every
+  compressed chunk is decompressed and recompressed one at a time, so only
+  that chunk is locked. Needs TimescaleDB >= 2.14 (per-chunk compression
+  settings). Progress is kept in layout_migration; a rerun resumes.
+"""
+import argparse
+import logging
+import random
+import re
+import statistics
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from . import config
+from . import db
+from . import kline
+from . import loader
+from . import synth
+
+logger = logging.getLogger(__name__)
+
+BENCH_PREFIX = "layout_bench_"
+SAMPLE_TABLE = "layout_sample"
+PER_CHUNK_SETTINGS_VERSION = (2, 14)
+
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS layout_migration (
+        chunk_name TEXT PRIMARY KEY,    -- compressed chunk recompressed with the new settings
+        segmentby TEXT NOT NULL,
+        orderby TEXT NOT NULL,
+        migrated_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+
+@dataclass(frozen=True)
+class Layout:
+    label: str
+    chunk_days: int = None          # None: the table's interval (db.CHUNK_INTERVAL, synced at startup)
+    segmentby: str = "code"
+    orderby: str = "time DESC"
+    indexes: tuple = ()             # extra index column lists, e.g. ("code, time DESC",)
+
+    def spec(self) -> str:
+        items = [f"chunk={self.chunk_days or db.CHUNK_INTERVAL.days}",
+                 f"segmentby={self.segmentby}", f"orderby={self.orderby}"]
+        return ";".join(items + [f"index={i}" for i in self.indexes])
+
+
+PRESETS = {
+    "current": Layout("current"),
+    "chunk-30d": Layout("chunk-30d", chunk_days=30),
+    "chunk-90d": Layout("chunk-90d", chunk_days=90),
+    "time-asc": Layout("time-asc", orderby="time"),
+}
+
+DEFAULT_LAYOUTS = ("current", "chunk-30d", "chunk-90d", "time-asc")
+
+
+def parse_layout(text: str) -> Layout:
+    """A preset name or 'label:chunk=N;segmentby=...;orderby=...;index=...' (keys optional)."""
+    if text in PRESETS:
+        return PRESETS[text]
+    label, sep, items = text.partition(":")
+    if not sep or not re.fullmatch(r"[a-z0-9_-]+", label):
+        raise ValueError(f"Unknown layout '{text}' (presets: {', '.join(PRESETS)}; or 'label:key=value;...')")
+    fields = {"indexes": []}
+    for item in filter(None, (i.strip() for i in items.split(";"))):
+        key, sep, value = item.partition("=")
+        key, value = key.strip(), value.strip()
+        if not sep or not value:
+            raise ValueError(f"Bad item '{item}' in layout '{text}' (expected key=value)")
+        if key == "chunk":
+            fields["chunk_days"] = int(value)
+        elif key in ("segmentby", "orderby"):
+            fields[key] = value
+        elif key == "index":
+            fields["indexes"].append(value)
+        else:
+            raise ValueError(f"Unknown key '{key}' in layout '{text}' (chunk, segmentby, orderby, index)")
+    fields["indexes"] = tuple(fields["indexes"])
+    return Layout(label, **fields)
+
+
+def _index_name(table: str, columns: str) -> str:
+    return f"{table}_{'_'.join(re.findall(r'[a-z0-9]+', columns.lower()))}_idx"
+
+
+def _index_ddl(table: str, columns: str) -> str:
+    return (f"CREATE INDEX IF NOT EXISTS {_index_name(table, columns)} ON {table} ({columns}) "
+            f"WITH (timescaledb.transaction_per_chunk)")
+
+
+def _bench_table(layout: Layout) -> str:
+    return BENCH_PREFIX + layout.label.replace("-", "_")
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def fill_sample(conn, start, end, codes: int = None, seed: int = 42) -> int:
+    """Copy [start, end) of stock_1min_qfq into SAMPLE_TABLE, optionally `codes` random codes. Returns rows."""
+    columns = ", ".join(db.table_columns())
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}")
+        cur.execute(f"CREATE TABLE {SAMPLE_TABLE} AS SELECT {columns} FROM stock_1min_qfq WITH NO DATA")
+        where, params = "time >= %s AND time < %s", [start, end]
+        if codes:
+            monthly = kline.TIMEFRAMES["monthly"]
+            cur.execute(f"SELECT DISTINCT code FROM {monthly.view} WHERE {monthly.column} >= %s "
+                        f"AND {monthly.column} < %s ORDER BY code", (start, end))
+            available = [r[0] for r in cur.fetchall()]
+            where += " AND code = ANY(%s)"
+            params.append(sorted(random.Random(seed).sample(available, min(codes, len(available)))))
+        cur.execute(f"INSERT INTO {SAMPLE_TABLE} SELECT {columns} FROM stock_1min_qfq WHERE {where}", params)
+        return cur.rowcount
+
+
+def fill_synthetic(conn, years, stocks: int, days: int, seed: int = 42) -> int:
+    """Write synthetic bars (synth.py) into SAMPLE_TABLE. Returns rows."""
+    columns = ", ".join(db.table_columns())
+    rows = 0
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}")
+        cur.execute(f"CREATE TABLE {SAMPLE_TABLE} AS SELECT {columns} FROM stock_1min_qfq WITH NO DATA")
+        for year in years:
+            rows += db.copy_rows(cur, SAMPLE_TABLE, (loader.clean_row_data(r)
+                                                     for r in synth.iter_rows(year, stocks, days, seed=seed)))
+    return rows
+
+
+def _timed(cur, query, params=None) -> float:
+    t0 = time.perf_counter()
+    cur.execute(query, params)
+    return time.perf_counter() - t0
+
+
+def _scan_targets(cur, table: str, scans: int, seed: int):
+    """`scans` (code, month start, month end) picked at random from the sample."""
+    cur.execute(f"SELECT DISTINCT code, date_trunc('month', time) FROM {table}")
+    pairs = sorted(cur.fetchall())
+    picked = random.Random(seed).sample(pairs, min(scans, len(pairs)))
+    return [(code, month, (month + timedelta(days=32)).replace(day=1)) for code, month in picked]
+
+
+def bench_layout(conn, layout: Layout, numeric_storage: str, screen_sql: str, targets) -> dict:
+    """Build the scratch table of `layout` from SAMPLE_TABLE and replay the workloads (autocommit connection)."""
+    table = _bench_table(layout)
+    columns = ", ".join(db.table_columns())
+    result = {"layout": layout.label, "spec": layout.spec()}
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+        for stmt in db.table_ddl(table, numeric_storage, layout.chunk_days, layout.segmentby, layout.orderby):
+            cur.execute(stmt)
+        for columns_of_index in layout.indexes:
+            cur.execute(_index_ddl(table, columns_of_index))
+
+        result["load_s"] = _timed(cur, f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {SAMPLE_TABLE}")
+        result["rows"] = cur.rowcount
+        cur.execute("SELECT count(*), hypertable_size(%s::regclass) FROM show_chunks(%s::regclass)", (table, table))
+        result["chunks"], result["raw_bytes"] = cur.fetchone()
+        result["compress_s"] = _timed(cur, "SELECT count(compress_chunk(c, if_not_compressed => TRUE)) "
+                                           "FROM show_chunks(%s::regclass) c", (table,))
+        cur.execute("SELECT hypertable_size(%s::regclass)", (table,))
+        result["compressed_bytes"] = cur.fetchone()[0]
+
+        # refresh: daily bars from the minute table, monthly rollup on them (shadows the real view via pg_temp)
+        # Imported here: aggregate configures logging when imported
+        from . import aggregate
+        cur.execute("DROP TABLE IF EXISTS pg_temp.layout_daily, pg_temp.stock_monthly_kline")
+        daily_s = _timed(cur, f"CREATE TEMP TABLE layout_daily AS {aggregate.select_sql('daily', table)}")
+        monthly_s = _timed(cur, f"CREATE TEMP TABLE stock_monthly_kline AS "
+                                f"{aggregate.select_sql('monthly', 'layout_daily')}")
+        cur.execute("CREATE INDEX ON stock_monthly_kline (code, month DESC)")
+        result["refresh_s"] = daily_s + monthly_s
+
+        latencies = []
+        for code, start, end in targets:
+            latencies.append(_timed(cur, f"SELECT time, open, high, low, close, volume FROM {table} "
+                                         f"WHERE code = %s AND time >= %s AND time < %s ORDER BY time",
+                                    (code, start, end)))
+            cur.fetchall()
+        result["scan_p50_ms"] = statistics.median(latencies) * 1000 if latencies else 0.0
+        result["scan_p95_ms"] = (statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1
+                                 else sum(latencies)) * 1000
+
+        result["screen_s"] = _timed(cur, screen_sql)
+        result["candidates"] = len(cur.fetchall())
+        cur.execute("DROP TABLE pg_temp.layout_daily, pg_temp.stock_monthly_kline")
+    return result
+
+
+def benchmark(layouts, start=None, end=None, codes: int = None, synthetic: dict = None,
+              scans: int = 50, keep: bool = False, seed: int = 42) -> list:
+    """
+    Fill the sample (stock_1min_qfq [start, end), or synth.py bars with
+    synthetic={'years', 'stocks', 'days'}) and benchmark every layout on it.
+    Returns one result dict per layout (see bench_layout).
+    """
+    # Imported here: the screening query lives in the flatbottom pipeline
+    from flatbottom_pipeline.selection.find_flatbottom import FlatbottomScreener
+    screener = FlatbottomScreener()
+
+    results = []
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        numeric_storage = db.numeric_storage(conn)
+        screener.detect_security_master(conn, require_names=False)
+        screen_sql = screener._build_sql_query()
+        if synthetic:
+            rows = fill_synthetic(conn, synthetic["years"], synthetic["stocks"], synthetic["days"], seed)
+        else:
+            rows = fill_sample(conn, start, end, codes, seed)
+        logger.info(f"Sample: {rows} rows in {SAMPLE_TABLE}.")
+        with conn.cursor() as cur:
+            targets = _scan_targets(cur, SAMPLE_TABLE, scans, seed)
+        try:
+            for layout in layouts:
+                logger.info(f"[{layout.label}] {layout.spec()}")
+                results.append(bench_layout(conn, layout, numeric_storage, screen_sql, targets))
+        finally:
+            if not keep:
+                with conn.cursor() as cur:
+                    for table in [_bench_table(layout) for layout in layouts] + [SAMPLE_TABLE]:
+                        cur.execute(f"DROP TABLE IF EXISTS {table}")
+
+    if len({r["candidates"] for r in results}) > 1:
+        logger.error("Screening candidates differ between layouts: "
+                     + ", ".join(f"{r['layout']}={r['candidates']}" for r in results))
+    return results
+
+
+def format_benchmark(results) -> str:
+    lines = [f"{'layout':<16}{'rows':>12}{'chunks':>8}{'load s':>9}{'raw MB':>10}{'compr MB':>10}{'ratio':>7}"
+             f"{'compr s':>9}{'refresh s':>11}{'scan p50 ms':>13}{'scan p95 ms':>13}{'screen s':>10}{'cand.':>7}"]
+    for r in results:
+        ratio = r["raw_bytes"] / r["compressed_bytes"] if r["compressed_bytes"] else 0.0
+        lines.append(f"{r['layout']:<16}{r['rows']:>12}{r['chunks']:>8}{r['load_s']:>9.2f}"
+                     f"{r['raw_bytes'] / 1e6:>10.1f}{r['compressed_bytes'] / 1e6:>10.1f}{ratio:>7.1f}"
+                     f"{r['compress_s']:>9.2f}{r['refresh_s']:>11.2f}{r['scan_p50_ms']:>13.1f}"
+                     f"{r['scan_p95_ms']:>13.1f}{r['screen_s']:>10.2f}{r['candidates']:>7}")
+    for r in results:
+        lines.append(f"  {r['layout']}: {r['spec']}")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Migration
+# ---------------------------------------------------------------------------
+
+def current_layout(cur) -> Layout:
+    """The layout of stock_1min_qfq (indexes other than the defaults are not reported)."""
+    cur.execute("""
+        SELECT time_interval FROM timescaledb_information.dimensions
+        WHERE hypertable_name = 'stock_1min_qfq' AND column_name = 'time'
+    """)
+    chunk_days = cur.fetchone()[0].days
+    cur.execute("""
+        SELECT attname, segmentby_column_index, orderby_column_index, orderby_asc
+        FROM timescaledb_information.compression_settings
+        WHERE hypertable_name = 'stock_1min_qfq'
+    """)
+    rows = cur.fetchall()
+    segmentby = ", ".join(a for a, s, _, _ in sorted(rows, key=lambda r: r[1] or 0) if s is not None)
+    orderby = ", ".join(a if asc else f"{a} DESC"
+                        for a, _, o, asc in sorted(rows, key=lambda r: r[2] or 0) if o is not None)
+    return Layout("current", chunk_days, segmentby, orderby)
+
+
+def _timescaledb_version(cur):
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'timescaledb'")
+    row = cur.fetchone()
+    return tuple(int(p) for p in row[0].split("-")[0].split(".")[:2]) if row else (0, 0)
+
+
+def _normalize(columns: str) -> str:
+    return ", ".join(" ".join(c.lower().split()).replace(" asc", "") for c in columns.split(","))
+
+
+def migration_plan(current: Layout, target: Layout) -> list:
+    """[(description, SQL)] from `current` to `target`; recompression is a separate step (recompress_all)."""
+    steps = []
+    if target.chunk_days and target.chunk_days != current.chunk_days:
+        steps.append((f"chunk interval {current.chunk_days} -> {target.chunk_days} days (new chunks only)",
+                      f"SELECT set_chunk_time_interval('stock_1min_qfq', INTERVAL '{target.chunk_days} days')"))
+    for columns in target.indexes:
+        steps.append((f"index ({columns}), one chunk per transaction", _index_ddl("stock_1min_qfq", columns)))
+    if _normalize(target.segmentby) != _normalize(current.segmentby) \
+            or _normalize(target.orderby) != _normalize(current.orderby):
+        steps.append((f"compression segmentby '{current.segmentby}' -> '{target.segmentby}', "
+                      f"orderby '{current.orderby}' -> '{target.orderby}'",
+                      f"ALTER TABLE stock_1min_qfq SET (timescaledb.compress_segmentby = '{target.segmentby}', "
+                      f"timescaledb.compress_orderby = '{target.orderby}')"))
+    return steps
+
+
+def recompress_all(conn, target: Layout) -> int:
+    """
+    Decompress and recompress every compressed chunk of stock_1min_qfq not yet
+    migrated to target's settings, one chunk at a time (autocommit connection).
+    Returns the number of chunks recompressed.
+    """
+    conn.execute(PROGRESS_DDL)
+    conn.execute("SET lock_timeout = '60s';")
+    chunks = [r[0] for r in conn.execute("""
+        SELECT format('%%I.%%I', c.chunk_schema, c.chunk_name)
+        FROM timescaledb_information.chunks c
+        LEFT JOIN layout_migration m ON m.chunk_name = format('%%I.%%I', c.chunk_schema, c.chunk_name)
+            AND m.segmentby = %s AND m.orderby = %s
+        WHERE c.hypertable_name = 'stock_1min_qfq' AND c.is_compressed AND m.chunk_name IS NULL
+        ORDER BY c.range_start
+    """, (target.segmentby, target.orderby)).fetchall()]
+    for i, chunk in enumerate(chunks, start=1):
+        t0 = time.perf_counter()
+        conn.execute("SELECT decompress_chunk(%s::regclass, if_compressed => TRUE)", (chunk,))
+        conn.execute("SELECT compress_chunk(%s::regclass, if_not_compressed => TRUE)", (chunk,))
+        conn.execute("""
+            INSERT INTO layout_migration (chunk_name, segmentby, orderby) VALUES (%s, %s, %s)
+            ON CONFLICT (chunk_name) DO UPDATE
+                SET segmentby = EXCLUDED.segmentby, orderby = EXCLUDED.orderby, migrated_at = NOW()
+        """, (chunk, target.segmentby, target.orderby))
+        logger.info(f"[{i}/{len(chunks)}] Recompressed {chunk} in {time.perf_counter() - t0:.1f}s.")
+    return len(chunks)
+
+
+def migrate(target: Layout, apply: bool = False) -> list:
+    """Log the migration plan to `target` and run it with apply=True (see module docstring). Returns the plan."""
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            current = current_layout(cur)
+            version = _timescaledb_version(cur)
+        steps = migration_plan(current, target)
+        recompress = any(s.startswith("ALTER TABLE") for _, s in steps)
+        if recompress and version < PER_CHUNK_SETTINGS_VERSION:
+            raise RuntimeError("Changing segmentby/orderby with compressed chunks needs TimescaleDB >= 2.14; "
+                               "build the new layout in a copy and swap it in (see compact.py).")
+        if not steps:
+            logger.info(f"stock_1min_qfq already has the layout {target.spec()}.")
+        for description, statement in steps:
+            logger.info(f"{'Running' if apply else 'Plan'}: {description}\n    {statement};")
+            if apply:
+                conn.execute(statement)
+        if recompress:
+            logger.info(f"{'Running' if apply else 'Plan'}: recompress every compressed chunk, one at a time")
+            if apply:
+                recompress_all(conn, target)
+    if steps and not apply:
+        logger.info("Dry run: rerun with --apply to migrate.")
+    return steps
+
+
+def _month_start(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark storage layouts of stock_1min_qfq and migrate to one.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--benchmark", action="store_true", help="Compare layouts on a sample.")
+    group.add_argument("--migrate", metavar="LAYOUT", help="Migrate stock_1min_qfq to a layout (dry run).")
+    parser.add_argument("--apply", action="store_true", help="With --migrate: run the steps.")
+    parser.add_argument("--layout", action="append", dest="layouts",
+                        help=f"Preset or 'label:key=value;...' (repeatable; default: {', '.join(DEFAULT_LAYOUTS)}).")
+    parser.add_argument("--start", type=_month_start, default=datetime(date.today().year - 1, 1, 1),
+                        help="First month of the sample (YYYY-MM).")
+    parser.add_argument("--end", type=_month_start, default=datetime(date.today().year - 1, 7, 1),
+                        help="Month after the sample (YYYY-MM).")
+    parser.add_argument("--codes", type=int, help="Sample this many random codes (default: all).")
+    parser.add_argument("--synthetic", action="store_true", help="Sample synthetic bars instead (synth.py).")
+    parser.add_argument("--years", type=int, nargs="+", default=[2001], help="With --synthetic: years.")
+    parser.add_argument("--stocks", type=int, default=100, help="With --synthetic: stocks.")
+    parser.add_argument("--days", type=int, default=60, help="With --synthetic: trading days per year.")
+    parser.add_argument("--scans", type=int, default=50, help="Single-code range scans per layout.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch tables.")
+    args = parser.parse_args()
+
+    try:
+        layouts = [parse_layout(text) for text in (args.layouts or DEFAULT_LAYOUTS)]
+        target = parse_layout(args.migrate) if args.migrate else None
+    except ValueError as e:
+        parser.error(str(e))
+    with db.get_db_connection() as conn:
+        config.NAME_STORAGE = "column" if db.has_name_column(conn) else "dimension"
+        config.NUMERIC_STORAGE = db.numeric_storage(conn)
+        db.CHUNK_INTERVAL = db.chunk_interval(conn)
+    if target:
+        migrate(target, args.apply)
+    else:
+        synthetic = {"years": args.years, "stocks": args.stocks, "days": args.days} if args.synthetic else None
+        print(format_benchmark(benchmark(layouts, args.start, args.end, args.codes, synthetic,
+                                         args.scans, args.keep)))
@@ -1,16 +1,29 @@
 import os
 import zipfile
+import hashlib
 import csv
 import io
 import logging
 import traceback
 import re
 import math
+import itertools
+import operator
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime
 
 from . import config
 from . import db
+from . import names
+from . import security_master
+from . import staging
+from . import telemetry
 from . import utils
+from . import validation
 
 logger = logging.getLogger(__name__)
 
@@ -161,122 +174,703 @@ def clean_row_data(row):
         row[IDX_AMP]
     ]
 
-def process_zip_file(zip_path: str):
+# Validation rule of a clean_row_data error, by message prefix (first match wins)
+REJECT_RULES = [
+    ("column_count", "Incorrect column count"),
+    ("time_missing", "Missing Time"),
+    ("time_format", "Invalid Time format"),
+    ("code_missing", "Missing Code"),
+    ("code", "Unknown stock code format"),
+    ("price_missing", "Missing "),
+    ("high_low", "Logic Error: High"),
+    ("volume", "Invalid Volume"),
+    ("price_invalid", "Invalid Open"),
+    ("price_invalid", "Invalid Close"),
+    ("price_invalid", "Invalid High"),
+    ("price_invalid", "Invalid Low"),
+    ("amount", "Invalid Amount"),
+    ("amount", "Amount"),
+    ("change_pct", "Invalid ChangePct"),
+    ("change_pct", "ChangePct"),
+    ("amplitude", "Invalid Amplitude"),
+    ("amplitude", "Amplitude"),
+]
+
+
+def sortable_time(t: str) -> str:
+    """
+    A cleaned row's time as 'YYYY-MM-DD HH:MM:SS': clean_row_data accepts non
+    zero-padded times ('9:31:00'), which would not compare in time order.
+    """
+    if len(t) == 19:
+        return t
+    return datetime.strptime(t, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+
+
+def reject_rule(err: Exception) -> str:
+    """Name of the validation rule that rejected a row (see REJECT_RULES), 'other' if unknown."""
+    message = str(err)
+    for rule, prefix in REJECT_RULES:
+        if message.startswith(prefix):
+            return rule
+    return "other"
+
+
+class HeaderMismatchError(ValueError):
+    """Raised when a CSV member's header does not match EXPECTED_HEADER_KEYWORDS."""
+
+
+@dataclass
+class ParseStats:
+    """Row counters shared between the row generator and process_zip_file."""
+    total_rows: int = 0
+    skipped_count: int = 0
+    decompressed: staging.ReadStats = field(default_factory=staging.ReadStats)  # CSV bytes inflated
+    rejects: Counter = field(default_factory=Counter)  # reject_rule() -> skipped rows
+
+
+_TIME_OF, _CODE_OF, _NAME_OF = (operator.itemgetter(i) for i in (IDX_TIME, IDX_CODE, IDX_NAME))
+
+
+@dataclass
+class Provenance:
+    """
+    What one load wrote, stored with its checkpoint row (db.PROVENANCE_COLUMNS)
+    so progress and coverage reports never have to scan stock_1min_qfq.
+
+    observe() keeps the summary of each block pending until commit(): rows
+    of a batch that was rolled back never reach the counters, stock_name or
+    security_master (record_security).
+    """
+    rows_copied: int = 0
+    rows_inserted: int = 0
+    min_time: str = None
+    max_time: str = None
+    codes: set = field(default_factory=set)
+    elapsed: float = 0.0
+    name_runs: names.NameRuns = field(default_factory=names.NameRuns)
+    coverage: security_master.BarCoverage = field(default_factory=security_master.BarCoverage)
+    _pending: list = field(default_factory=list, repr=False)    # observed blocks not committed yet
+    _inserted: list = field(default_factory=list, repr=False)   # inserted counts of those batches
+
+    def observe(self, rows):
+        """
+        Pass cleaned rows through, summarizing them BATCH_SIZE at a time
+        (observe_block), so each block is one loader batch. The summaries
+        are recorded by commit().
+        """
+        while True:
+            block = list(itertools.islice(rows, config.BATCH_SIZE))
+            if not block:
+                return
+            summary = Provenance()
+            summary.observe_block(block)
+            self._pending.append(summary)
+            yield from block
+
+    def batch_inserted(self, inserted: int):
+        """The next observed batch was inserted with `inserted` new rows (not committed yet)."""
+        self._inserted.append(inserted)
+
+    def commit(self, batches: int = None):
+        """Record the first `batches` observed blocks (all by default) and their inserted counts."""
+        batches = len(self._pending) if batches is None else batches
+        for summary in self._pending[:batches]:
+            self._merge(summary)
+        self.rows_inserted += sum(self._inserted[:batches])
+        del self._pending[:batches], self._inserted[:batches]
+
+    def commit_inserted(self):
+        """Record the batches inserted so far: a batch is committed before the next one is inserted."""
+        self.commit(len(self._inserted))
+
+    def _merge(self, other: "Provenance"):
+        self.rows_copied += other.rows_copied
+        if other.min_time is not None and (self.min_time is None or other.min_time < self.min_time):
+            self.min_time = other.min_time
+        if other.max_time is not None and (self.max_time is None or other.max_time > self.max_time):
+            self.max_time = other.max_time
+        self.codes |= other.codes
+        for code, name, first, last in other.name_runs.runs():
+            self.name_runs.add_run(code, name, first, last)
+        for code, (first, last, _) in other.coverage.spans.items():
+            self.coverage.add_span(code, first, last, ())
+        self.coverage.months |= other.coverage.months
+
+    def observe_block(self, block):
+        """
+        Record a list of cleaned rows. A member holds one code and each name
+        runs over many bars, so the per-code and per-name work is done once per
+        run of equal values (itertools.groupby), the rest on whole columns.
+        """
+        times = list(map(_TIME_OF, block))
+        if set(map(len, times)) != {19}:
+            times = list(map(sortable_time, times))
+        self.rows_copied += len(block)
+
+        start = 0
+        for code, group in itertools.groupby(map(_CODE_OF, block)):
+            end = start + len(list(group))
+            run_times = times[start:end]
+            first, last = min(run_times), max(run_times)
+            if self.min_time is None or first < self.min_time:
+                self.min_time = first
+            if self.max_time is None or last > self.max_time:
+                self.max_time = last
+            self.codes.add(code)
+            self.coverage.add_span(code, first, last, {t[:7] for t in run_times})
+
+            at = start
+            for name, same in itertools.groupby(map(_NAME_OF, block[start:end])):
+                upto = at + len(list(same))
+                if at == start and upto == end:
+                    self.name_runs.add_run(code, name, first, last)
+                else:
+                    self.name_runs.add_run(code, name, min(times[at:upto]), max(times[at:upto]))
+                at = upto
+            start = end
+
+    def columns(self, total_rows: int):
+        """Values of db.PROVENANCE_COLUMNS."""
+        return (total_rows, self.rows_inserted, max(self.rows_copied - self.rows_inserted, 0),
+                self.min_time, self.max_time, len(self.codes), round(self.elapsed, 3))
+
+
+def check_header(header):
+    """
+    Validate a CSV header row against EXPECTED_HEADER_KEYWORDS.
+    Raises: ValueError on mismatch
+    """
+    for idx, keyword in EXPECTED_HEADER_KEYWORDS.items():
+        if len(header) <= idx or keyword not in header[idx]:
+            raise ValueError(f"Header mismatch at col {idx}: expected '{keyword}', got '{header[idx] if len(header)>idx else 'N/A'}'")
+
+
+def list_csv_members(z: zipfile.ZipFile):
+    """CSV member names of an open archive, in archive order."""
+    return [f for f in z.namelist() if f.endswith('.csv')]
+
+
+def iter_clean_rows(z: zipfile.ZipFile, zip_filename: str, stats: ParseStats, members=None):
+    """
+    Lazily parse and clean the CSV members of an open zip archive
+    (all of them, or only `members`).
+
+    Yields cleaned rows (see clean_row_data) and updates `stats` in place.
+    Bad rows are counted and skipped; a header mismatch aborts the archive
+    by raising HeaderMismatchError.
+    """
+    csv_files = list_csv_members(z) if members is None else members
+
+    for csv_file in csv_files:
+        with z.open(csv_file, 'r') as f:
+            text_io = io.TextIOWrapper(staging.TimedFile(f, stats.decompressed), encoding='utf-8-sig', newline='')
+            reader = csv.reader(text_io)
+
+            try:
+                check_header(next(reader))
+            except StopIteration:
+                continue
+            except ValueError as ve:
+                logger.error(f"[{zip_filename}] {csv_file} Header Error: {ve}")
+                raise HeaderMismatchError(f"Header mismatch in {csv_file}: {ve}") from ve
+
+            if config.VALIDATION_ENGINE == "vectorized":
+                yield from _iter_clean_blocks(reader, zip_filename, csv_file, stats)
+                continue
+
+            timed = telemetry.enabled()
+            for row_num, row in enumerate(reader, start=2):
+                stats.total_rows += 1
+                t0 = time.perf_counter() if timed else 0.0
+                try:
+                    clean_row = clean_row_data(row)
+                except (ValueError, IndexError) as e:
+                    _record_skip(stats, zip_filename, csv_file, row_num, e)
+                    continue
+                finally:
+                    if timed:
+                        telemetry.clock.add("validate", time.perf_counter() - t0)
+                yield clean_row
+
+
+def _record_skip(stats: ParseStats, zip_filename: str, csv_file: str, row_num: int, err: Exception):
+    """Count a rejected row; only the first 10 per archive are logged."""
+    stats.skipped_count += 1
+    stats.rejects[reject_rule(err)] += 1
+    if stats.skipped_count <= 10:
+        logger.warning(f"[{zip_filename}] Skipped bad row {csv_file}:{row_num}: {err}")
+
+
+def _iter_clean_blocks(reader, zip_filename: str, csv_file: str, stats: ParseStats):
+    """Vectorized engine: validate VALIDATION_BLOCK_SIZE rows at a time via validation.clean_block."""
+    row_num = 2
+    while True:
+        block = list(itertools.islice(reader, config.VALIDATION_BLOCK_SIZE))
+        if not block:
+            break
+        stats.total_rows += len(block)
+        t0 = time.perf_counter()
+        results = validation.clean_block(block)
+        telemetry.clock.add("validate", time.perf_counter() - t0)
+        for offset, result in enumerate(results):
+            if isinstance(result, Exception):
+                _record_skip(stats, zip_filename, csv_file, row_num + offset, result)
+            else:
+                yield result
+        row_num += len(block)
+
+
+def _load_buffered(conn, rows, insert=None):
+    """Legacy path: format each batch into a CSV StringIO, then COPY it in one go."""
+    insert = insert or db.bulk_insert
+    drop_name = config.NAME_STORAGE == "dimension"
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer)
+    buffer_count = 0
+
+    for clean_row in rows:
+        csv_writer.writerow(clean_row[:IDX_NAME] + clean_row[IDX_NAME + 1:] if drop_name else clean_row)
+        buffer_count += 1
+
+        if buffer_count >= config.BATCH_SIZE:
+            insert(conn, buffer)
+            conn.commit()
+            buffer.close()
+            buffer = io.StringIO()
+            csv_writer = csv.writer(buffer)
+            buffer_count = 0
+
+    if buffer_count > 0:
+        insert(conn, buffer)
+        conn.commit()
+
+
+def _load_streaming(conn, rows, insert=None):
+    """Streaming path: feed rows into COPY as they are parsed, commit every BATCH_SIZE rows."""
+    insert = insert or db.stream_insert
+    while True:
+        batch = itertools.islice(rows, config.BATCH_SIZE)
+        first = next(batch, None)
+        if first is None:
+            break
+        insert(conn, itertools.chain([first], batch))
+        conn.commit()
+
+
+@dataclass
+class StageTimings:
+    """Wall-clock seconds spent per stage in 'pipeline' mode."""
+    parse: float = 0.0          # producer: decompress + parse + validate
+    producer_wait: float = 0.0  # producer blocked on a full queue (COPY side is slower)
+    copy: float = 0.0           # consumer: COPY + merge + commit
+    consumer_wait: float = 0.0  # consumer blocked on an empty queue (parse side is slower)
+    batches: int = 0
+
+    def summary(self) -> str:
+        bottleneck = "db" if self.producer_wait > self.consumer_wait else "parse"
+        return (f"parse {self.parse:.2f}s, copy+commit {self.copy:.2f}s, "
+                f"parser blocked {self.producer_wait:.2f}s, copier idle {self.consumer_wait:.2f}s, "
+                f"{self.batches} batches, bottleneck: {bottleneck}")
+
+
+_END_OF_ROWS = object()
+
+
+def _load_pipelined(conn, rows, zip_filename: str, insert=None) -> StageTimings:
+    """
+    Pipeline path: a parser thread pulls BATCH_SIZE cleaned rows at a time
+    into a bounded queue; the calling thread streams each batch into COPY and
+    commits. Parsing therefore overlaps with the database work of the
+    previous batch, and a full queue throttles the parser.
+
+    Errors from either side stop both and are re-raised here.
+    """
+    insert = insert or db.stream_insert
+    timings = StageTimings()
+    batches = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    producer_error = []
+
+    def put(item):
+        # Give up when the consumer has stopped, otherwise a full queue would block forever
+        t0 = time.perf_counter()
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        timings.producer_wait += time.perf_counter() - t0
+
+    def produce():
+        try:
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                batch = list(itertools.islice(rows, config.BATCH_SIZE))
+                timings.parse += time.perf_counter() - t0
+                if not batch:
+                    break
+                put(batch)
+        except BaseException as e:
+            producer_error.append(e)
+        finally:
+            put(_END_OF_ROWS)
+
+    parser = threading.Thread(target=produce, name=f"parse-{zip_filename}", daemon=True)
+    parser.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            batch = batches.get()
+            timings.consumer_wait += time.perf_counter() - t0
+            if batch is _END_OF_ROWS:
+                break
+
+            t0 = time.perf_counter()
+            insert(conn, batch)
+            conn.commit()
+            timings.copy += time.perf_counter() - t0
+            timings.batches += 1
+    finally:
+        stop.set()
+        parser.join()
+
+    if producer_error:
+        raise producer_error[0]
+    return timings
+
+
+def _load_rows(conn, rows, zip_filename: str, direct: bool = False, provenance: Provenance = None):
+    """
+    Send cleaned rows to the database using the configured INGEST_MODE.
+
+    direct=True (bulk initial load) COPYs straight into stock_1min_qfq instead
+    of merging through the staging table; it always streams.
+
+    With a Provenance, the rows and the inserted counts of every committed
+    batch are recorded in it; a batch that was rolled back is not.
+    """
+    insert = db.direct_insert if direct else db.stream_insert
+    buffered_insert = db.bulk_insert
+    if telemetry.enabled():
+        rows = telemetry.clock.timed_rows(rows)
+    if provenance is not None:
+        rows = provenance.observe(rows)
+        insert = _counting(insert, provenance)
+        buffered_insert = _counting(buffered_insert, provenance)
+
+    if config.INGEST_MODE == "pipeline":
+        timings = _load_pipelined(conn, rows, zip_filename, insert)
+        logger.info(f"[{zip_filename}] Pipeline stages: {timings.summary()}")
+    elif config.INGEST_MODE == "stream" or config.COPY_FORMAT == "binary" or direct:
+        _load_streaming(conn, rows, insert)
+    else:
+        _load_buffered(conn, rows, buffered_insert)
+    if provenance is not None:
+        provenance.commit()
+
+
+def _counting(insert, provenance: Provenance):
+    """
+    Wrap an insert function so each batch's inserted count goes to provenance.
+    Every mode commits a batch before inserting the next one, so the batches
+    inserted before this call are committed and recorded here.
+    """
+    def counted(conn, rows):
+        provenance.commit_inserted()
+        inserted = insert(conn, rows)
+        provenance.batch_inserted(inserted)
+        return inserted
+    return counted
+
+
+def evaluate_status(total_rows: int, skipped_count: int):
+    """
+    Apply the skipped-row thresholds.
+    Returns: (status, error_msg)
+    """
+    if total_rows > 0:
+        ratio = skipped_count / total_rows
+        if skipped_count > config.MAX_SKIPPED_ROWS or ratio > config.MAX_SKIPPED_RATIO:
+            return "FAILED", f"Skipped {skipped_count} lines ({ratio:.2%}). Exceeded threshold."
+        elif skipped_count > 0:
+            return "WARNING", f"Skipped {skipped_count} lines"
+    return "SUCCESS", None
+
+
+def record_security(conn, provenance: Provenance, label: str):
+    """
+    Merge the name runs and coverage of a load's committed batches into
+    stock_name and security_master and commit; failures are logged only.
+    """
+    try:
+        names.record_runs(conn, provenance.name_runs.runs())
+        security_master.record_coverage(conn, provenance.coverage)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"[{label}] Failed to update stock_name/security_master: {e}")
+
+
+_PROVENANCE_SET = ",\n".join(f"{c}=EXCLUDED.{c}" for c in db.PROVENANCE_COLUMNS)
+
+
+def write_load_log(conn, zip_filename, status, skipped_count, error_msg, file_size, last_modified,
+                   fingerprint=None, provenance=None):
+    """
+    Upsert the per-archive checkpoint row and commit.
+    provenance: values of db.PROVENANCE_COLUMNS (see Provenance.columns), or None.
+    A rerun replaces them, so they always describe the archive's last run.
+    """
+    provenance = tuple(provenance) if provenance else (None,) * len(db.PROVENANCE_COLUMNS)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO load_log (filename, status, skipped_lines, error_msg, processed_at, file_size, last_modified,
+                                  fingerprint, {", ".join(db.PROVENANCE_COLUMNS)})
+            VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s{", %s" * len(db.PROVENANCE_COLUMNS)})
+            ON CONFLICT (filename) 
+            DO UPDATE SET status=EXCLUDED.status, 
+                          skipped_lines=EXCLUDED.skipped_lines,
+                          error_msg=EXCLUDED.error_msg,
+                          processed_at=NOW(),
+                          file_size=EXCLUDED.file_size,
+                          last_modified=EXCLUDED.last_modified,
+                          fingerprint=EXCLUDED.fingerprint,
+                          {_PROVENANCE_SET};
+        """, (zip_filename, status, skipped_count, error_msg, file_size, last_modified, fingerprint) + provenance)
+    conn.commit()
+
+
+def archive_fingerprint(zip_path: str):
+    """
+    Content fingerprint of an archive from its central directory only (no
+    decompression): SHA-1 over every member's name, CRC32 and sizes.
+    Copies and touched files keep it; None if the file is not a readable zip.
+    """
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            entries = sorted((i.filename, i.CRC, i.file_size, i.compress_size) for i in z.infolist())
+    except (OSError, zipfile.BadZipFile):
+        return None
+    digest = hashlib.sha1()
+    for name, crc, size, csize in entries:
+        digest.update(f"{name}\0{crc:08x}\0{size}\0{csize}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _file_stat(zip_path: str):
+    """Return (file_size, last_modified, fingerprint) as stored in load_log."""
+    stat = os.stat(zip_path)
+    return stat.st_size, datetime.fromtimestamp(stat.st_mtime), archive_fingerprint(zip_path)
+
+
+def process_zip_file(zip_path: str, direct: bool = False):
     """
     Worker function to process a single Zip file.
+    direct=True is the bulk initial load path (see _load_rows).
+    Returns the staging.ReadStats of the archive reads.
     """
     zip_filename = os.path.basename(zip_path)
+    read_stats = staging.ReadStats()
     
     try:
-        stat = os.stat(zip_path)
-        file_size = stat.st_size
-        last_modified = datetime.fromtimestamp(stat.st_mtime)
+        file_size, last_modified, fingerprint = _file_stat(zip_path)
     except Exception as e:
         logger.error(f"[{zip_filename}] Failed to get file stats: {e}")
-        return
+        return read_stats
 
     try:
         conn = db.get_db_connection()
     except Exception as e:
         logger.error(f"[{zip_filename}] Database connection failed: {e}")
-        return
+        return read_stats
     
     status = "SUCCESS"
-    skipped_count = 0
     error_msg = None
-    total_rows = 0
+    stats = ParseStats()
+    provenance = Provenance()
+    telemetry.clock.reset()
+    started = time.perf_counter()
     
     try:
-        buffer = io.StringIO()
-        csv_writer = csv.writer(buffer)
-        buffer_count = 0
-        stop_processing = False 
-        
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            csv_files = [f for f in z.namelist() if f.endswith('.csv')]
-            
-            for csv_file in csv_files:
-                if stop_processing:
-                    break
+        with staging.open_timed(zip_path, read_stats) as z:
+            _load_rows(conn, iter_clean_rows(z, zip_filename, stats), zip_filename, direct, provenance)
+        status, error_msg = evaluate_status(stats.total_rows, stats.skipped_count)
 
-                with z.open(csv_file, 'r') as f:
-                    text_io = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
-                    reader = csv.reader(text_io)
-                    
-                    try:
-                        header = next(reader)
-                        for idx, keyword in EXPECTED_HEADER_KEYWORDS.items():
-                            if len(header) <= idx or keyword not in header[idx]:
-                                raise ValueError(f"Header mismatch at col {idx}: expected '{keyword}', got '{header[idx] if len(header)>idx else 'N/A'}'")
-                    except StopIteration:
-                        continue 
-                    except ValueError as ve:
-                        logger.error(f"[{zip_filename}] {csv_file} Header Error: {ve}")
-                        error_msg = f"Header mismatch in {csv_file}: {ve}"
-                        status = "FAILED"
-                        stop_processing = True
-                        break 
-                    
-                    for row_num, row in enumerate(reader, start=2):
-                        total_rows += 1
-                        try:
-                            clean_row = clean_row_data(row)
-                            csv_writer.writerow(clean_row)
-                            buffer_count += 1
-                        except (ValueError, IndexError) as e:
-                            skipped_count += 1
-                            if skipped_count <= 10: 
-                                logger.warning(f"[{zip_filename}] Skipped bad row {csv_file}:{row_num}: {e}")
-                            continue
-
-                        if buffer_count >= config.BATCH_SIZE:
-                            db.bulk_insert(conn, buffer)
-                            conn.commit()
-                            buffer.close()
-                            buffer = io.StringIO()
-                            csv_writer = csv.writer(buffer)
-                            buffer_count = 0
-            
-            if not stop_processing and buffer_count > 0:
-                db.bulk_insert(conn, buffer)
-                conn.commit()
-
-            if stop_processing:
-                pass
-            elif total_rows > 0:
-                ratio = skipped_count / total_rows
-                if skipped_count > config.MAX_SKIPPED_ROWS or ratio > config.MAX_SKIPPED_RATIO:
-                    status = "FAILED"
-                    error_msg = f"Skipped {skipped_count} lines ({ratio:.2%}). Exceeded threshold."
-                elif skipped_count > 0:
-                    status = "WARNING"
-                    error_msg = f"Skipped {skipped_count} lines"
-                else:
-                    status = "SUCCESS"
-            elif status != "FAILED":
-                status = "SUCCESS" 
-            
+    except HeaderMismatchError as he:
+        # Rows of the current (uncommitted) batch are discarded, earlier batches stay
+        conn.rollback()
+        status = "FAILED"
+        error_msg = str(he)
     except Exception as e:
         if 'conn' in locals(): conn.rollback()
         status = "FAILED"
         error_msg = str(e)
         logger.error(f"[{zip_filename}] Critical Error: {traceback.format_exc()}")
     finally:
+        provenance.elapsed = time.perf_counter() - started
+        telemetry.emit(telemetry.load_record(zip_filename, status, stats, provenance))
+        record_security(conn, provenance, zip_filename)
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO load_log (filename, status, skipped_lines, error_msg, processed_at, file_size, last_modified)
-                    VALUES (%s, %s, %s, %s, NOW(), %s, %s)
-                    ON CONFLICT (filename) 
-                    DO UPDATE SET status=EXCLUDED.status, 
-                                  skipped_lines=EXCLUDED.skipped_lines,
-                                  error_msg=EXCLUDED.error_msg,
-                                  processed_at=NOW(),
-                                  file_size=EXCLUDED.file_size,
-                                  last_modified=EXCLUDED.last_modified;
-                """, (zip_filename, status, skipped_count, error_msg, file_size, last_modified))
-            conn.commit()
+            write_load_log(conn, zip_filename, status, stats.skipped_count, error_msg, file_size, last_modified,
+                           fingerprint, provenance.columns(stats.total_rows))
         except Exception as log_err:
             logger.error(f"[{zip_filename}] Failed to write log: {log_err}")
         
-        if 'conn' in locals(): conn.close()
\ No newline at end of file
+        if 'conn' in locals(): conn.close()
+    return read_stats
+
+
+# ---------------------------------------------------------------------------
+# Member-level tasks: one (zip, csv member) per task, checkpointed in load_member_log
+# ---------------------------------------------------------------------------
+
+_worker_conn = None
+
+
+def _get_worker_connection():
+    """Per-process connection reused across member tasks (members are small and many)."""
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        _worker_conn = db.get_db_connection()
+    return _worker_conn
+
+
+def process_zip_member(zip_path: str, csv_file: str, direct: bool = False, file_stat=None) -> dict:
+    """
+    Worker function to load a single CSV member of a Zip file.
+
+    The outcome is recorded in load_member_log (keyed by archive and member,
+    together with the archive's size/mtime/fingerprint and the member's
+    provenance) and returned as a dict with status, total_rows, skipped_lines,
+    error_msg and read (staging.ReadStats).
+
+    file_stat is the archive's (size, mtime, fingerprint) as scanned by the
+    caller (main.scan_archives), so the central directory is not re-read and
+    hashed for every member; it is computed here when None.
+    """
+    zip_filename = os.path.basename(zip_path)
+    label = f"{zip_filename}:{csv_file}"
+    stats = ParseStats()
+    provenance = Provenance()
+    read_stats = staging.ReadStats()
+    result = {"status": "FAILED", "total_rows": 0, "skipped_lines": 0, "error_msg": None, "read": read_stats}
+
+    try:
+        file_size, last_modified, fingerprint = file_stat or _file_stat(zip_path)
+    except Exception as e:
+        logger.error(f"[{label}] Failed to get file stats: {e}")
+        result["error_msg"] = str(e)
+        return result
+
+    try:
+        conn = _get_worker_connection()
+    except Exception as e:
+        logger.error(f"[{label}] Database connection failed: {e}")
+        result["error_msg"] = str(e)
+        return result
+
+    telemetry.clock.reset()
+    started = time.perf_counter()
+    try:
+        with staging.open_timed(zip_path, read_stats) as z:
+            _load_rows(conn, iter_clean_rows(z, zip_filename, stats, members=[csv_file]), label, direct, provenance)
+        status, error_msg = evaluate_status(stats.total_rows, stats.skipped_count)
+    except HeaderMismatchError as he:
+        conn.rollback()
+        status, error_msg = "FAILED", str(he)
+    except Exception as e:
+        conn.rollback()
+        status, error_msg = "FAILED", str(e)
+        logger.error(f"[{label}] Critical Error: {traceback.format_exc()}")
+    provenance.elapsed = time.perf_counter() - started
+    telemetry.emit(telemetry.load_record(label, status, stats, provenance))
+    record_security(conn, provenance, label)
+
+    result.update(status=status, total_rows=stats.total_rows,
+                  skipped_lines=stats.skipped_count, error_msg=error_msg)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO load_member_log (filename, member, status, skipped_lines,
+                                             error_msg, processed_at, file_size, last_modified, fingerprint,
+                                             {", ".join(db.PROVENANCE_COLUMNS)})
+                VALUES (%s, %s, %s, %s, %s, NOW(), %s, %s, %s{", %s" * len(db.PROVENANCE_COLUMNS)})
+                ON CONFLICT (filename, member)
+                DO UPDATE SET status=EXCLUDED.status,
+                              skipped_lines=EXCLUDED.skipped_lines,
+                              error_msg=EXCLUDED.error_msg,
+                              processed_at=NOW(),
+                              file_size=EXCLUDED.file_size,
+                              last_modified=EXCLUDED.last_modified,
+                              fingerprint=EXCLUDED.fingerprint,
+                              {_PROVENANCE_SET};
+            """, (zip_filename, csv_file, status, stats.skipped_count,
+                  error_msg, file_size, last_modified, fingerprint) + provenance.columns(stats.total_rows))
+        conn.commit()
+    except Exception as log_err:
+        logger.error(f"[{label}] Failed to write member log: {log_err}")
+        try:
+            conn.close()
+        except Exception:
+            pass
+    return result
+
+
+def _sum_provenance(member_rows):
+    """Archive provenance (db.PROVENANCE_COLUMNS) from its members' values."""
+    def total(i):
+        return sum(r[i] or 0 for r in member_rows)
+
+    def bound(i, fn):
+        values = [r[i] for r in member_rows if r[i] is not None]
+        return fn(values) if values else None
+
+    return (total(0), total(1), total(2), bound(3, min), bound(4, max), total(5), round(total(6), 3))
+
+
+def finalize_zip(zip_path: str, members, error_msg: str = None):
+    """
+    Roll the load_member_log rows of an archive up into its load_log row.
+
+    The archive is FAILED if any of `members` is missing or FAILED;
+    otherwise the skipped-row thresholds are applied to the archive totals,
+    exactly as for a whole-archive load. Member provenance is summed into the
+    archive's (members hold one stock each, so code counts add up).
+    """
+    zip_filename = os.path.basename(zip_path)
+    try:
+        file_size, last_modified, fingerprint = _file_stat(zip_path)
+    except OSError as e:
+        logger.error(f"[{zip_filename}] Failed to get file stats: {e}")
+        return
+
+    with db.get_db_connection() as conn:
+        skipped_count = 0
+        provenance = None
+        if error_msg is None:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT member, status, skipped_lines, {", ".join(db.PROVENANCE_COLUMNS)}
+                    FROM load_member_log
+                    WHERE filename = %s
+                """, (zip_filename,))
+                logged = {row[0]: row[1:] for row in cur.fetchall()}
+
+            failed = [m for m in members if m not in logged or logged[m][0] == "FAILED"]
+            rows = [logged[m] for m in members if m in logged]
+            skipped_count = sum(r[1] or 0 for r in rows)
+            provenance = _sum_provenance([r[2:] for r in rows])
+            total_rows = provenance[0]
+            if failed:
+                status = "FAILED"
+                error_msg = f"{len(failed)} of {len(members)} members failed (first: {failed[0]})"
+            else:
+                status, error_msg = evaluate_status(total_rows, skipped_count)
+        else:
+            status = "FAILED"
+
+        write_load_log(conn, zip_filename, status, skipped_count, error_msg, file_size, last_modified, fingerprint,
+                       provenance)
+    logger.info(f"[{zip_filename}] Finalized: {status}" + (f" ({error_msg})" if error_msg else ""))
@@ -2,13 +2,22 @@ import os
 import argparse
 import logging
 import glob
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
 from datetime import datetime
 
 from . import config
+from . import audit
 from . import db
 from . import loader
+from . import bulk_load
+from . import compression
+from . import readjust
+from . import scheduling
+from . import staging
+from . import telemetry
+from . import work_queue
 
 # Configure Logging
 logging.basicConfig(
@@ -24,7 +33,7 @@ logger = logging.getLogger(__name__)
 def get_processed_files(retry_warnings=False, force=False):
     """
     Retrieve map of filename -> metadata that should be skipped.
-    Returns a dict: {filename: {'size': size, 'mtime': mtime}}
+    Returns a dict: {filename: {'size': size, 'mtime': mtime, 'fingerprint': fingerprint}}
     """
     if force:
         return {}
@@ -34,27 +43,352 @@ def get_processed_files(retry_warnings=False, force=False):
             with conn.cursor() as cur:
                 # Retrieve all potentially skippable files
                 cur.execute("""
-                    SELECT filename, status, file_size, last_modified 
+                    SELECT filename, status, file_size, last_modified, fingerprint
                     FROM load_log 
                     WHERE status IN ('SUCCESS', 'WARNING')
                 """)
                 rows = cur.fetchall()
                 
                 processed = {}
-                for filename, status, size, mtime in rows:
+                for filename, status, size, mtime, fingerprint in rows:
                     if status == 'WARNING' and retry_warnings:
                         continue
-                    processed[filename] = {'size': size, 'mtime': mtime}
+                    processed[filename] = {'size': size, 'mtime': mtime, 'fingerprint': fingerprint}
                 return processed
     except Exception as e:
         logger.warning(f"Could not read load_log (first run?): {e}")
         return {}
 
+def get_processed_members(retry_warnings=False, force=False):
+    """
+    Retrieve map of (filename, member) -> archive metadata for members that should be skipped.
+    Returns a dict: {(filename, member): {'size': size, 'mtime': mtime, 'fingerprint': fingerprint}}
+    """
+    if force:
+        return {}
+
+    try:
+        with db.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT filename, member, status, file_size, last_modified, fingerprint
+                    FROM load_member_log
+                    WHERE status IN ('SUCCESS', 'WARNING')
+                """)
+                processed = {}
+                for filename, member, status, size, mtime, fingerprint in cur.fetchall():
+                    if status == 'WARNING' and retry_warnings:
+                        continue
+                    processed[(filename, member)] = {'size': size, 'mtime': mtime, 'fingerprint': fingerprint}
+                return processed
+    except Exception as e:
+        logger.warning(f"Could not read load_member_log (first run?): {e}")
+        return {}
+
+def scan_archives(zip_paths):
+    """
+    Stat and fingerprint archives in parallel (SCAN_WORKERS threads: the work
+    is I/O on the data mount). Returns {zip_path: (size, mtime, fingerprint)};
+    files that cannot be stat'ed map to None.
+    """
+    def scan(zip_path):
+        try:
+            stat = os.stat(zip_path)
+        except OSError:
+            return None
+        return stat.st_size, datetime.fromtimestamp(stat.st_mtime), loader.archive_fingerprint(zip_path)
+
+    with ThreadPoolExecutor(max_workers=config.SCAN_WORKERS) as executor:
+        return dict(zip(zip_paths, executor.map(scan, zip_paths)))
+
+def backfill_fingerprints(fingerprints):
+    """Store fingerprints for checkpoint rows written before they existed: [(filename, fingerprint)]."""
+    if not fingerprints:
+        return
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                UPDATE load_log SET fingerprint = %s
+                WHERE filename = %s AND fingerprint IS NULL
+            """, [(fp, filename) for filename, fp in fingerprints])
+            cur.executemany("""
+                UPDATE load_member_log SET fingerprint = %s
+                WHERE filename = %s AND fingerprint IS NULL
+            """, [(fp, filename) for filename, fp in fingerprints])
+        conn.commit()
+    logger.info(f"Backfilled content fingerprints for {len(fingerprints)} archives.")
+
+def metadata_change(log_data, current_size, current_mtime, current_fingerprint=None):
+    """
+    Compare a checkpoint row with the file on disk.
+    Returns None if unchanged, otherwise a short reason for the log.
+    """
+    # The content fingerprint decides when both sides have one: a copied or
+    # touched archive keeps it, a rewritten one does not
+    stored = log_data.get('fingerprint')
+    if stored and current_fingerprint:
+        if stored != current_fingerprint:
+            return f"changed content (fingerprint DB:{stored[:12]}, Disk:{current_fingerprint[:12]})"
+        return None
+
+    # Check Metadata Existence (Handle legacy logs with NULL metadata)
+    if log_data['size'] is None or log_data['mtime'] is None:
+        return "has missing metadata in DB"
+
+    # Check Size
+    if log_data['size'] != current_size:
+        return f"changed size (DB:{log_data['size']}, Disk:{current_size})"
+
+    # Check Mtime (Allow 2 seconds tolerance for DB/File system precision diffs)
+    # Ensure both are naive or both aware (assuming Naive from loader.py/db)
+    delta = abs((log_data['mtime'] - current_mtime).total_seconds())
+    if delta > 2.0:
+        return f"changed mtime (DB:{log_data['mtime']}, Disk:{current_mtime}, Delta:{delta}s)"
+    return None
+
+def _compression_coordinator(tasks, direct):
+    """
+    Decompress/recompress around the tasks (see compression.py). Not used for a
+    bulk initial load: its de-duplication and key rebuild need uncompressed chunks.
+    """
+    if direct:
+        return None
+    return compression.CompressionCoordinator(tasks, compress_new=config.COMPRESS_AFTER_LOAD)
+
+def _start_stager(zip_paths):
+    """Start read-ahead into STAGE_DIR (see staging.py), or None when staging is off."""
+    if not config.STAGE_DIR:
+        return None
+    stager = staging.ArchiveStager(zip_paths)
+    stager.start()
+    logger.info(f"Staging archives in {config.STAGE_DIR} "
+                f"({config.STAGE_AHEAD} ahead, cap {config.STAGE_MAX_GB:.0f} GB)")
+    return stager
+
+def _submit_hook(coordinator, stager):
+    """run_tasks on_submit: decompress target chunks, then point the task at its staged copy."""
+    if not coordinator and not stager:
+        return None
+
+    def on_submit(args, keys):
+        if coordinator:
+            coordinator.before_submit(args, keys)
+        if stager:
+            return stager.stage_args(args)
+    return on_submit
+
+def _log_read_stats(stager, from_stage, from_source):
+    """Per-run read throughput: source mount (stager) vs. loader reads."""
+    if stager:
+        logger.info(f"Read from source mount (stager, sequential): {stager.source_stats.summary()}")
+        logger.info(f"Loader reads from stage: {from_stage.summary()}")
+    logger.info(f"Loader reads from source: {from_source.summary()}")
+
+def _start_metrics_reporter():
+    """Follow METRICS_FILE while workers load (None if telemetry is off)."""
+    if not telemetry.enabled():
+        return None
+    reporter = telemetry.MetricsReporter()
+    reporter.start()
+    logger.info(f"Writing load metrics to {config.METRICS_FILE}"
+                + (f" and {config.METRICS_PROM_FILE}" if config.METRICS_PROM_FILE else ""))
+    return reporter
+
+def _stop_metrics_reporter(reporter):
+    if reporter:
+        reporter.stop()
+        logger.info(f"Loader throughput per worker:\n{reporter.summary()}")
+
+def run_member_tasks(zip_paths, retry_warnings=False, force=False, direct=False, scanned=None):
+    """
+    Load archives with one task per (zip, csv member).
+
+    Members already recorded as done in load_member_log for the same archive
+    size/mtime are skipped, so a rerun resumes at member level. When the last
+    member of an archive completes, its load_log row is finalized.
+    """
+    processed_members = get_processed_members(retry_warnings, force)
+    scanned = scanned if scanned is not None else scan_archives(zip_paths)
+
+    member_tasks = []
+    zip_members = {}
+    zip_keys = {}
+    pending = {}
+    resumed = 0
+
+    for zip_path in zip_paths:
+        filename = os.path.basename(zip_path)
+        try:
+            if scanned.get(zip_path) is None:
+                raise OSError(f"Cannot stat {zip_path}")
+            size, mtime, fingerprint = scanned[zip_path]
+            with zipfile.ZipFile(zip_path, 'r') as z:
+                members = loader.list_csv_members(z)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.error(f"Cannot read archive {filename}: {e}")
+            loader.finalize_zip(zip_path, [], error_msg=str(e))
+            continue
+
+        todo = []
+        for member in members:
+            log_data = processed_members.get((filename, member))
+            if log_data and metadata_change(log_data, size, mtime, fingerprint) is None:
+                resumed += 1
+                continue
+            todo.append(member)
+
+        zip_members[zip_path] = members
+        pending[zip_path] = len(todo)
+        zip_keys[zip_path] = scheduling.chunk_keys(scheduling.archive_time_range(zip_path))
+        member_tasks.extend(((zip_path, member, direct, scanned[zip_path]), zip_keys[zip_path])
+                            for member in todo)
+        if not todo:
+            loader.finalize_zip(zip_path, members)
+
+    logger.info(f"Members to process: {len(member_tasks)}. Already loaded (resumed): {resumed}")
+    if not member_tasks:
+        return
+
+    logger.info(f"Starting execution with {config.MAX_WORKERS} workers "
+                f"(task unit: csv member, scheduling: {config.SCHEDULING})...")
+
+    coordinator = _compression_coordinator(member_tasks, direct)
+    stager = _start_stager([args[0] for args, _ in member_tasks])
+    from_stage, from_source = staging.ReadStats(), staging.ReadStats()
+    try:
+        with ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+            completed = scheduling.run_tasks(executor, loader.process_zip_member, member_tasks,
+                                             max_in_flight=config.MAX_WORKERS,
+                                             on_submit=_submit_hook(coordinator, stager))
+
+            with tqdm(total=len(member_tasks), unit="csv") as pbar:
+                for (zip_path, member, *_), future in completed:
+                    filename = os.path.basename(zip_path)
+                    try:
+                        result = future.result()
+                        staged = stager is not None and stager.is_staged(zip_path)
+                        (from_stage if staged else from_source).add(result["read"])
+                        if result["status"] == "FAILED":
+                            logger.warning(f"Member failed: {filename}:{member}: {result['error_msg']}")
+                    except Exception as e:
+                        logger.error(f"Worker exception for {filename}:{member}: {e}")
+                    finally:
+                        pending[zip_path] -= 1
+                        if pending[zip_path] == 0:
+                            loader.finalize_zip(zip_path, zip_members[zip_path])
+                            logger.info(f"Finished: {filename}")
+                            if stager:
+                                stager.release(zip_path)
+                        if coordinator:
+                            coordinator.task_done(zip_keys[zip_path])
+                        pbar.update(1)
+    finally:
+        if stager:
+            stager.close()
+        if coordinator:
+            coordinator.close()
+    _log_read_stats(stager, from_stage, from_source)
+
+def run_zip_tasks(zip_paths, direct=False):
+    """Load archives with one task per zip."""
+    logger.info(f"Starting execution with {config.MAX_WORKERS} workers (scheduling: {config.SCHEDULING})...")
+    zip_keys = {zip_path: scheduling.chunk_keys(scheduling.archive_time_range(zip_path)) for zip_path in zip_paths}
+    zip_tasks = [((zip_path, direct), zip_keys[zip_path]) for zip_path in zip_paths]
+
+    coordinator = _compression_coordinator(zip_tasks, direct)
+    stager = _start_stager(zip_paths)
+    from_stage, from_source = staging.ReadStats(), staging.ReadStats()
+    try:
+        with ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+            completed = scheduling.run_tasks(executor, loader.process_zip_file, zip_tasks,
+                                             max_in_flight=config.MAX_WORKERS,
+                                             on_submit=_submit_hook(coordinator, stager))
+
+            # Progress Bar
+            with tqdm(total=len(zip_tasks), unit="file") as pbar:
+                for (zip_path, _), future in completed:
+                    filename = os.path.basename(zip_path)
+                    try:
+                        read_stats = future.result()
+                        staged = stager is not None and stager.is_staged(zip_path)
+                        (from_stage if staged else from_source).add(read_stats)
+                        logger.info(f"Finished: {filename}")
+                    except Exception as e:
+                        logger.error(f"Worker exception for {filename}: {e}")
+                    finally:
+                        if stager:
+                            stager.release(zip_path)
+                        if coordinator:
+                            coordinator.task_done(zip_keys[zip_path])
+                        pbar.update(1)
+    finally:
+        if stager:
+            stager.close()
+        if coordinator:
+            coordinator.close()
+    _log_read_stats(stager, from_stage, from_source)
+
+def run_queue_workers():
+    """Multi-node mode: MAX_WORKERS local processes drain the shared load_task queue."""
+    logger.info(f"Starting {config.MAX_WORKERS} queue workers on this node...")
+    with ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+        futures = [executor.submit(work_queue.run_queue_worker) for _ in range(config.MAX_WORKERS)]
+        processed = 0
+        for future in futures:
+            try:
+                processed += future.result()
+            except Exception as e:
+                logger.error(f"Queue worker exception: {e}")
+    logger.info(f"Queue workers finished: {processed} archives processed on this node.")
+
 def main():
     parser = argparse.ArgumentParser(description="Bulk load A-share 1-minute data into TimescaleDB.")
     parser.add_argument("--retry-warnings", action="store_true", help="Retry files that ended with WARNING status.")
     parser.add_argument("--force", action="store_true", help="Force re-process all files, ignoring load_log.")
+    parser.add_argument("--task-unit", choices=["zip", "member"], default=config.TASK_UNIT,
+                        help="Parallelize per archive or per CSV member (default: TASK_UNIT).")
+    parser.add_argument("--scheduling", choices=["fifo", "chunk"], default=config.SCHEDULING,
+                        help="Task order: file order, or chunk affinity (default: SCHEDULING).")
+    parser.add_argument("--compress-after-load", action="store_true", default=config.COMPRESS_AFTER_LOAD,
+                        help="Compress each finished chunk in the background while the next files load.")
+    parser.add_argument("--stage-dir", default=config.STAGE_DIR,
+                        help="Prefetch archives into this local directory before loading (default: STAGE_DIR).")
+    parser.add_argument("--seed-queue", action="store_true",
+                        help="Queue the files to process in load_task for --queue-worker nodes, then exit.")
+    parser.add_argument("--queue-worker", action="store_true",
+                        help="Run MAX_WORKERS processes claiming archives from load_task (multi-node mode).")
+    parser.add_argument("--bulk-initial-load", action="store_true",
+                        help="Empty stock_1min_qfq only: drop the (code, time) unique key, COPY straight into the hypertable, "
+                             "then de-duplicate chunks and rebuild the key (see bulk_load.py).")
+    parser.add_argument("--bulk-finalize-only", action="store_true",
+                        help="Only run (or resume) the de-duplication and key rebuild of a bulk load.")
+    parser.add_argument("--readjust", action="store_true",
+                        help="Rewrite only the (code, day) bars of changed archives whose digest changed, "
+                             "then refresh the affected months of stock_monthly_kline (see readjust.py).")
+    parser.add_argument("--seed-digests", action="store_true",
+                        help="Record the per-(code, day) digests of all archives for --readjust, then exit.")
+    parser.add_argument("--validate-only", action="store_true",
+                        help="Parse and validate all archives on AUDIT_WORKERS processes without a database; "
+                             "write per-file reject and per-code row counts (see audit.py).")
+    parser.add_argument("--report", default=config.AUDIT_REPORT,
+                        help="Report path of --validate-only (default: AUDIT_REPORT).")
     args = parser.parse_args()
+    config.SCHEDULING = args.scheduling
+    config.COMPRESS_AFTER_LOAD = args.compress_after_load
+    config.STAGE_DIR = args.stage_dir
+    if args.compress_after_load and args.bulk_initial_load:
+        parser.error("--compress-after-load cannot be combined with --bulk-initial-load "
+                     "(chunks are de-duplicated and indexed after the load).")
+    if args.readjust and args.bulk_initial_load:
+        parser.error("--readjust needs the (code, time) unique key; it cannot be combined with --bulk-initial-load.")
+
+    if args.validate_only:
+        zip_paths = sorted(glob.glob(os.path.join(config.DATA_DIR, "*_1min.zip")))
+        if not zip_paths:
+            logger.error(f"No zip files found in {config.DATA_DIR}")
+            return
+        audit.run_audit(zip_paths, args.report)
+        return
 
     # 1. Initialize Database
     try:
@@ -63,6 +397,43 @@ def main():
         logger.critical(f"Database initialization failed: {e}")
         return
 
+    if args.bulk_finalize_only:
+        bulk_load.finalize_bulk_load()
+        return
+
+    with db.get_db_connection() as conn:
+        has_unique_key = db.has_unique_key(conn)
+        name_storage = "column" if db.has_name_column(conn) else "dimension"
+        numeric_storage = db.numeric_storage(conn)
+        chunk_interval = db.chunk_interval(conn)
+        bulk_blocker = bulk_load.bulk_load_blocker(conn) if args.bulk_initial_load else None
+    if bulk_blocker:
+        logger.critical(bulk_blocker)
+        return
+    if name_storage != config.NAME_STORAGE:
+        logger.info(f"stock_1min_qfq layout: NAME_STORAGE={name_storage} (configured: {config.NAME_STORAGE}).")
+        config.NAME_STORAGE = name_storage
+    if numeric_storage != config.NUMERIC_STORAGE:
+        logger.info(f"stock_1min_qfq layout: NUMERIC_STORAGE={numeric_storage} "
+                    f"(configured: {config.NUMERIC_STORAGE}).")
+        config.NUMERIC_STORAGE = numeric_storage
+    if chunk_interval != db.CHUNK_INTERVAL:
+        # Chunk keys (scheduling, compression) must follow the table's chunks
+        logger.info(f"stock_1min_qfq layout: chunk interval {chunk_interval.days} days.")
+        db.CHUNK_INTERVAL = chunk_interval
+    if not has_unique_key and not args.bulk_initial_load:
+        logger.critical("The (code, time) unique key is missing: a bulk load was not finalized. "
+                        "Run with --bulk-initial-load or --bulk-finalize-only first.")
+        return
+
+    if args.queue_worker:
+        reporter = _start_metrics_reporter()
+        try:
+            run_queue_workers()
+        finally:
+            _stop_metrics_reporter(reporter)
+        return
+
     # 2. Scan Data Directory
     logger.info(f"Scanning data directory: {config.DATA_DIR}")
     zip_pattern = os.path.join(config.DATA_DIR, "*_1min.zip")
@@ -72,88 +443,88 @@ def main():
         logger.error(f"No zip files found in {config.DATA_DIR}")
         return
 
+    if args.seed_digests:
+        readjust.run_readjust(all_zip_files, seed=True)
+        return
+
     # 3. Filter Processed Files (Checkpointing with Strict Validation)
     processed_map = get_processed_files(args.retry_warnings, args.force)
+    scanned = scan_archives(all_zip_files)
     
     tasks = []
     skipped_count = 0
+    backfill = []
     
     for zip_path in all_zip_files:
         filename = os.path.basename(zip_path)
         
         if filename in processed_map:
-            # Validate Metadata
-            try:
-                stat = os.stat(zip_path)
-                current_size = stat.st_size
-                # Compare mtime with tolerance (DB might truncate milliseconds)
-                # But simple size check + filename is usually enough. 
-                # Let's check size strict, mtime loose or strict?
-                # Let's stick to size for now as it's most robust against simple touch.
-                # Actually, design doc says check BOTH.
-                # Note: DB timestamp might be offset aware or not.
-                
-                log_data = processed_map[filename]
-                
-                # Check Metadata Existence (Handle legacy logs with NULL metadata)
-                if log_data['size'] is None or log_data['mtime'] is None:
-                    logger.info(f"File {filename} has missing metadata in DB. Reprocessing to update log.")
-                    tasks.append(zip_path)
-                    continue
-
-                # Check Size
-                if log_data['size'] is not None and log_data['size'] != current_size:
-                    logger.info(f"File {filename} changed size (DB:{log_data['size']}, Disk:{current_size}). Reprocessing.")
-                    tasks.append(zip_path)
-                    continue
-                    
-                # Check Mtime (Allow 2 seconds tolerance for DB/File system precision diffs)
-                if log_data['mtime'] is not None:
-                    db_mtime = log_data['mtime']
-                    file_mtime = datetime.fromtimestamp(os.stat(zip_path).st_mtime)
-                    
-                    # Ensure both are naive or both aware (assuming Naive from loader.py/db)
-                    delta = abs((db_mtime - file_mtime).total_seconds())
-                    if delta > 2.0:
-                        logger.info(f"File {filename} changed mtime (DB:{db_mtime}, Disk:{file_mtime}, Delta:{delta}s). Reprocessing.")
-                        tasks.append(zip_path)
-                        continue
-                
-                skipped_count += 1
-                continue
-                
-            except OSError:
+            if scanned[zip_path] is None:
                 # File access error, maybe reprocess?
                 tasks.append(zip_path)
+                continue
+
+            # Validate Metadata (fingerprint, else size + mtime, see metadata_change)
+            size, mtime, fingerprint = scanned[zip_path]
+            reason = metadata_change(processed_map[filename], size, mtime, fingerprint)
+            if reason:
+                logger.info(f"File {filename} {reason}. Reprocessing.")
+                tasks.append(zip_path)
+                continue
+
+            if processed_map[filename]['fingerprint'] is None and fingerprint:
+                backfill.append((filename, fingerprint))
+            skipped_count += 1
         else:
             tasks.append(zip_path)
 
+    try:
+        backfill_fingerprints(backfill)
+    except Exception as e:
+        logger.warning(f"Could not backfill fingerprints: {e}")
+
     logger.info(f"Total files: {len(all_zip_files)}. To process: {len(tasks)}. Skipped: {skipped_count}")
 
+    if args.seed_queue:
+        work_queue.seed_tasks(tasks)
+        return
+
     if not tasks:
         logger.info("All files processed. Nothing to do.")
+        if args.bulk_initial_load and not has_unique_key:
+            # Resume an interrupted finalize
+            bulk_load.finalize_bulk_load()
         return
 
-    # 4. Start Parallel Processing
-    logger.info(f"Starting execution with {config.MAX_WORKERS} workers...")
-    
-    with ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-        futures = {executor.submit(loader.process_zip_file, zip_path): zip_path for zip_path in tasks}
-        
-        # Progress Bar
-        with tqdm(total=len(tasks), unit="file") as pbar:
-            for future in as_completed(futures):
-                zip_path = futures[future]
-                filename = os.path.basename(zip_path)
-                try:
-                    future.result() 
-                    logger.info(f"Finished: {filename}")
-                except Exception as e:
-                    logger.error(f"Worker exception for {filename}: {e}")
-                finally:
-                    pbar.update(1)
+    if args.readjust:
+        readjust.run_readjust(tasks)
+        return
+
+    direct = args.bulk_initial_load
+    if direct:
+        bulk_load.prepare_bulk_load(new_data=True)
+
+    # 4. Start Parallel Processing (lock waits are sampled while workers run)
+    sampler = None
+    if config.LOCK_SAMPLE_INTERVAL > 0:
+        sampler = scheduling.LockWaitSampler()
+        sampler.start()
+    reporter = _start_metrics_reporter()
+
+    try:
+        if args.task_unit == "member":
+            run_member_tasks(tasks, args.retry_warnings, args.force, direct, scanned)
+        else:
+            run_zip_tasks(tasks, direct)
+    finally:
+        if sampler:
+            sampler.stop()
+            logger.info(f"Lock waits per worker (scheduling: {config.SCHEDULING}):\n{sampler.report()}")
+        _stop_metrics_reporter(reporter)
 
     logger.info("All tasks completed.")
+    if direct:
+        bulk_load.finalize_bulk_load()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
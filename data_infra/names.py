@@ -0,0 +1,283 @@
+"""
+Stock names as a dimension table instead of a column of every 1-minute bar.
+
+stock_name holds, per code, the runs of bars that carried the same name
+(valid_from/valid_to are the first and last bar of the run) and whether the
+name marks an ST stock (is_st), i.e. the name and ST history of the code. The loader keeps
+it up to date: loader.Provenance collects the runs of every load (NameRuns)
+and record_runs() merges them into the stored runs of each code.
+
+Queries needing a name join stock_name, e.g. the name in effect at the end of
+a month:
+
+    LEFT JOIN LATERAL (
+        SELECT name FROM stock_name s
+        WHERE s.code = k.code AND s.valid_from < k.month + INTERVAL '1 month'
+        ORDER BY s.valid_from DESC LIMIT 1
+    ) n ON TRUE
+
+Migration of an existing database:
+
+    python -m data_infra.names --populate          # build stock_name from the stored bars
+    python -m data_infra.names --migrate --sample-month 2020-01 [--rewrite-chunks] [--rebuild-aggregate]
+
+--migrate populates stock_name, drops stock_monthly_kline (it aggregates
+last(name, time)) and the name column, and reports table size and the cost of
+the monthly aggregation over the sample month before and after. Space of the
+dropped column is only reclaimed when chunks are rewritten (--rewrite-chunks:
+recompress compressed chunks, VACUUM FULL the others). --rebuild-aggregate
+recreates stock_monthly_kline without the name (full backfill, see aggregate.py).
+"""
+import argparse
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+from tqdm import tqdm
+
+from . import config
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Runs of (code, name) within one chunk: gaps-and-islands over the bars in time order
+CHUNK_RUNS_SQL = """
+    SELECT code, name, min(time), max(time)
+    FROM (
+        SELECT code, name, time,
+               row_number() OVER (PARTITION BY code ORDER BY time)
+             - row_number() OVER (PARTITION BY code, name ORDER BY time) AS grp
+        FROM {chunk}
+        WHERE name IS NOT NULL AND name <> ''
+    ) bars
+    GROUP BY code, name, grp
+"""
+
+# Monthly aggregation of one window, as computed by the stock_monthly_kline refresh
+MONTHLY_SQL = """
+    SELECT count(*) FROM (
+        SELECT time_bucket('1 month', time) AS month, code, {name}
+               first(open, time), max(high), min(low), last(close, time), sum(volume), sum(amount)
+        FROM {table}
+        WHERE time >= %s AND time < %s
+          AND volume >= 0 AND amount >= 0
+          AND high >= GREATEST(open, close) AND low <= LEAST(open, close)
+        GROUP BY month, code
+    ) m
+"""
+
+
+# Name markers of ST (special treatment) and delisting stocks
+ST_MARKERS = ['ST', '*ST', 'S*ST', 'SST', '退市', 'PT', '终止上市']
+
+
+def is_st_name(name) -> bool:
+    """True if the name marks an ST stock ('ST通葡', '*ST海润'; not 'BEST股份')."""
+    if not name:
+        return False
+    name_upper = str(name).upper()
+    for marker in ST_MARKERS:
+        # Markers lead the name or stand alone, so 'BEST' / 'FASTEST' do not match
+        if name_upper.startswith(marker) or f' {marker}' in name_upper:
+            return True
+        if marker in ('退市', '终止上市') and marker in name:
+            return True
+        if marker == 'PT' and 'PT' in name_upper:
+            return True
+    return False
+
+
+class NameRuns:
+    """Runs of consecutive bars with the same name per code, in the order the bars are seen."""
+
+    def __init__(self):
+        self._open = {}     # code -> [name, first time, last time]
+        self._closed = []
+
+    def add(self, code: str, t, name: str):
+        self.add_run(code, name, t, t)
+
+    def add_run(self, code: str, name: str, first, last):
+        """Consecutive bars of one code with the same name, from first to last."""
+        run = self._open.get(code)
+        if run is not None and run[0] == name:
+            if last > run[2]:
+                run[2] = last
+            if first < run[1]:
+                run[1] = first
+            return
+        if not name:
+            return
+        if run is not None:
+            self._closed.append((code, *run))
+        self._open[code] = [name, first, last]
+
+    def runs(self):
+        """[(code, name, first, last)]"""
+        return self._closed + [(code, *run) for code, run in self._open.items()]
+
+
+def _ts(value) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if isinstance(value, str) else value
+
+
+def merge_runs(runs):
+    """
+    Merge the runs of one code [(valid_from, valid_to, name)]: later entries win
+    for the same valid_from, then consecutive runs of the same name are joined.
+    """
+    by_start = {}
+    for valid_from, valid_to, name in runs:
+        by_start[valid_from] = (valid_from, valid_to, name)
+    merged = []
+    for valid_from, valid_to, name in sorted(by_start.values()):
+        if merged and merged[-1][2] == name:
+            merged[-1][1] = max(merged[-1][1], valid_to)
+        else:
+            merged.append([valid_from, valid_to, name])
+    return [tuple(r) for r in merged]
+
+
+def record_runs(conn, runs) -> int:
+    """
+    Merge name runs [(code, name, first, last)] into stock_name (caller commits).
+    Codes are locked in sorted order (advisory locks), so concurrent loads of
+    the same code do not lose each other's runs. Returns the codes rewritten.
+    """
+    by_code = defaultdict(list)
+    for code, name, first, last in runs:
+        by_code[code].append((_ts(first), _ts(last), name))
+    changed = 0
+    with conn.cursor() as cur:
+        for code in sorted(by_code):
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"stock_name:{code}",))
+            cur.execute("SELECT valid_from, valid_to, name FROM stock_name WHERE code = %s ORDER BY valid_from",
+                        (code,))
+            stored = [tuple(r) for r in cur.fetchall()]
+            merged = merge_runs(stored + by_code[code])
+            if merged == stored:
+                continue
+            cur.execute("DELETE FROM stock_name WHERE code = %s", (code,))
+            cur.executemany("INSERT INTO stock_name (code, valid_from, valid_to, name, is_st) "
+                            "VALUES (%s, %s, %s, %s, %s)",
+                            [(code, *r, is_st_name(r[2])) for r in merged])
+            changed += 1
+    return changed
+
+
+def populate_from_bars() -> int:
+    """Build stock_name from the names stored in stock_1min_qfq, chunk by chunk (idempotent)."""
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT format('%I.%I', chunk_schema, chunk_name)
+                FROM timescaledb_information.chunks
+                WHERE hypertable_name = 'stock_1min_qfq'
+                ORDER BY range_start
+            """)
+            chunks = [r[0] for r in cur.fetchall()]
+        conn.commit()
+
+        codes = 0
+        for chunk in tqdm(chunks, unit="chunk", desc="stock_name"):
+            with conn.cursor() as cur:
+                cur.execute(CHUNK_RUNS_SQL.format(chunk=chunk))
+                runs = cur.fetchall()
+            codes += record_runs(conn, runs)
+            conn.commit()
+    logger.info(f"stock_name populated from {len(chunks)} chunks ({codes} code updates).")
+    return codes
+
+
+def measure(sample_month: date) -> dict:
+    """Table size and the time of one monthly aggregation of `sample_month`."""
+    start = datetime(sample_month.year, sample_month.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT hypertable_size('stock_1min_qfq')")
+            size = cur.fetchone()[0]
+            name = "last(name, time) AS name," if db.has_name_column(conn) else ""
+            t0 = time.perf_counter()
+            cur.execute(MONTHLY_SQL.format(table="stock_1min_qfq", name=name), (start, end))
+            rows = cur.fetchone()[0]
+            elapsed = time.perf_counter() - t0
+    return {"size": size, "aggregate_seconds": elapsed, "aggregate_rows": rows}
+
+
+def _rewrite_chunks():
+    """Reclaim the dropped column: recompress compressed chunks, VACUUM FULL the others."""
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        chunks = conn.execute("""
+            SELECT format('%I.%I', chunk_schema, chunk_name), is_compressed
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = 'stock_1min_qfq'
+            ORDER BY range_start
+        """).fetchall()
+        for chunk, compressed in tqdm(chunks, unit="chunk", desc="rewrite"):
+            if compressed:
+                conn.execute("SELECT decompress_chunk(%s::regclass)", (chunk,))
+                conn.execute("SELECT compress_chunk(%s::regclass)", (chunk,))
+            else:
+                conn.execute(f"VACUUM FULL {chunk}")
+
+
+def migrate(sample_month: date, rewrite_chunks: bool = False, rebuild_aggregate: bool = False) -> dict:
+    """Move names out of stock_1min_qfq (see module docstring). Returns the before/after report."""
+    before = measure(sample_month)
+    populate_from_bars()
+
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.stock_monthly_kline')")
+            if cur.fetchone()[0] is not None:
+                logger.warning("Dropping stock_monthly_kline: it aggregates the name column.")
+                cur.execute("DROP MATERIALIZED VIEW stock_monthly_kline;")
+            cur.execute("ALTER TABLE stock_1min_qfq DROP COLUMN IF EXISTS name;")
+        conn.commit()
+    config.NAME_STORAGE = "dimension"
+    logger.info("Dropped stock_1min_qfq.name; set NAME_STORAGE=dimension for the loader.")
+
+    if rewrite_chunks:
+        _rewrite_chunks()
+    if rebuild_aggregate:
+        # Imported here: aggregate configures logging when imported
+        from . import aggregate
+        aggregate.run_aggregation()
+
+    after = measure(sample_month)
+    report = {"before": before, "after": after}
+    logger.info(f"Name normalization report (sample month {sample_month:%Y-%m}):\n{format_report(report)}")
+    return report
+
+
+def format_report(report: dict) -> str:
+    before, after = report["before"], report["after"]
+    lines = [f"{'':<24}{'before':>14}{'after':>14}{'change':>10}"]
+    for label, key, fmt in (("table size (MB)", "size", lambda v: v / 1e6),
+                            ("monthly aggregate (s)", "aggregate_seconds", lambda v: v)):
+        b, a = fmt(before[key]), fmt(after[key])
+        lines.append(f"{label:<24}{b:>14.2f}{a:>14.2f}{(a - b) / b if b else 0:>10.1%}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Maintain the stock_name dimension table.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--populate", action="store_true", help="Build stock_name from the stored bars.")
+    group.add_argument("--migrate", action="store_true", help="Populate, then drop the name column (see docstring).")
+    parser.add_argument("--sample-month", type=lambda s: datetime.strptime(s, "%Y-%m").date(),
+                        default=date(date.today().year - 1, 1, 1),
+                        help="Month aggregated for the before/after report (YYYY-MM).")
+    parser.add_argument("--rewrite-chunks", action="store_true", help="Rewrite chunks to reclaim the space.")
+    parser.add_argument("--rebuild-aggregate", action="store_true",
+                        help="Recreate stock_monthly_kline without the name column (full backfill).")
+    args = parser.parse_args()
+    db.init_db()
+    if args.populate:
+        populate_from_bars()
+    else:
+        migrate(args.sample_month, args.rewrite_chunks, args.rebuild_aggregate)
@@ -0,0 +1,228 @@
+"""
+Typed bar access: get_bars(codes, start, end, freq) -> Bars.
+
+    bars = get_bars(["600000.SH", "000001.SZ"], start="2015-01-01", freq="monthly")
+    bars.series("600000.SH")                # float64 closes, oldest first (a view)
+    bars.tail(24).to_frame()                # last 24 bars per code as a DataFrame
+
+freq is a K-line timeframe (kline.TIMEFRAMES) or '1min' for stock_1min_qfq;
+bars whose bucket start lies in [start, end] are returned (None: unbounded).
+
+Rows are streamed through a server-side (named) cursor, ITERSIZE at a time,
+into a NumPy record block and finally into contiguous arrays: time as
+datetime64[us], open/high/low/close/amount as float64 and volume as int64.
+The server sends the NUMERIC columns as float8, the bucket as epoch
+microseconds and each code as its position in the request, so no Decimal,
+datetime or per-row code string is kept, and only one block of Python values
+exists at a time. Bars of one code are a contiguous slice (offsets), so
+per-code access does not scan the panel.
+
+`python -m data_infra.query --benchmark --codes 500` compares latency and
+peak Python memory (tracemalloc) with the pd.read_sql path the readers used
+before.
+"""
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import db
+from . import kline
+
+logger = logging.getLogger(__name__)
+
+# Rows per fetch from the server-side cursor
+ITERSIZE = 50000
+
+# freq -> (table or view, bucket column)
+FREQS = {name: (tf.view, tf.column) for name, tf in kline.TIMEFRAMES.items()}
+FREQS["1min"] = ("stock_1min_qfq", "time")
+
+COLUMNS = ("time", "open", "high", "low", "close", "volume", "amount")
+
+_RECORD = np.dtype([("k", "i4"), ("time", "i8"), ("open", "f8"), ("high", "f8"), ("low", "f8"),
+                    ("close", "f8"), ("volume", "i8"), ("amount", "f8")])
+
+BARS_SQL = """
+    SELECT array_position(%(codes)s::text[], code)::int4,
+           (extract(epoch FROM {column}) * 1000000)::int8,
+           coalesce(open::float8, 'NaN'), coalesce(high::float8, 'NaN'),
+           coalesce(low::float8, 'NaN'), coalesce(close::float8, 'NaN'),
+           coalesce(volume, 0)::int8, coalesce(amount::float8, 'NaN')
+    FROM {table}
+    WHERE code = ANY(%(codes)s::text[]){range}
+    ORDER BY 1, {column}
+"""
+
+
+@dataclass
+class Bars:
+    """Bars of several codes, grouped by code and ordered by time (see module docstring)."""
+    freq: str
+    codes: list             # requested codes, deduplicated, in request order
+    offsets: np.ndarray     # bars of codes[i] are rows offsets[i]:offsets[i + 1]
+    time: np.ndarray        # datetime64[us], bucket start
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray      # int64
+    amount: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def _slice(self, code: str) -> slice:
+        i = self.codes.index(code)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def counts(self) -> dict:
+        """{code: number of bars}, codes without bars included."""
+        return dict(zip(self.codes, np.diff(self.offsets).tolist()))
+
+    def series(self, code: str, column: str = "close") -> np.ndarray:
+        """One column of one code's bars (a view, oldest first). ValueError for a code not requested."""
+        return getattr(self, column)[self._slice(code)]
+
+    def tail(self, n: int) -> "Bars":
+        """The last n bars of every code."""
+        counts = np.diff(self.offsets)
+        kept = np.minimum(counts, n)
+        index = np.concatenate([np.arange(end - k, end) for end, k in zip(self.offsets[1:], kept)]
+                               or [np.empty(0, dtype=np.int64)])
+        return Bars(self.freq, list(self.codes), np.concatenate([[0], np.cumsum(kept)]),
+                    **{c: getattr(self, c)[index] for c in COLUMNS})
+
+    def to_frame(self, code: str = None):
+        """DataFrame of all bars (code column) or of one code's bars (indexed by time)."""
+        import pandas as pd
+        if code is not None:
+            part = self._slice(code)
+            return pd.DataFrame({c: getattr(self, c)[part] for c in COLUMNS[1:]},
+                                index=pd.Index(self.time[part], name="time"))
+        codes = np.repeat(np.array(self.codes, dtype=object), np.diff(self.offsets))
+        return pd.DataFrame({"code": codes, **{c: getattr(self, c) for c in COLUMNS}})
+
+
+def _empty(freq: str, codes) -> Bars:
+    return Bars(freq, codes, np.zeros(len(codes) + 1, dtype=np.int64),
+                **{c: np.empty(0, dtype="datetime64[us]" if c == "time" else _RECORD[c]) for c in COLUMNS})
+
+
+def _fetch(conn, query: str, params: dict, freq: str, codes) -> Bars:
+    blocks = []
+    with conn.cursor(name="get_bars") as cur:
+        cur.itersize = ITERSIZE
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(ITERSIZE)
+            if not rows:
+                break
+            blocks.append(np.array(rows, dtype=_RECORD))
+    if not blocks:
+        return _empty(freq, codes)
+    records = np.concatenate(blocks)
+    del blocks
+    counts = np.bincount(records["k"] - 1, minlength=len(codes))
+    columns = {c: np.ascontiguousarray(records[c]) for c in COLUMNS}
+    columns["time"] = columns["time"].view("datetime64[us]")
+    return Bars(freq, codes, np.concatenate([[0], np.cumsum(counts)]), **columns)
+
+
+def get_bars(codes, start=None, end=None, freq: str = kline.DEFAULT_TIMEFRAME, conn=None) -> Bars:
+    """
+    Bars of `codes` (standard codes, e.g. '600000.SH') with bucket start in
+    [start, end] at `freq`. Uses `conn` if given (the server-side cursor needs
+    a transaction, i.e. no autocommit), else its own connection.
+    Raises ValueError for an unknown freq.
+    """
+    if freq not in FREQS:
+        raise ValueError(f"Unknown freq '{freq}' (choose from {', '.join(FREQS)})")
+    codes = list(dict.fromkeys(codes))
+    if not codes:
+        return _empty(freq, codes)
+    table, column = FREQS[freq]
+    conditions = ""
+    params = {"codes": codes}
+    if start is not None:
+        conditions += f" AND {column} >= %(start)s"
+        params["start"] = start
+    if end is not None:
+        conditions += f" AND {column} <= %(end)s"
+        params["end"] = end
+    query = BARS_SQL.format(table=table, column=column, range=conditions)
+    if conn is not None:
+        return _fetch(conn, query, params, freq, codes)
+    with db.get_db_connection() as own:
+        return _fetch(own, query, params, freq, codes)
+
+
+def _read_sql_bars(codes, freq: str):
+    """The pd.read_sql path get_bars replaces: Decimal columns converted to float afterwards."""
+    import pandas as pd
+    table, column = FREQS[freq]
+    with db.get_db_connection() as conn:
+        df = pd.read_sql(f"""
+            SELECT code, {column} AS time, open, high, low, close, volume, amount
+            FROM {table}
+            WHERE code = ANY(%s)
+            ORDER BY code, {column}
+        """, conn, params=(codes,))
+    for c in ("open", "high", "low", "close", "amount"):
+        df[c] = df[c].astype(float)
+    return df
+
+
+def _measure(fetch):
+    """(result, seconds, peak traced bytes) of fetch()."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fetch()
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark(codes: int = 500, freq: str = kline.DEFAULT_TIMEFRAME, seed: int = 42) -> list:
+    """
+    Fetch all bars of `codes` random codes with pd.read_sql and with get_bars.
+    Returns [{method, rows, seconds, peak_mb}].
+    """
+    table, _ = FREQS[freq]
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT DISTINCT code FROM {kline.TIMEFRAMES['monthly'].view} ORDER BY code")
+            available = [r[0] for r in cur.fetchall()]
+    sample = random.Random(seed).sample(available, min(codes, len(available)))
+    logger.info(f"Fetching {freq} bars of {len(sample)} codes from {table}...")
+
+    results = []
+    for method, fetch in (("pd.read_sql", lambda: _read_sql_bars(sample, freq)),
+                          ("get_bars", lambda: get_bars(sample, freq=freq))):
+        result, seconds, peak = _measure(fetch)
+        results.append({"method": method, "rows": len(result), "seconds": seconds, "peak_mb": peak / 1e6})
+    return results
+
+
+def format_benchmark(results) -> str:
+    lines = [f"{'method':<14}{'rows':>12}{'seconds':>10}{'peak MB':>10}"]
+    for r in results:
+        lines.append(f"{r['method']:<14}{r['rows']:>12}{r['seconds']:>10.2f}{r['peak_mb']:>10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Typed bar access (get_bars) and its benchmark.")
+    parser.add_argument("--benchmark", action="store_true", help="Compare latency and peak memory with pd.read_sql.")
+    parser.add_argument("--codes", type=int, default=500, help="Random codes to fetch.")
+    parser.add_argument("--freq", default=kline.DEFAULT_TIMEFRAME, choices=list(FREQS))
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.error("nothing to do (use --benchmark)")
+    print(format_benchmark(benchmark(args.codes, args.freq)))
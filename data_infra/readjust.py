@@ -0,0 +1,250 @@
+"""
+Adjustment-aware reload of changed archives (main --readjust).
+
+Forward-adjusted (qfq) bars change retroactively after every dividend or
+split, but the normal load path merges with ON CONFLICT DO NOTHING and keeps
+the stale prices. Re-adjustment mode digests the incoming bars per
+(code, trading day) and compares them with day_digest:
+
+- days whose digest matches are skipped without touching stock_1min_qfq;
+- changed (or new) days are deleted and rewritten, together with their
+  digests, in one transaction per CSV member;
+- compressed chunks holding changed days are decompressed first and queued
+  in compression_queue, then recompressed at the end of the run;
+- only the months of stock_monthly_kline containing changed days are refreshed.
+
+Days without a stored digest count as changed. After an initial load, record
+the digests once with --seed-digests (nothing is rewritten), so the first
+re-adjustment only rewrites the days that actually moved.
+"""
+import hashlib
+import logging
+import os
+import time
+import traceback
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from tqdm import tqdm
+
+from . import compression
+from . import config
+from . import db
+from . import loader
+from . import scheduling
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DDL = """
+    CREATE TABLE IF NOT EXISTS day_digest (
+        code TEXT NOT NULL,
+        day DATE NOT NULL,
+        digest TEXT NOT NULL,       -- SHA-1 of the day's cleaned bars in time order
+        row_count INTEGER,
+        updated_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (code, day)
+    );
+"""
+
+
+def ensure_digest_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(DIGEST_DDL)
+    conn.commit()
+
+
+def _bar_time(row) -> str:
+    """Zero-padded time of a cleaned row (clean_row_data also accepts '2000-1-4 9:31:00')."""
+    t = row[loader.IDX_TIME]
+    if len(t) != 19:
+        t = datetime.strptime(t, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    return t
+
+
+def group_days(rows):
+    """Cleaned rows -> {(code, day): [rows in time order]}."""
+    days = defaultdict(list)
+    for row in rows:
+        t = _bar_time(row)
+        days[(row[loader.IDX_CODE], date.fromisoformat(t[:10]))].append((t, row))
+    return {key: [row for _, row in sorted(bars, key=lambda b: b[0])] for key, bars in days.items()}
+
+
+def day_digest(rows) -> str:
+    """Digest of one (code, day): every field of every bar, so price, volume and name changes all count."""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update("\x1f".join(row).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def changed_days(conn, digests):
+    """Keys of `digests` ({(code, day): digest}) whose stored digest differs or is missing."""
+    if not digests:
+        return []
+    codes = sorted({code for code, _ in digests})
+    first, last = min(day for _, day in digests), max(day for _, day in digests)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT code, day, digest FROM day_digest
+            WHERE code = ANY(%s) AND day BETWEEN %s AND %s
+        """, (codes, first, last))
+        stored = {(code, day): digest for code, day, digest in cur.fetchall()}
+    return sorted(key for key, digest in digests.items() if stored.get(key) != digest)
+
+
+def store_digests(conn, digests, days, counts, overwrite=True):
+    """Upsert the digests of `days` (caller commits); overwrite=False keeps stored digests."""
+    with conn.cursor() as cur:
+        cur.executemany(f"""
+            INSERT INTO day_digest (code, day, digest, row_count, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (code, day) DO {"UPDATE SET digest=EXCLUDED.digest, row_count=EXCLUDED.row_count, "
+                                        "updated_at=NOW()" if overwrite else "NOTHING"};
+        """, [(code, day, digests[(code, day)], counts[(code, day)]) for code, day in days])
+
+
+def _decompress_days(conn, days) -> int:
+    """Decompress the chunks holding `days` (autocommit connection). Returns the number decompressed."""
+    keys = set()
+    for _, day in days:
+        start = datetime.combine(day, datetime.min.time())
+        keys |= scheduling.chunk_keys((start, start + timedelta(days=1, microseconds=-1)))
+    return sum(compression.decompress_for_load(conn, *scheduling.key_window({k})) for k in sorted(keys))
+
+
+def _rewrite_days(conn, days, bars, provenance):
+    """Delete the bars of `days` and insert the new ones (caller commits, then provenance.commit())."""
+    with conn.cursor() as cur:
+        cur.executemany("""
+            DELETE FROM stock_1min_qfq
+            WHERE code = %s AND time >= %s AND time < %s
+        """, [(code, day, day + timedelta(days=1)) for code, day in days])
+    rows = (row for key in days for row in bars[key])
+    provenance.batch_inserted(db.stream_insert(conn, provenance.observe(rows)))
+
+
+def readjust_archive(zip_path: str, seed: bool = False) -> dict:
+    """
+    Worker function: re-adjust one archive (see module docstring).
+
+    With seed=True only missing digests are recorded and no bar is rewritten.
+    Returns a dict with status, days, changed, decompressed and months (the
+    first day of every month with changed days).
+    """
+    zip_filename = os.path.basename(zip_path)
+    result = {"status": "FAILED", "days": 0, "changed": 0, "decompressed": 0, "months": set()}
+    stats = loader.ParseStats()
+    provenance = loader.Provenance()
+    started = time.perf_counter()
+
+    try:
+        file_size, last_modified, fingerprint = loader._file_stat(zip_path)
+    except Exception as e:
+        logger.error(f"[{zip_filename}] Failed to get file stats: {e}")
+        return result
+
+    conn = db.get_db_connection()
+    admin = None
+    error_msg = None
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            for member in loader.list_csv_members(z):
+                bars = group_days(loader.iter_clean_rows(z, zip_filename, stats, members=[member]))
+                digests = {key: day_digest(rows) for key, rows in bars.items()}
+                counts = {key: len(rows) for key, rows in bars.items()}
+                result["days"] += len(digests)
+
+                if seed:
+                    store_digests(conn, digests, sorted(digests), counts, overwrite=False)
+                    conn.commit()
+                    continue
+
+                days = changed_days(conn, digests)
+                if not days:
+                    continue
+                if admin is None:
+                    admin = db.get_db_connection()
+                    admin.autocommit = True
+                result["decompressed"] += _decompress_days(admin, days)
+                _rewrite_days(conn, days, bars, provenance)
+                store_digests(conn, digests, days, counts)
+                conn.commit()
+                provenance.commit()
+                result["changed"] += len(days)
+                result["months"].update(day.replace(day=1) for _, day in days)
+        status, error_msg = loader.evaluate_status(stats.total_rows, stats.skipped_count)
+    except loader.HeaderMismatchError as he:
+        conn.rollback()
+        status, error_msg = "FAILED", str(he)
+    except Exception as e:
+        conn.rollback()
+        status, error_msg = "FAILED", str(e)
+        logger.error(f"[{zip_filename}] Critical Error: {traceback.format_exc()}")
+    finally:
+        if admin is not None:
+            admin.close()
+
+    result["status"] = status
+    provenance.elapsed = time.perf_counter() - started
+    if not seed:
+        loader.record_security(conn, provenance, zip_filename)
+    try:
+        if not seed:
+            loader.write_load_log(conn, zip_filename, status, stats.skipped_count, error_msg, file_size,
+                                  last_modified, fingerprint, provenance.columns(stats.total_rows))
+    except Exception as log_err:
+        logger.error(f"[{zip_filename}] Failed to write log: {log_err}")
+    finally:
+        conn.close()
+    return result
+
+
+def run_readjust(zip_paths, seed: bool = False) -> dict:
+    """
+    Re-adjust (or, with seed=True, record digests of) archives on MAX_WORKERS
+    processes, then recompress the chunks decompressed for it and refresh the
+    affected months of stock_monthly_kline. Returns the run totals.
+    """
+    with db.get_db_connection() as conn:
+        ensure_digest_table(conn)
+        conn.execute(compression.QUEUE_DDL)
+        conn.commit()
+
+    totals = {"days": 0, "changed": 0, "decompressed": 0, "failed": 0}
+    months = set()
+    tasks = [((zip_path, seed), scheduling.chunk_keys(scheduling.archive_time_range(zip_path)))
+             for zip_path in zip_paths]
+    logger.info(f"{'Seeding digests of' if seed else 'Re-adjusting'} {len(tasks)} archives "
+                f"with {config.MAX_WORKERS} workers...")
+    with ProcessPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+        completed = scheduling.run_tasks(executor, readjust_archive, tasks, max_in_flight=config.MAX_WORKERS)
+        with tqdm(total=len(tasks), unit="file") as pbar:
+            for (zip_path, _), future in completed:
+                filename = os.path.basename(zip_path)
+                try:
+                    result = future.result()
+                    for key in ("days", "changed", "decompressed"):
+                        totals[key] += result[key]
+                    months |= result["months"]
+                    if result["status"] == "FAILED":
+                        totals["failed"] += 1
+                    logger.info(f"Finished: {filename} ({result['changed']} of {result['days']} days rewritten)")
+                except Exception as e:
+                    totals["failed"] += 1
+                    logger.error(f"Worker exception for {filename}: {e}")
+                finally:
+                    pbar.update(1)
+
+    if not seed:
+        compression.recompress_queued()
+        # Imported here: aggregate configures logging when imported
+        from . import aggregate
+        aggregate.refresh_months(months)
+    logger.info(f"Re-adjustment: {totals['changed']} of {totals['days']} (code, day) rewritten, "
+                f"{totals['decompressed']} chunks decompressed, {len(months)} months refreshed, "
+                f"{totals['failed']} archives failed.")
+    return totals
@@ -0,0 +1,188 @@
+"""
+Targeted reload of a set of codes over a date range, without a reset.
+
+    python -m data_infra.reload --codes 600000.SH,sz000001 --start 2020-01-01 --end 2020-12-31
+
+1. The yearly archives overlapping the range are selected, and in them the
+   CSV members of the codes ('sh600000_2020.csv'; archives whose member names
+   do not carry a code are read in full and filtered by row).
+2. Only the compressed chunks of the range are decompressed (and queued in
+   compression_queue).
+3. The codes' bars in the range are deleted and reloaded from the members in
+   a single transaction, and their day_digest, stock_name and
+   security_master entries are refreshed. Only codes with bars in the
+   archives are deleted; a year of the range without an archive aborts the
+   reload, so nothing is deleted that cannot be reinserted.
+4. The decompressed chunks are recompressed and the months of
+   stock_monthly_kline covering the range are refreshed.
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+
+from . import compression
+from . import config
+from . import db
+from . import loader
+from . import names
+from . import readjust
+from . import scheduling
+from . import security_master
+from . import utils
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_code(code: str) -> str:
+    """Code as stored in stock_1min_qfq ('sh600000' and '600000.SH' are both accepted)."""
+    code = code.strip()
+    if config.STANDARDIZE_CODE and "." not in code:
+        return utils.transform_code(code)
+    return code
+
+
+def member_code(member: str):
+    """Stored code of a member named after its stock ('sh600000_2000.csv'), or None."""
+    stem = os.path.splitext(os.path.basename(member))[0].split("_")[0]
+    try:
+        return normalize_code(stem)
+    except ValueError:
+        return None
+
+
+def find_archives(start: date, end: date, data_dir: str = None):
+    """Archives under DATA_DIR whose time range overlaps [start, end] (days, inclusive)."""
+    lo, hi = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.max.time())
+    found = []
+    for zip_path in sorted(glob.glob(os.path.join(data_dir or config.DATA_DIR, "*_1min.zip"))):
+        time_range = scheduling.archive_time_range(zip_path)
+        if time_range is None or (time_range[0] <= hi and time_range[1] >= lo):
+            found.append(zip_path)
+    return found
+
+
+def missing_years(zip_paths, start: date, end: date):
+    """Years of [start, end] no archive covers ([] when an archive's range is unknown)."""
+    ranges = [scheduling.archive_time_range(p) for p in zip_paths]
+    if any(r is None for r in ranges):
+        return []
+    return [y for y in range(start.year, end.year + 1)
+            if not any(lo.year <= y <= hi.year for lo, hi in ranges)]
+
+
+def select_members(z: zipfile.ZipFile, codes):
+    """CSV members holding `codes`: by member name, or all of them if names do not carry codes."""
+    members = loader.list_csv_members(z)
+    named = {m: member_code(m) for m in members}
+    if members and all(c is None for c in named.values()):
+        return members
+    return [m for m in members if named[m] in codes]
+
+
+def read_bars(zip_paths, codes, start: date, end: date, stats: loader.ParseStats):
+    """{(code, day): [rows]} of `codes` within [start, end] from the archives (see readjust.group_days)."""
+    bars = {}
+    for zip_path in zip_paths:
+        zip_filename = os.path.basename(zip_path)
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            members = select_members(z, codes)
+            rows = (r for r in loader.iter_clean_rows(z, zip_filename, stats, members=members)
+                    if r[loader.IDX_CODE] in codes)
+            for (code, day), day_rows in readjust.group_days(rows).items():
+                if start <= day <= end:
+                    bars[(code, day)] = day_rows
+    return bars
+
+
+def _months(start: date, end: date):
+    """First day of every month overlapping [start, end]."""
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        yield month
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def reload_window(codes, start: date, end: date, data_dir: str = None) -> dict:
+    """
+    Delete and reload the bars of `codes` in [start, end] (see module docstring).
+    Returns a dict with archives, days, deleted and inserted.
+    """
+    codes = {normalize_code(c) for c in codes}
+    started = time.perf_counter()
+    zip_paths = find_archives(start, end, data_dir)
+    if not zip_paths:
+        raise FileNotFoundError(f"No archive in {data_dir or config.DATA_DIR} covers {start} .. {end}")
+    missing = missing_years(zip_paths, start, end)
+    if missing:
+        raise FileNotFoundError(f"No archive in {data_dir or config.DATA_DIR} for {', '.join(map(str, missing))}; "
+                                f"narrow the range or add the archives.")
+
+    stats = loader.ParseStats()
+    bars = read_bars(zip_paths, codes, start, end, stats)
+    logger.info(f"Read {sum(len(r) for r in bars.values())} bars ({len(bars)} code-days) for "
+                f"{len(codes)} codes from {len(zip_paths)} archives; {stats.skipped_count} rows skipped.")
+
+    if not bars:
+        # Nothing to reload from: keep the stored bars rather than deleting them
+        logger.warning("No bars found for these codes in the range; nothing changed.")
+        return {"archives": len(zip_paths), "days": 0, "deleted": 0, "inserted": 0}
+    # Codes without bars in the archives keep their stored bars
+    reloaded = sorted({code for code, _ in bars})
+    if len(reloaded) < len(codes):
+        logger.warning(f"No bars in the archives for {', '.join(sorted(codes - set(reloaded)))}; left unchanged.")
+
+    lo = datetime.combine(start, datetime.min.time())
+    hi = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    with db.get_db_connection() as admin:
+        admin.autocommit = True
+        admin.execute(compression.QUEUE_DDL)
+        decompressed = compression.decompress_for_load(admin, lo, hi)
+
+    with db.get_db_connection() as conn:
+        readjust.ensure_digest_table(conn)
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM stock_1min_qfq
+                WHERE code = ANY(%s) AND time >= %s AND time < %s
+            """, (reloaded, lo, hi))
+            deleted = cur.rowcount
+            cur.execute("""
+                DELETE FROM day_digest
+                WHERE code = ANY(%s) AND day BETWEEN %s AND %s
+            """, (reloaded, start, end))
+        days = sorted(bars)
+        provenance = loader.Provenance()
+        inserted = db.stream_insert(conn, provenance.observe(row for key in days for row in bars[key]))
+        provenance.commit()
+        readjust.store_digests(conn, {k: readjust.day_digest(v) for k, v in bars.items()}, days,
+                               {k: len(v) for k, v in bars.items()})
+        names.record_runs(conn, provenance.name_runs.runs())
+        security_master.record_coverage(conn, provenance.coverage)
+        conn.commit()
+    logger.info(f"Replaced {deleted} rows with {inserted} rows ({decompressed} chunks decompressed).")
+
+    compression.recompress_queued()
+    # Imported here: aggregate configures logging when imported
+    from . import aggregate
+    aggregate.refresh_months(_months(start, end))
+    logger.info(f"Reload finished in {time.perf_counter() - started:.1f}s.")
+    return {"archives": len(zip_paths), "days": len(days), "deleted": deleted, "inserted": inserted}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Reload the bars of some codes over a date range.")
+    parser.add_argument("--codes", required=True, action="append",
+                        help="Comma-separated codes, e.g. 600000.SH,sz000001 (repeatable).")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="First day (YYYY-MM-DD).")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="Last day, inclusive (YYYY-MM-DD).")
+    parser.add_argument("--data-dir", default=config.DATA_DIR, help="Archive directory (default: DATA_DIR).")
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error("--end is before --start")
+    reload_window([c for arg in args.codes for c in arg.split(",") if c.strip()],
+                  args.start, args.end, args.data_dir)
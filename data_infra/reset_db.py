@@ -15,7 +15,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def reset_tables():
-    confirm = input("⚠️  DANGER: This will DELETE ALL DATA in 'stock_1min_qfq' and 'load_log'.\nAre you sure? (type 'yes' to proceed): ")
+    confirm = input("⚠️  DANGER: This will DELETE ALL DATA in 'stock_1min_qfq', 'load_log', 'load_member_log', 'day_digest', 'stock_name' and the security master.\nAre you sure? (type 'yes' to proceed): ")
     if confirm != "yes":
         print("Operation cancelled.")
         return
@@ -28,6 +28,10 @@ def reset_tables():
             
             logger.info("Clearing load_log...")
             cur.execute("TRUNCATE TABLE load_log;")
+            for table in ("load_member_log", "day_digest", "stock_name", "security_master", "security_month"):
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0] is not None:
+                    cur.execute(f"TRUNCATE TABLE {table};")
             
         conn.commit()
         logger.info("Tables reset successfully. Ready for fresh load.")
@@ -0,0 +1,227 @@
+"""
+Chunk-affinity scheduling of loader tasks and per-worker lock-wait sampling.
+
+Every task (an archive, or one CSV member of it) covers a time range, and so a
+set of stock_1min_qfq chunks. Archives are yearly ('2000_1min.zip') and every
+member of an archive spans the same year, so tasks are grouped by chunk set.
+run_tasks() keeps at most `max_in_flight` tasks submitted and always submits
+from the group overlapping the fewest chunks already being written. That way
+concurrent workers mostly write to different chunks (and their indexes)
+instead of all piling onto the same year.
+
+LockWaitSampler polls pg_stat_activity for the loader's connections (their
+application_name is '<DB_APPLICATION_NAME>-<pid>', see db.get_db_connection)
+and reports, per worker process, how much of its active time was spent waiting
+on heavyweight locks (Lock) and on buffer/index latches (LWLock).
+"""
+import csv
+import io
+import logging
+import math
+import os
+import re
+import threading
+import zipfile
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+
+from . import config
+from . import db
+
+logger = logging.getLogger(__name__)
+
+_YEARLY_ARCHIVE = re.compile(r"^(\d{4})_1min\.zip$")
+_EPOCH = datetime(1970, 1, 1)
+
+
+def scan_time_range(zip_path: str):
+    """
+    Quick scan: (first, last) timestamp of the first CSV member, or None.
+    Only used for archives whose name does not give the year.
+    """
+    from .loader import IDX_TIME, list_csv_members
+
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            members = list_csv_members(z)
+            if not members:
+                return None
+            with z.open(members[0]) as f:
+                reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig'))
+                next(reader, None)  # header
+                first = last = None
+                for row in reader:
+                    if len(row) > IDX_TIME and row[IDX_TIME].strip():
+                        last = row[IDX_TIME].strip()
+                        first = first or last
+        if first is None:
+            return None
+        return (datetime.strptime(first, "%Y-%m-%d %H:%M:%S"),
+                datetime.strptime(last, "%Y-%m-%d %H:%M:%S"))
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+        logger.debug(f"Time range scan failed for {zip_path}: {e}")
+        return None
+
+
+def archive_time_range(zip_path: str):
+    """(start, end) covered by an archive: from a '<year>_1min.zip' name, else a quick scan."""
+    m = _YEARLY_ARCHIVE.match(os.path.basename(zip_path))
+    if m:
+        year = int(m.group(1))
+        return datetime(year, 1, 1), datetime(year, 12, 31, 23, 59, 59)
+    return scan_time_range(zip_path)
+
+
+def chunk_keys(time_range) -> frozenset:
+    """
+    Approximate chunk ids (CHUNK_INTERVAL buckets since the Unix epoch, as
+    TimescaleDB aligns them; the interval is synced from the table at startup)
+    touched by a time range. Unknown range -> empty set.
+    """
+    if time_range is None:
+        return frozenset()
+    interval = db.CHUNK_INTERVAL.total_seconds()
+    start, end = ((t - _EPOCH).total_seconds() for t in time_range)
+    return frozenset(range(math.floor(start / interval), math.floor(end / interval) + 1))
+
+
+def key_window(keys):
+    """Time window [start, end) covered by a set of chunk keys."""
+    return (_EPOCH + db.CHUNK_INTERVAL * min(keys), _EPOCH + db.CHUNK_INTERVAL * (max(keys) + 1))
+
+
+class ChunkAffinityScheduler:
+    """
+    Hand out tasks so that running tasks overlap in as few chunks as possible.
+
+    Tasks with the same chunk set form a group (kept in submission order); the
+    next task comes from the group with the smallest overlap with the chunks in
+    flight, ties going to the earliest group. With policy 'fifo' everything is
+    one group, i.e. plain submission order.
+    """
+
+    def __init__(self, tasks, policy: str = "chunk"):
+        self.groups = OrderedDict()
+        for task, keys in tasks:
+            key = keys if policy == "chunk" else frozenset()
+            self.groups.setdefault(key, deque()).append(task)
+        self.busy = Counter()
+        self._running = {}
+
+    def __len__(self):
+        return sum(len(q) for q in self.groups.values())
+
+    def next_task(self):
+        best, best_overlap = None, None
+        for keys, q in self.groups.items():
+            if not q:
+                continue
+            overlap = sum(self.busy[k] for k in keys)
+            if best is None or overlap < best_overlap:
+                best, best_overlap = keys, overlap
+                if overlap == 0:
+                    break
+        if best is None:
+            return None
+        task = self.groups[best].popleft()
+        self.busy.update(best)
+        self._running[id(task)] = best
+        return task
+
+    def release(self, task):
+        self.busy.subtract(self._running.pop(id(task)))
+
+
+def run_tasks(executor, fn, tasks, max_in_flight: int, policy: str = None, on_submit=None):
+    """
+    Submit fn(*args) for `tasks` = [(args tuple, chunk keys)] through a
+    ChunkAffinityScheduler, keeping at most max_in_flight futures pending.
+    on_submit(args, keys), if given, runs right before each submission and
+    may return replacement args for the call (the original args are yielded).
+
+    Yields (args, future) in completion order.
+    """
+    scheduler = ChunkAffinityScheduler(tasks, policy or config.SCHEDULING)
+    keys_of = {id(args): keys for args, keys in tasks}
+    in_flight = {}
+
+    def fill():
+        while len(in_flight) < max_in_flight:
+            args = scheduler.next_task()
+            if args is None:
+                break
+            call_args = (on_submit(args, keys_of[id(args)]) if on_submit else None) or args
+            in_flight[executor.submit(fn, *call_args)] = args
+
+    fill()
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        finished = [(in_flight.pop(f), f) for f in done]
+        for args, _ in finished:
+            scheduler.release(args)
+        fill()
+        yield from finished
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Sample pg_stat_activity every `interval` seconds in the background.
+
+    A sample of an active loader backend counts as `interval` seconds of
+    activity for its worker; samples with wait_event_type Lock/LWLock count
+    as lock wait. This is an estimate, good enough to compare scheduling
+    policies on the same data.
+    """
+
+    def __init__(self, interval: float = None):
+        super().__init__(name="lock-wait-sampler", daemon=True)
+        self.interval = interval if interval is not None else config.LOCK_SAMPLE_INTERVAL
+        self.active = Counter()
+        self.waits = defaultdict(Counter)   # worker -> {wait_event_type: samples}
+        self.events = defaultdict(Counter)  # worker -> {wait_event: samples}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with db.get_db_connection() as conn:
+                conn.autocommit = True
+                while not self._stop_event.wait(self.interval):
+                    rows = conn.execute("""
+                        SELECT application_name, wait_event_type, wait_event
+                        FROM pg_stat_activity
+                        WHERE application_name LIKE %s
+                          AND state = 'active'
+                          AND pid <> pg_backend_pid()
+                    """, (f"{config.DB_APPLICATION_NAME}-%",)).fetchall()
+                    self.record(rows)
+        except Exception as e:
+            logger.warning(f"Lock-wait sampling stopped: {e}")
+
+    def record(self, rows):
+        for worker, wait_type, wait_event in rows:
+            self.active[worker] += 1
+            if wait_type in ("Lock", "LWLock"):
+                self.waits[worker][wait_type] += 1
+                self.events[worker][f"{wait_type}:{wait_event}"] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self) -> str:
+        if not self.active:
+            return "Lock waits: no samples."
+        lines = [f"{'worker':<24}{'active s':>10}{'Lock s':>10}{'LWLock s':>10}{'wait %':>8}  top wait"]
+        for worker in sorted(self.active):
+            active = self.active[worker] * self.interval
+            lock = self.waits[worker]["Lock"] * self.interval
+            lwlock = self.waits[worker]["LWLock"] * self.interval
+            top = self.events[worker].most_common(1)
+            lines.append(f"{worker:<24}{active:>10.1f}{lock:>10.1f}{lwlock:>10.1f}"
+                         f"{(lock + lwlock) / active:>8.1%}  {top[0][0] if top else '-'}")
+        total_active = sum(self.active.values())
+        total_wait = sum(sum(c.values()) for c in self.waits.values())
+        lines.append(f"Total: {total_wait * self.interval:.1f}s of {total_active * self.interval:.1f}s "
+                     f"active backend time waiting on locks ({total_wait / total_active:.1%}).")
+        return "\n".join(lines)
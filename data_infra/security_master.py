@@ -0,0 +1,161 @@
+"""
+Security master: one row per code with the facts downstream stages used to
+recompute at query time.
+
+    code6, exchange, board      stock_code.classify_cn_stock (NULL if not an A-share code)
+    first_bar, last_bar         first and last 1-minute bar loaded
+    months_of_history           months with at least one bar (security_month)
+    name, is_st                 current name and ST status (latest stock_name run)
+
+The name and ST history of a code are its runs in stock_name (see names.py).
+
+Loads keep it up to date: loader.Provenance collects the per-code coverage of
+every load (BarCoverage) and record_coverage() merges it right after the name
+runs. first_bar/last_bar only widen; a reload that removes bars at the edges
+of the history is reflected after a rebuild:
+
+    python -m data_infra.security_master --rebuild
+"""
+import argparse
+import logging
+import re
+from datetime import date
+
+from tqdm import tqdm
+
+from . import db
+from . import names
+from . import stock_code
+
+logger = logging.getLogger(__name__)
+
+# Coverage of one chunk, for rebuilds
+CHUNK_COVERAGE_SQL = """
+    SELECT code, min(time), max(time), array_agg(DISTINCT to_char(time, 'YYYY-MM'))
+    FROM {chunk}
+    GROUP BY code
+"""
+
+# Derived columns of the touched codes: month count and the latest name run
+REFRESH_SQL = """
+    UPDATE security_master m
+    SET months_of_history = (SELECT count(*) FROM security_month s WHERE s.code = m.code),
+        (name, is_st) = (SELECT n.name, n.is_st FROM stock_name n
+                         WHERE n.code = m.code ORDER BY n.valid_from DESC LIMIT 1),
+        updated_at = NOW()
+    WHERE m.code = ANY(%s)
+"""
+
+
+class BarCoverage:
+    """First/last bar and the months ('YYYY-MM') with bars, per code."""
+
+    def __init__(self):
+        self.spans = {}     # code -> [first time, last time, last month added]
+        self.months = set()
+
+    def add(self, code: str, t: str):
+        span = self.spans.get(code)
+        if span is None:
+            self.spans[code] = [t, t, t[:7]]
+            self.months.add((code, t[:7]))
+            return
+        if t < span[0]:
+            span[0] = t
+        elif t > span[1]:
+            span[1] = t
+        if t[:7] != span[2]:
+            span[2] = t[:7]
+            self.months.add((code, span[2]))
+
+    def add_span(self, code: str, first: str, last: str, months):
+        """Bars of one code from first to last, in `months` ('YYYY-MM')."""
+        span = self.spans.get(code)
+        if span is None:
+            self.spans[code] = [first, last, last[:7]]
+        else:
+            span[0], span[1] = min(span[0], first), max(span[1], last)
+        self.months.update((code, m) for m in months)
+
+
+def classify(code: str):
+    """(code6, exchange, board) of a stored code ('600000.SH', 'sh600000'), or Nones."""
+    try:
+        info = stock_code.classify_cn_stock(re.sub(r"\D", "", code))
+    except ValueError:
+        return None, None, None
+    return info.code6, info.exchange, info.board
+
+
+def record_coverage(conn, coverage: BarCoverage) -> int:
+    """
+    Merge a load's coverage into security_master and security_month, then
+    refresh the derived columns of its codes (caller commits, after
+    names.record_runs so the current name is up to date). Returns the codes touched.
+    """
+    codes = sorted(coverage.spans)
+    if not codes:
+        return 0
+    with conn.cursor() as cur:
+        cur.executemany("""
+            INSERT INTO security_master (code, code6, exchange, board, first_bar, last_bar, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (code) DO UPDATE SET
+                first_bar = LEAST(security_master.first_bar, EXCLUDED.first_bar),
+                last_bar = GREATEST(security_master.last_bar, EXCLUDED.last_bar);
+        """, [(code, *classify(code), coverage.spans[code][0], coverage.spans[code][1]) for code in codes])
+        cur.executemany("""
+            INSERT INTO security_month (code, month) VALUES (%s, %s)
+            ON CONFLICT (code, month) DO NOTHING;
+        """, [(code, date(int(month[:4]), int(month[5:7]), 1)) for code, month in sorted(coverage.months)])
+        cur.execute(REFRESH_SQL, (codes,))
+    return len(codes)
+
+
+def _refresh_st_flags(conn) -> int:
+    """Set stock_name.is_st of runs recorded before the column existed. Returns the runs updated."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT name FROM stock_name WHERE is_st IS NULL")
+        flags = [(names.is_st_name(name), name) for (name,) in cur.fetchall()]
+        cur.executemany("UPDATE stock_name SET is_st = %s WHERE name = %s AND is_st IS NULL", flags)
+    return len(flags)
+
+
+def rebuild() -> int:
+    """Recompute security_master and security_month from stock_1min_qfq, chunk by chunk."""
+    with db.get_db_connection() as conn:
+        _refresh_st_flags(conn)
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE security_master, security_month;")
+            cur.execute("""
+                SELECT format('%I.%I', chunk_schema, chunk_name)
+                FROM timescaledb_information.chunks
+                WHERE hypertable_name = 'stock_1min_qfq'
+                ORDER BY range_start
+            """)
+            chunks = [r[0] for r in cur.fetchall()]
+        conn.commit()
+
+        codes = set()
+        for chunk in tqdm(chunks, unit="chunk", desc="security_master"):
+            coverage = BarCoverage()
+            with conn.cursor() as cur:
+                cur.execute(CHUNK_COVERAGE_SQL.format(chunk=chunk))
+                for code, first, last, months in cur.fetchall():
+                    coverage.spans[code] = [first, last, None]
+                    coverage.months.update((code, m) for m in months)
+            record_coverage(conn, coverage)
+            conn.commit()
+            codes |= coverage.spans.keys()
+    logger.info(f"security_master rebuilt from {len(chunks)} chunks: {len(codes)} codes.")
+    return len(codes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Maintain the security master table.")
+    parser.add_argument("--rebuild", action="store_true", required=True,
+                        help="Recompute it from stock_1min_qfq (and set missing stock_name.is_st).")
+    args = parser.parse_args()
+    db.init_db()
+    rebuild()
@@ -0,0 +1,208 @@
+"""
+Local staging and read-ahead of archives on slow mounts.
+
+DATA_DIR usually lives on a Windows mount (/mnt/d/...) where several workers
+doing random zip reads are I/O bound. ArchiveStager copies the next archives,
+one at a time with large sequential reads, into a local STAGE_DIR:
+
+- at most STAGE_AHEAD archives wait in the stage ahead of the workers, and
+  the stage never holds more than STAGE_MAX_GB (or the free disk space);
+- main swaps a task's archive path for the staged copy when it submits the
+  task (stage_args); archives not staged in time are read from the source;
+- a staged copy is deleted as soon as its archive has been loaded (release).
+
+Staged copies keep the file name, size and mtime, so load_log checkpoints
+are identical to loading from the source.
+
+Workers open archives through open_timed(), so per-run stats can compare the
+stager's sequential read throughput from the source mount with the loader's
+read throughput from the stage (and from the source for unstaged archives).
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER = 16 * 1024 * 1024
+
+
+@dataclass
+class ReadStats:
+    """Bytes read and seconds spent inside read() calls."""
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def add(self, other: "ReadStats"):
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+
+    def summary(self) -> str:
+        mb = self.bytes / 1e6
+        rate = f"{mb / self.seconds:.1f} MB/s" if self.seconds else "n/a"
+        return f"{mb:.1f} MB in {self.seconds:.1f}s ({rate})"
+
+
+class TimedFile:
+    """File wrapper that accounts read() time and bytes in a ReadStats."""
+
+    def __init__(self, f, stats: ReadStats):
+        self._f = f
+        self.stats = stats
+
+    def read(self, n=-1):
+        t0 = time.perf_counter()
+        data = self._f.read(n)
+        self.stats.seconds += time.perf_counter() - t0
+        self.stats.bytes += len(data)
+        return data
+
+    def read1(self, n=-1):
+        # io.TextIOWrapper reads through read1 when the file has it
+        t0 = time.perf_counter()
+        data = self._f.read1(n)
+        self.stats.seconds += time.perf_counter() - t0
+        self.stats.bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+@contextmanager
+def open_timed(zip_path: str, stats: ReadStats):
+    """zipfile.ZipFile over a TimedFile: all archive reads are accounted in `stats`."""
+    with open(zip_path, 'rb') as f:
+        with zipfile.ZipFile(TimedFile(f, stats), 'r') as z:
+            yield z
+
+
+class ArchiveStager(threading.Thread):
+    """Background read-ahead of archives into a local stage directory (see module docstring)."""
+
+    def __init__(self, zip_paths, stage_dir: str = None, ahead: int = None, max_bytes: int = None):
+        super().__init__(name="archive-stager", daemon=True)
+        self.order = list(dict.fromkeys(zip_paths))
+        self.stage_dir = stage_dir or config.STAGE_DIR
+        self.ahead = ahead or config.STAGE_AHEAD
+        self.max_bytes = max_bytes or int(config.STAGE_MAX_GB * 1e9)
+        self.source_stats = ReadStats()
+
+        self._cond = threading.Condition()
+        self._staged = {}       # source path -> staged path (complete copies)
+        self._sizes = {}        # source path -> bytes held in the stage
+        self._copying = None    # source path being copied
+        self._taken = set()     # archives submitted (from the stage or the source)
+        self._stopped = False
+        os.makedirs(self.stage_dir, exist_ok=True)
+
+    def _waiting(self) -> int:
+        """Staged (or being copied) archives no task has picked up yet."""
+        return sum(1 for p in self._sizes if p not in self._taken)
+
+    def staged_path(self, zip_path: str) -> str:
+        return os.path.join(self.stage_dir, os.path.basename(zip_path))
+
+    def run(self):
+        for zip_path in self.order:
+            with self._cond:
+                if zip_path in self._taken:
+                    continue
+                try:
+                    size = os.path.getsize(zip_path)
+                except OSError:
+                    continue
+                if size > self.max_bytes:
+                    logger.info(f"Not staging {os.path.basename(zip_path)}: larger than the stage cap")
+                    continue
+                # Wait for room: fewer than `ahead` copies waiting and within the byte cap
+                self._cond.wait_for(lambda: self._stopped or zip_path in self._taken or (
+                    self._waiting() < self.ahead and sum(self._sizes.values()) + size <= self.max_bytes))
+                if self._stopped:
+                    return
+                if zip_path in self._taken:
+                    continue
+                if shutil.disk_usage(self.stage_dir).free < size + COPY_BUFFER:
+                    logger.warning(f"Not staging {os.path.basename(zip_path)}: stage disk is full")
+                    continue
+                self._copying = zip_path
+                self._sizes[zip_path] = size
+
+            ok = self._copy(zip_path)
+            with self._cond:
+                self._copying = None
+                if ok:
+                    self._staged[zip_path] = self.staged_path(zip_path)
+                else:
+                    del self._sizes[zip_path]
+                self._cond.notify_all()
+
+    def _copy(self, zip_path: str) -> bool:
+        """Sequential copy into '<name>.part', renamed when complete (size and mtime preserved)."""
+        target = self.staged_path(zip_path)
+        part = target + ".part"
+        try:
+            with open(zip_path, 'rb') as src, open(part, 'wb') as dst:
+                timed = TimedFile(src, self.source_stats)
+                while True:
+                    buf = timed.read(COPY_BUFFER)
+                    if not buf:
+                        break
+                    dst.write(buf)
+            shutil.copystat(zip_path, part)
+            os.replace(part, target)
+            return True
+        except OSError as e:
+            logger.warning(f"Staging failed for {os.path.basename(zip_path)}: {e}")
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            return False
+
+    def resolve(self, zip_path: str) -> str:
+        """
+        Path a task should read: the staged copy if there is one (waiting for a
+        copy in progress), otherwise the source path.
+        """
+        with self._cond:
+            self._taken.add(zip_path)
+            self._cond.wait_for(lambda: self._copying != zip_path)
+            self._cond.notify_all()
+            return self._staged.get(zip_path, zip_path)
+
+    def is_staged(self, zip_path: str) -> bool:
+        with self._cond:
+            return zip_path in self._staged
+
+    def stage_args(self, args):
+        """Task args with the archive path (first element) swapped for its staged copy."""
+        return (self.resolve(args[0]),) + tuple(args[1:])
+
+    def release(self, zip_path: str):
+        """The archive is fully loaded: delete its staged copy and make room for the next one."""
+        with self._cond:
+            staged = self._staged.pop(zip_path, None)
+            self._sizes.pop(zip_path, None)
+            self._cond.notify_all()
+        if staged:
+            try:
+                os.remove(staged)
+            except OSError as e:
+                logger.warning(f"Could not delete staged copy {staged}: {e}")
+
+    def close(self):
+        """Stop read-ahead and delete every staged copy left behind."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.join()
+        for zip_path in list(self._staged):
+            self.release(zip_path)
@@ -0,0 +1,183 @@
+"""
+Synthetic '<year>_1min.zip' archives shaped like the real data.
+
+Each archive holds one 'sh600000_<year>.csv' member per stock with the Chinese
+header, sh/sz/bj codes across the main boards, Chinese names (a few stocks
+are renamed to ST and back), 241 one-minute bars per weekday (09:30-11:30,
+13:01-15:00) and, optionally, negative forward-adjusted prices as in the
+early years. Bad rows are injected at a given ratio, one kind per validation
+rule (BAD_ROWS, named like loader.REJECT_RULES), and counted, so a load or
+an audit of the archive can be checked against the expected rejects.
+
+    python -m data_infra.synth --out /tmp/synth --years 2001 2002 --stocks 200 --days 60 --bad-ratio 0.0005
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import random
+import zipfile
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+HEADER = ["时间", "代码", "名称", "开盘", "收盘", "最高", "最低", "成交量", "成交额", "涨幅", "振幅"]
+
+# (prefix, first number, share of the stocks)
+BOARDS = [
+    ("sh", 600000, 0.35),   # SSE main board
+    ("sh", 688000, 0.10),   # STAR
+    ("sz", 1, 0.25),        # SZSE main board (000001)
+    ("sz", 300000, 0.20),   # ChiNext
+    ("bj", 430000, 0.10),   # BSE
+]
+
+NAME_HEADS = ["浦发", "平安", "万科", "华夏", "招商", "中信", "东方", "长江", "海通", "国泰", "金地", "光明"]
+NAME_TAILS = ["银行", "科技", "股份", "地产", "电子", "医药", "能源", "证券", "实业", "控股"]
+
+# Bad row kinds: validation rule -> how a valid row is broken
+BAD_ROWS = {
+    "column_count": lambda r: r[:7],
+    "time_format": lambda r: [r[0].replace(":", "-", 1)] + r[1:],
+    "code": lambda r: r[:1] + ["xx" + r[1][2:]] + r[2:],
+    "price_missing": lambda r: r[:3] + [""] + r[4:],
+    "price_invalid": lambda r: r[:4] + [r[4] + "-"] + r[5:],
+    "high_low": lambda r: r[:5] + [r[6], r[5]] + r[7:] if float(r[5]) > float(r[6]) else r[:5] + ["1", "2"] + r[7:],
+    "volume": lambda r: r[:7] + [r[7] + ".5"] + r[8:],
+    "amount": lambda r: r[:8] + ["1e13"] + r[9:],
+    "change_pct": lambda r: r[:9] + ["99999"] + r[10:],
+}
+
+
+@dataclass
+class ArchiveStats:
+    """What write_archive() put into an archive."""
+    rows: int = 0                                  # data rows, bad ones included
+    bad: Counter = field(default_factory=Counter)  # rule -> injected bad rows
+    codes: list = field(default_factory=list)      # raw codes ('sh600000')
+
+    @property
+    def valid_rows(self) -> int:
+        return self.rows - sum(self.bad.values())
+
+
+def stock_codes(stocks: int):
+    """`stocks` raw codes spread over BOARDS by their share."""
+    codes = []
+    for i, (prefix, first, share) in enumerate(BOARDS):
+        n = stocks - len(codes) if i == len(BOARDS) - 1 else round(stocks * share)
+        codes.extend(f"{prefix}{first + k:06d}" for k in range(n))
+    return codes[:stocks]
+
+
+def trading_days(year: int, days: int):
+    """The first `days` weekdays of a year."""
+    day = date(year, 1, 1)
+    out = []
+    while len(out) < days and day.year == year:
+        if day.weekday() < 5:
+            out.append(day)
+        day += timedelta(days=1)
+    return out
+
+
+def trading_minutes(day: date):
+    """241 one-minute bars: 09:30-11:30 and 13:01-15:00."""
+    morning = datetime(day.year, day.month, day.day, 9, 30)
+    yield morning
+    for start in (morning, datetime(day.year, day.month, day.day, 13, 0)):
+        for i in range(1, 121):
+            yield start + timedelta(minutes=i)
+
+
+def _stock_name(rng: random.Random, index: int) -> str:
+    return f"{NAME_HEADS[index % len(NAME_HEADS)]}{NAME_TAILS[rng.randrange(len(NAME_TAILS))]}"
+
+
+def _member_rows(rng: random.Random, code: str, name: str, days, negative: bool, st_from: int):
+    """Valid CSV rows of one stock; the name carries an ST prefix on days [st_from, st_from + 5)."""
+    price = rng.uniform(5, 50) * (-1 if negative else 1)
+    for d, day in enumerate(days):
+        day_name = f"ST{name}" if st_from <= d < st_from + 5 else name
+        for ts in trading_minutes(day):
+            o = price
+            c = o * (1 + rng.uniform(-0.01, 0.01))
+            if not negative:
+                c = max(0.01, c)
+            h = max(o, c) + abs(o) * rng.uniform(0, 0.005)
+            l = min(o, c) - abs(o) * rng.uniform(0, 0.005)
+            vol = rng.randint(100, 100000)
+            yield [
+                ts.strftime("%Y-%m-%d %H:%M:%S"), code, day_name,
+                f"{o:.4f}", f"{c:.4f}", f"{h:.4f}", f"{l:.4f}",
+                str(vol), f"{vol * abs(c):.2f}", f"{(c / o - 1) * 100:.4f}", f"{(h - l) / abs(o) * 100:.4f}",
+            ]
+            price = c
+
+
+def write_archive(path: str, year: int, stocks: int, days: int, bad_ratio: float = 0.0,
+                  negative_share: float = 0.0, st_share: float = 0.05, seed: int = 42) -> ArchiveStats:
+    """
+    Write one archive with a member per stock. negative_share of the stocks
+    get negative prices, st_share are named 'ST...' for a week mid-period.
+    """
+    rng = random.Random(f"{seed}-{year}")
+    stats = ArchiveStats(codes=stock_codes(stocks))
+    day_list = trading_days(year, days)
+    bad_kinds = list(BAD_ROWS)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for i, code in enumerate(stats.codes):
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(HEADER)
+            negative = rng.random() < negative_share
+            st_from = rng.randrange(len(day_list)) if rng.random() < st_share and day_list else len(day_list)
+            for row in _member_rows(rng, code, _stock_name(rng, i), day_list, negative, st_from):
+                if bad_ratio and rng.random() < bad_ratio:
+                    kind = bad_kinds[rng.randrange(len(bad_kinds))]
+                    row = BAD_ROWS[kind](row)
+                    stats.bad[kind] += 1
+                writer.writerow(row)
+                stats.rows += 1
+            z.writestr(f"{code}_{year}.csv", buf.getvalue().encode("utf-8-sig"))
+    return stats
+
+
+def iter_rows(year: int, stocks: int, days: int, negative_share: float = 0.0, seed: int = 42):
+    """Valid CSV rows of `stocks` stocks over `days` trading days, without writing an archive."""
+    rng = random.Random(f"{seed}-{year}")
+    day_list = trading_days(year, days)
+    for i, code in enumerate(stock_codes(stocks)):
+        negative = rng.random() < negative_share
+        yield from _member_rows(rng, code, _stock_name(rng, i), day_list, negative, len(day_list))
+
+
+def generate(out_dir: str, years, stocks: int, days: int, bad_ratio: float = 0.0,
+             negative_share: float = 0.0, seed: int = 42) -> dict:
+    """Write '<year>_1min.zip' for each year into out_dir. Returns {path: ArchiveStats}."""
+    os.makedirs(out_dir, exist_ok=True)
+    archives = {}
+    for year in years:
+        path = os.path.join(out_dir, f"{year}_1min.zip")
+        archives[path] = write_archive(path, year, stocks, days, bad_ratio, negative_share, seed=seed)
+        logger.info(f"Generated {path}: {archives[path].rows} rows ({sum(archives[path].bad.values())} bad), "
+                    f"{os.path.getsize(path) / 1e6:.1f} MB")
+    return archives
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Write synthetic *_1min.zip archives.")
+    parser.add_argument("--out", required=True, help="Output directory (use it as DATA_DIR).")
+    parser.add_argument("--years", type=int, nargs="+", default=[2001], help="One archive per year.")
+    parser.add_argument("--stocks", type=int, default=100, help="Stocks (CSV members) per archive.")
+    parser.add_argument("--days", type=int, default=20, help="Trading days per archive.")
+    parser.add_argument("--bad-ratio", type=float, default=0.0, help="Share of rows broken on purpose.")
+    parser.add_argument("--negative-share", type=float, default=0.0,
+                        help="Share of stocks with negative (forward-adjusted) prices.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.out, args.years, args.stocks, args.days, args.bad_ratio, args.negative_share, args.seed)
@@ -0,0 +1,251 @@
+"""
+Loader throughput telemetry.
+
+With METRICS_FILE set, every finished load (archive or CSV member) appends
+one JSON line to it. Workers write directly (one O_APPEND write per line), so
+the file is live and also covers queue workers on other nodes. Fields:
+
+    ts, pid, label, status, rows, skipped, inserted, elapsed, rows_per_sec,
+    decompressed_bytes, decompress_s, decompress_mb_per_sec, parse_s, validate_s,
+    copy_s, merge_s
+
+Stage times are exclusive of each other:
+- parse: decompression and CSV parsing
+- validate: clean_row_data / validation.clean_block
+- copy: COPY into the staging table (or the hypertable), without the parsing
+  that runs inside it in 'stream' mode
+- merge: INSERT ... ON CONFLICT from the staging table
+
+In 'pipeline' mode parse/validate run on their own thread, so the stages
+overlap and may add up to more than elapsed.
+
+main follows the file with a MetricsReporter: it rewrites METRICS_PROM_FILE
+(Prometheus text format, e.g. for node_exporter's textfile collector) every
+METRICS_INTERVAL seconds and logs a per-worker summary at the end of the run.
+
+Timing every row costs a few percent of parse throughput, hence METRICS_FILE
+is empty (off) by default.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("parse", "validate", "copy", "merge")
+# Summed per worker by MetricsReporter
+COUNTERS = ("loads", "rows", "skipped", "inserted", "elapsed", "decompressed_bytes", "decompress_s",
+            *(f"{s}_s" for s in STAGES))
+
+
+def enabled() -> bool:
+    return bool(config.METRICS_FILE)
+
+
+class StageClock:
+    """
+    Seconds per stage of the current load in this process. Time recorded while
+    another stage is open on the same thread is taken out of that stage, so
+    every stage is exclusive.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._local = threading.local()
+
+    def reset(self):
+        self.seconds = defaultdict(float)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+        stack = self._stack()
+        if stack:
+            self.seconds[stack[-1]] -= seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        if not enabled():
+            yield
+            return
+        stack = self._stack()
+        stack.append(stage)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            self.add(stage, time.perf_counter() - t0)
+
+    def timed_rows(self, rows, stage: str = "parse"):
+        """Pass rows through, accounting the time spent producing each one to `stage`."""
+        rows = iter(rows)
+        stack = self._stack()
+        while True:
+            stack.append(stage)
+            t0 = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                stack.pop()
+                self.add(stage, time.perf_counter() - t0)
+            yield row
+
+
+# Per-process clock (one load at a time per worker process)
+clock = StageClock()
+
+
+def load_record(label: str, status: str, stats, provenance) -> dict:
+    """Metrics of a finished load from its loader.ParseStats and loader.Provenance."""
+    seconds = clock.seconds
+    mb = stats.decompressed.bytes / 1e6
+    elapsed = provenance.elapsed
+    return {
+        "ts": round(time.time(), 3), "pid": os.getpid(), "label": label, "status": status,
+        "rows": stats.total_rows, "skipped": stats.skipped_count, "inserted": provenance.rows_inserted,
+        "elapsed": round(elapsed, 4),
+        "rows_per_sec": round(stats.total_rows / elapsed, 1) if elapsed else 0.0,
+        "decompressed_bytes": stats.decompressed.bytes,
+        "decompress_s": round(stats.decompressed.seconds, 4),
+        "decompress_mb_per_sec": round(mb / stats.decompressed.seconds, 1) if stats.decompressed.seconds else 0.0,
+        **{f"{s}_s": round(max(seconds[s], 0.0), 4) for s in STAGES},
+    }
+
+
+def emit(record: dict):
+    """Append one record to METRICS_FILE (no-op when telemetry is off); failures are logged only."""
+    if not enabled():
+        return
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    try:
+        fd = os.open(config.METRICS_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.warning(f"Cannot write metrics to {config.METRICS_FILE}: {e}")
+
+
+class MetricsReporter(threading.Thread):
+    """Follows METRICS_FILE from the current end (this run only); see module docstring."""
+
+    def __init__(self, path: str = None, prom_path: str = None, interval: float = None):
+        super().__init__(name="metrics-reporter", daemon=True)
+        self.path = path or config.METRICS_FILE
+        self.prom_path = prom_path if prom_path is not None else config.METRICS_PROM_FILE
+        self.interval = interval or config.METRICS_INTERVAL
+        self.workers = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self.started = time.time()
+        self._offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self._stop_event = threading.Event()
+
+    def poll(self) -> int:
+        """Aggregate the complete lines appended since the last poll. Returns the records read."""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        count = 0
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            totals = self.workers[str(record.get("pid"))]
+            totals["loads"] += 1
+            for key in COUNTERS[1:]:
+                totals[key] += record.get(key, 0) or 0
+            count += 1
+        return count
+
+    def total(self) -> dict:
+        totals = dict.fromkeys(COUNTERS, 0)
+        for worker in self.workers.values():
+            for key in COUNTERS:
+                totals[key] += worker[key]
+        return totals
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of the per-worker counters."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{{{labels}}} {value:g}" for labels, value in samples)
+
+        workers = sorted(self.workers.items())
+        family("loader_loads_total", "counter", "Loads (archives or CSV members) finished.",
+               [(f'worker="{w}"', t["loads"]) for w, t in workers])
+        family("loader_rows_total", "counter", "CSV data rows read.",
+               [(f'worker="{w}"', t["rows"]) for w, t in workers])
+        family("loader_skipped_rows_total", "counter", "Rows rejected by validation.",
+               [(f'worker="{w}"', t["skipped"]) for w, t in workers])
+        family("loader_inserted_rows_total", "counter", "Rows written to stock_1min_qfq.",
+               [(f'worker="{w}"', t["inserted"]) for w, t in workers])
+        family("loader_decompressed_bytes_total", "counter", "Bytes decompressed from the archives.",
+               [(f'worker="{w}"', t["decompressed_bytes"]) for w, t in workers])
+        family("loader_stage_seconds_total", "counter", "Exclusive seconds per load stage.",
+               [(f'worker="{w}",stage="{s}"', t[f"{s}_s"]) for w, t in workers for s in STAGES])
+        elapsed = time.time() - self.started
+        family("loader_rows_per_second", "gauge", "Rows read per second since the run started.",
+               [("", self.total()["rows"] / elapsed if elapsed else 0.0)])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        """Atomically replace prom_path (the textfile collector must never see a partial file)."""
+        if not self.prom_path:
+            return
+        tmp = f"{self.prom_path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus())
+            os.replace(tmp, self.prom_path)
+        except OSError as e:
+            logger.warning(f"Cannot write {self.prom_path}: {e}")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+            self.write_prometheus()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.poll()
+        self.write_prometheus()
+
+    def summary(self) -> str:
+        """Per-worker table and the run total (rows/s of the total is over wall-clock time)."""
+        header = (f"{'worker':>10}{'loads':>7}{'rows':>12}{'rows/s':>10}{'MB/s':>8}"
+                  f"{'parse s':>10}{'valid. s':>10}{'copy s':>10}{'merge s':>10}{'skipped':>9}")
+        lines = [header]
+
+        def line(name, t, seconds):
+            mb_rate = t["decompressed_bytes"] / 1e6 / t["decompress_s"] if t["decompress_s"] else 0.0
+            lines.append(f"{name:>10}{t['loads']:>7}{t['rows']:>12}{t['rows'] / seconds if seconds else 0:>10.0f}"
+                         f"{mb_rate:>8.1f}{t['parse_s']:>10.1f}{t['validate_s']:>10.1f}"
+                         f"{t['copy_s']:>10.1f}{t['merge_s']:>10.1f}{t['skipped']:>9}")
+
+        for worker, totals in sorted(self.workers.items()):
+            line(worker, totals, totals["elapsed"])
+        line("total", self.total(), time.time() - self.started)
+        return "\n".join(lines)
@@ -0,0 +1,256 @@
+"""
+Vectorized (columnar) row validation for the 1-minute CSV members.
+
+clean_block() applies the rules of loader.clean_row_data to a whole block of
+parsed CSV rows at once. Each column is turned into a fixed-width NumPy
+unicode array and viewed as a (rows x chars) code point matrix, so format
+checks, number parsing and threshold tests run as array operations.
+
+Rows that are clearly valid under every rule are cleaned in bulk; every other
+row ("suspect") is handed to the scalar clean_row_data, which either accepts it
+or raises the exact same ValueError it always did. This keeps skipped-row
+counts, log messages and the WARNING/FAILED decision identical to the per-row
+engine, while the common case never touches datetime.strptime, float() or
+transform_code row by row.
+"""
+import numpy as np
+
+from . import config
+from . import utils
+
+# Fast-path widths. Longer values are simply left to the scalar path.
+NUMBER_WIDTH = 32
+INTEGER_WIDTH = 16  # sign + 15 digits: always fits in int64
+CODE_WIDTH = 16
+TIME_WIDTH = 19     # 'YYYY-MM-DD HH:MM:SS'
+
+TIME_SEPARATORS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+CODE_PREFIXES = ("sh", "sz", "bj")
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+_ZERO, _NINE, _DOT, _MINUS = ord("0"), ord("9"), ord("."), ord("-")
+
+
+def _char_matrix(values, max_width: int):
+    """
+    Return (array, codepoints, lengths, fits) for a sequence of str.
+
+    The array is 'U<w>' with w = min(longest value, max_width); `codepoints`
+    is its (n, w) uint32 view and `fits` marks values that were not truncated.
+    """
+    n = len(values)
+    lens = np.fromiter(map(len, values), dtype=np.int64, count=n)
+    width = int(min(max(lens.max(initial=0), 1), max_width))
+    arr = np.array(values, dtype=f"U{width}")
+    cp = arr.view(np.uint32).reshape(n, width)
+    return arr, cp, lens, lens <= width
+
+
+def _is_digit(cp: np.ndarray) -> np.ndarray:
+    return (cp >= _ZERO) & (cp <= _NINE)
+
+
+def _is_empty(values) -> np.ndarray:
+    return np.fromiter(map(len, values), dtype=np.int64, count=len(values)) == 0
+
+
+def _plain_number(values, max_width: int = NUMBER_WIDTH, allow_dot: bool = True):
+    """
+    Check values shaped like -?[0-9]+(\\.[0-9]+)? (no whitespace, exponent,
+    '+', '_' or inf/nan).
+
+    Returns (mask, array, codepoints, digit mask, index of first digit).
+    """
+    arr, cp, lens, ok = _char_matrix(values, max_width)
+    width = cp.shape[1]
+    rows = np.arange(len(values))
+    inside = np.arange(width) < lens[:, None]
+    digit = _is_digit(cp) & inside
+    neg = cp[:, 0] == _MINUS
+
+    valid_char = digit.copy()
+    valid_char[:, 0] |= neg
+    if allow_dot:
+        dot = cp == _DOT
+        valid_char |= dot
+        ok &= dot.sum(axis=1) <= 1
+    ok &= np.all(valid_char | ~inside, axis=1)
+
+    # At least one digit after the sign; first and last characters are digits
+    first = neg.astype(np.int64)
+    ok &= lens > first
+    ok &= digit[rows, np.minimum(first, width - 1)]
+    ok &= digit[rows, np.clip(lens - 1, 0, width - 1)]
+    return ok, arr, cp, digit, first
+
+
+def _parse_float(values, limit: float = None):
+    """
+    Return (mask, float64 values) for plain finite numbers within `limit`.
+
+    Values with at most 15 significant digits are computed as
+    significand / 10**decimals, which is exactly float(value) (both operands
+    are exact doubles, so the division is correctly rounded). Longer values
+    go through NumPy's string -> float64 cast, also correctly rounded.
+    """
+    ok, arr, cp, digit, _ = _plain_number(values)
+
+    # Digits to the right of each digit, and digits after the dot
+    right = np.cumsum(digit[:, ::-1], axis=1)[:, ::-1] - digit
+    decimals = np.where(cp == _DOT, right, 0).max(axis=1)
+    n_digits = digit.sum(axis=1)
+
+    exact = ok & (n_digits <= 15)
+    weights = np.where(digit, 10.0 ** np.minimum(right, 15), 0.0)
+    significand = (np.where(digit, cp.astype(np.int64) - _ZERO, 0) * weights).sum(axis=1)
+    parsed = significand / 10.0 ** decimals
+    parsed = np.where(cp[:, 0] == _MINUS, -parsed, parsed)
+
+    slow = ok & ~exact
+    if slow.any():
+        parsed[slow] = arr[slow].astype(np.float64)
+
+    ok &= np.isfinite(parsed)
+    if limit is not None:
+        ok &= np.abs(parsed) <= limit
+    return ok, parsed
+
+
+def _optional_number(values, limit: float) -> np.ndarray:
+    """Empty string is valid (stored as NULL); otherwise a plain number within `limit`."""
+    ok, _ = _parse_float(values, limit)
+    return ok | _is_empty(values)
+
+
+def _time_ok(values) -> np.ndarray:
+    """
+    Mask of exact 'YYYY-MM-DD HH:MM:SS' strings that datetime.strptime accepts.
+    Field ranges are checked explicitly (no year 0, no second 60, real dates).
+    """
+    _, cp, lens, ok = _char_matrix(values, TIME_WIDTH)
+    ok &= lens == TIME_WIDTH
+    if cp.shape[1] < TIME_WIDTH:
+        return ok
+    digit = _is_digit(cp)
+    for pos in range(TIME_WIDTH):
+        if pos in TIME_SEPARATORS:
+            ok &= cp[:, pos] == ord(TIME_SEPARATORS[pos])
+        else:
+            ok &= digit[:, pos]
+
+    d = np.where(digit, cp.astype(np.int64) - _ZERO, 0)
+
+    def field(start, end):
+        out = np.zeros(len(values), dtype=np.int64)
+        for pos in range(start, end):
+            out = out * 10 + d[:, pos]
+        return out
+
+    y, m, day = field(0, 4), field(5, 7), field(8, 10)
+    hh, mm, ss = field(11, 13), field(14, 16), field(17, 19)
+
+    ok &= (y >= 1) & (m >= 1) & (m <= 12) & (day >= 1)
+    leap = (y % 4 == 0) & ((y % 100 != 0) | (y % 400 == 0))
+    dim = DAYS_IN_MONTH[np.clip(m, 1, 12) - 1] + ((m == 2) & leap)
+    ok &= day <= dim
+    ok &= (hh <= 23) & (mm <= 59) & (ss <= 59)
+    return ok
+
+
+def _code_ok(values) -> np.ndarray:
+    """Mask of ASCII codes without surrounding whitespace (sh/sz/bj prefix when standardizing)."""
+    _, cp, lens, ok = _char_matrix(values, CODE_WIDTH)
+    if cp.shape[1] < 2:
+        cp = np.pad(cp, ((0, 0), (0, 2 - cp.shape[1])))
+    inside = np.arange(cp.shape[1]) < lens[:, None]
+    digit = _is_digit(cp)
+    lower = cp | 0x20  # ASCII letters -> lower case
+    alnum = digit | ((lower >= ord("a")) & (lower <= ord("z")))
+
+    if config.STANDARDIZE_CODE:
+        ok &= lens >= 2
+        ok &= np.all(alnum | ~inside, axis=1)
+        prefix_ok = np.zeros(len(values), dtype=bool)
+        for p in CODE_PREFIXES:
+            prefix_ok |= (lower[:, 0] == ord(p[0])) & (lower[:, 1] == ord(p[1]))
+        ok &= prefix_ok
+    else:
+        ok &= lens >= 1
+        ok &= np.all(alnum | (cp == _DOT) | ~inside, axis=1)
+    return ok
+
+
+def clean_block(rows):
+    """
+    Clean and validate a block of CSV rows.
+
+    Returns a list aligned with `rows`: each entry is either the cleaned row
+    (as clean_row_data would return it) or the ValueError/IndexError that
+    clean_row_data raised for that row.
+    """
+    from .loader import clean_row_data
+
+    results = [None] * len(rows)
+    full_idx = [i for i, r in enumerate(rows) if len(r) == 11]
+
+    if full_idx:
+        cols = list(zip(*(rows[i] for i in full_idx)))
+        time_s, code_s, name_s, open_s, close_s, high_s, low_s, vol_s, amt_s, pct_s, amp_s = cols
+        n = len(full_idx)
+
+        # 1. Time: exactly 'YYYY-MM-DD HH:MM:SS' (already stripped, 19 chars)
+        fast = _time_ok(time_s)
+
+        # 2. Code: sh/sz/bj prefix
+        fast &= _code_ok(code_s)
+
+        # 3. Prices: finite, High >= Low
+        for col in (open_s, close_s):
+            ok, _ = _parse_float(col)
+            fast &= ok
+        high_ok, high = _parse_float(high_s)
+        low_ok, low = _parse_float(low_s)
+        fast &= high_ok & low_ok & (high >= low)
+
+        # 4. Volume: empty, or an integer within MAX_ABS_VOLUME
+        vol_empty = _is_empty(vol_s)
+        vol_ok, vol_arr, vol_cp, _, vol_first = _plain_number(vol_s, INTEGER_WIDTH, allow_dot=False)
+        vol_int = np.where(vol_ok, vol_arr, "0").astype(np.int64)
+        vol_ok &= np.abs(vol_int) <= config.MAX_ABS_VOLUME
+        fast &= vol_empty | vol_ok
+        # Leading zeros / '-0' are normalized through int(), like the scalar path
+        lead = vol_cp[np.arange(n), np.minimum(vol_first, vol_cp.shape[1] - 1)]
+        vol_renorm = vol_ok & (lead == _ZERO) & (vol_arr != "0")
+
+        # 5. Other numerics: empty, or finite and within their limits
+        fast &= _optional_number(amt_s, config.MAX_ABS_AMOUNT)
+        fast &= _optional_number(pct_s, config.MAX_ABS_CHANGE_PCT)
+        fast &= _optional_number(amp_s, config.MAX_ABS_AMPLITUDE)
+
+        fast_k = np.flatnonzero(fast).tolist()
+        if config.STANDARDIZE_CODE:
+            # Codes repeat heavily (one stock per member): transform each distinct code once
+            code_map = {c: utils.transform_code(c) for c in set(code_s[k] for k in fast_k)}
+            std_code = list(map(code_map.get, code_s))
+        else:
+            std_code = code_s
+        clean_vol = list(vol_s)
+        for k in np.flatnonzero(vol_renorm).tolist():
+            clean_vol[k] = str(int(vol_int[k]))
+
+        out_cols = (time_s, std_code, name_s, open_s, close_s, high_s, low_s,
+                    clean_vol, amt_s, pct_s, amp_s)
+        if len(fast_k) == len(rows):
+            # Common case: the whole block is clean
+            return list(map(list, zip(*out_cols)))
+        for k in fast_k:
+            results[full_idx[k]] = [c[k] for c in out_cols]
+
+    # Everything not cleaned in bulk goes through the scalar rules
+    for i, r in enumerate(results):
+        if r is None:
+            try:
+                results[i] = clean_row_data(rows[i])
+            except (ValueError, IndexError) as e:
+                results[i] = e
+    return results
@@ -0,0 +1,198 @@
+"""
+Multi-node loading through a task table in PostgreSQL.
+
+One node seeds load_task from its file scan (same checkpoint filtering as a
+normal run), then any number of worker processes, on any host that mounts
+the archives under DATA_DIR, claim archives with
+
+    SELECT ... FOR UPDATE SKIP LOCKED
+
+so no two workers get the same file. A claim is a lease: a heartbeat thread
+extends lease_until every QUEUE_HEARTBEAT_SECONDS while the archive loads. If
+a node dies, its leases expire after QUEUE_LEASE_SECONDS and the files are
+claimed again (at most QUEUE_MAX_ATTEMPTS times). Reloading a partly loaded
+archive is safe: rows go through INSERT ... ON CONFLICT DO NOTHING.
+
+The outcome of each archive is still recorded in load_log by
+loader.process_zip_file; load_task only tracks who works on what.
+
+Usage (several workers against one database, e.g. locally):
+    python -m data_infra.main --seed-queue
+    python -m data_infra.main --queue-worker     # on each node / in several shells
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from . import config
+from . import db
+from . import loader
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DDL = """
+    CREATE TABLE IF NOT EXISTS load_task (
+        filename TEXT PRIMARY KEY,  -- archive name, resolved under each worker's DATA_DIR
+        status TEXT NOT NULL,       -- 'PENDING', 'RUNNING', 'DONE', 'FAILED'
+        owner TEXT,                 -- '<host>:<pid>' of the current/last lease holder
+        lease_until TIMESTAMP,
+        heartbeat_at TIMESTAMP,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+
+def ensure_queue_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(QUEUE_DDL)
+    conn.commit()
+
+
+def seed_tasks(zip_paths) -> int:
+    """
+    (Re)queue archives as PENDING. Archives currently leased by a worker are
+    left alone. Returns the number of tasks queued.
+    """
+    filenames = [os.path.basename(p) for p in zip_paths]
+    with db.get_db_connection() as conn:
+        ensure_queue_table(conn)
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO load_task (filename, status, attempts, updated_at)
+                VALUES (%s, 'PENDING', 0, NOW())
+                ON CONFLICT (filename)
+                DO UPDATE SET status='PENDING', owner=NULL, lease_until=NULL,
+                              attempts=0, last_error=NULL, updated_at=NOW()
+                WHERE load_task.status <> 'RUNNING' OR load_task.lease_until < NOW();
+            """, [(f,) for f in filenames])
+        conn.commit()
+    logger.info(f"Queued {len(filenames)} archives in load_task.")
+    return len(filenames)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_task(conn, owner: str):
+    """
+    Lease the next PENDING (or expired RUNNING) archive. Returns
+    (filename, attempts, claimed_at) or None. Tasks out of attempts are marked FAILED.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE load_task
+            SET status='FAILED', last_error='Lease expired ' || attempts || ' times', updated_at=NOW()
+            WHERE status='RUNNING' AND lease_until < NOW() AND attempts >= %s;
+        """, (config.QUEUE_MAX_ATTEMPTS,))
+        cur.execute("""
+            UPDATE load_task
+            SET status='RUNNING', owner=%s, attempts=attempts + 1,
+                lease_until=NOW() + make_interval(secs => %s), heartbeat_at=NOW(), updated_at=NOW()
+            WHERE filename = (
+                SELECT filename FROM load_task
+                WHERE status = 'PENDING'
+                   OR (status = 'RUNNING' AND lease_until < NOW())
+                ORDER BY filename
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING filename, attempts, updated_at;
+        """, (owner, config.QUEUE_LEASE_SECONDS))
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+def heartbeat(conn, filename: str, owner: str) -> bool:
+    """Extend the lease. False if it was lost (expired and claimed by another worker)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE load_task
+            SET lease_until=NOW() + make_interval(secs => %s), heartbeat_at=NOW()
+            WHERE filename=%s AND owner=%s AND status='RUNNING';
+        """, (config.QUEUE_LEASE_SECONDS, filename, owner))
+        alive = cur.rowcount == 1
+    conn.commit()
+    return alive
+
+
+def complete_task(conn, filename: str, owner: str, claimed_at):
+    """Close the lease with the archive's load_log outcome (SUCCESS/WARNING -> DONE)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT status, error_msg FROM load_log
+            WHERE filename=%s AND processed_at >= %s
+        """, (filename, claimed_at))
+        row = cur.fetchone()
+        status, error_msg = row if row else ("FAILED", "No load_log entry written for this attempt")
+        cur.execute("""
+            UPDATE load_task
+            SET status=%s, lease_until=NULL, last_error=%s, updated_at=NOW()
+            WHERE filename=%s AND owner=%s;
+        """, ("FAILED" if status == "FAILED" else "DONE", error_msg, filename, owner))
+    conn.commit()
+
+
+class _Heartbeat(threading.Thread):
+    """Extends one lease in the background on its own connection."""
+
+    def __init__(self, filename: str, owner: str):
+        super().__init__(name=f"heartbeat-{filename}", daemon=True)
+        self.filename = filename
+        self.owner = owner
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with db.get_db_connection() as conn:
+                while not self._stop_event.wait(config.QUEUE_HEARTBEAT_SECONDS):
+                    if not heartbeat(conn, self.filename, self.owner):
+                        logger.warning(f"[{self.filename}] Lease lost; another worker may reload it.")
+                        return
+        except Exception as e:
+            logger.error(f"[{self.filename}] Heartbeat failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_queue_worker() -> int:
+    """
+    Claim and load archives until the queue is drained. While other workers
+    still hold leases, keep polling: their files come back if they die.
+    Returns the number of archives this worker processed.
+    """
+    owner = worker_id()
+    processed = 0
+    with db.get_db_connection() as conn:
+        ensure_queue_table(conn)
+        while True:
+            task = claim_task(conn, owner)
+            if task is None:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT count(*) FROM load_task WHERE status='RUNNING'")
+                    running = cur.fetchone()[0]
+                conn.commit()
+                if running == 0:
+                    break
+                time.sleep(config.QUEUE_POLL_SECONDS)
+                continue
+
+            filename, attempts, claimed_at = task
+            logger.info(f"[{owner}] Claimed {filename} (attempt {attempts})")
+            beat = _Heartbeat(filename, owner)
+            beat.start()
+            try:
+                loader.process_zip_file(os.path.join(config.DATA_DIR, filename))
+            finally:
+                beat.stop()
+            complete_task(conn, filename, owner, claimed_at)
+            processed += 1
+    logger.info(f"[{owner}] Queue drained, {processed} archives processed.")
+    return processed
@@ -2,6 +2,8 @@
 import os
 from typing import Optional
 
+from data_infra.kline import TIMEFRAMES, DEFAULT_TIMEFRAME
+
 # =============================================================================
 # 日志文件配置
 # =============================================================================
@@ -43,6 +45,7 @@ PRESETS = {
         'PRICE_POSITION_MIN': 0.05,   # 价格箱体位置下限（避免破位下跌）
         'PRICE_POSITION_MAX': 0.82,   # 价格箱体位置上限（避免追高）
         'SQL_LIMIT': -1,             # SQL返回上限
+        'TIMEFRAME': 'monthly',       # K线周期（daily/weekly/monthly），回溯参数按该周期的K线根数计
 
         # ===== Python 层参数 =====
         'SLOPE_MIN': -0.010,          # 趋势斜率下限
@@ -70,6 +73,7 @@ PRESETS = {
         'PRICE_POSITION_MIN': 0.05,   # 箱体位置 5%-85%（更宽松）
         'PRICE_POSITION_MAX': 0.85,
         'SQL_LIMIT': -1,
+        'TIMEFRAME': 'monthly',
 
         # ===== Python 层参数 =====
         'SLOPE_MIN': -0.02,
@@ -97,6 +101,7 @@ PRESETS = {
         'PRICE_POSITION_MIN': 0.05,   # 箱体位置 5%-80%
         'PRICE_POSITION_MAX': 0.85,   # 最初推荐值: 0.80
         'SQL_LIMIT': -1,
+        'TIMEFRAME': 'monthly',
 
         # ===== Python 层参数 =====
         'SLOPE_MIN': -0.015,          # 最初推荐值: -0.01
@@ -187,6 +192,8 @@ def validate_config(config: dict) -> None:
         "RECENT_LOOKBACK 必须小于 HISTORY_LOOKBACK"
     assert config['RECENT_LOOKBACK'] >= 12, \
         "RECENT_LOOKBACK 必须 >= 12（月），以保证回归分析有效"
+    assert config.get('TIMEFRAME', DEFAULT_TIMEFRAME) in TIMEFRAMES, \
+        f"TIMEFRAME 必须为 {list(TIMEFRAMES)} 之一"
     assert config['SQL_LIMIT'] == -1 or config['SQL_LIMIT'] > 0, \
         "SQL_LIMIT 必须为正数，或 -1 表示不限制"
     assert config['FINAL_LIMIT'] == -1 or config['FINAL_LIMIT'] > 0, \
@@ -214,6 +221,7 @@ def print_config(config: dict) -> None:
     print(f"  最少数据月数:        {config['MIN_DATA_MONTHS']}")
     print(f"  箱体位置范围:        [{config['PRICE_POSITION_MIN']:.2f}, {config['PRICE_POSITION_MAX']:.2f}]")
     print(f"  SQL 返回上限:        {config['SQL_LIMIT']}")
+    print(f"  K线周期:             {config.get('TIMEFRAME', DEFAULT_TIMEFRAME)}")
 
     print("\n【Python 层参数】")
     print(f"  趋势斜率范围:        [{config['SLOPE_MIN']:.3f}, {config['SLOPE_MAX']:.3f}]")
@@ -11,6 +11,7 @@ import numpy as np
 from scipy import stats
 
 from data_infra.db import get_db_connection
+from data_infra.query import get_bars
 from data_infra.stock_code import classify_cn_stock
 from flatbottom_pipeline.selection.config import get_config, validate_config
 
@@ -188,19 +189,8 @@ def diagnose(code: str, preset: str) -> None:
         for f in fails:
             print(f"  - {f}")
 
-    # Trend check (Python stage)
-    cur.execute(
-        """
-        SELECT close
-        FROM stock_monthly_kline
-        WHERE code = %s
-        ORDER BY month ASC
-        """,
-        (std_code,),
-    )
-    prices = [r[0] for r in cur.fetchall()]
-    prices = prices[-cfg['RECENT_LOOKBACK']:]
-    prices = np.array(prices, dtype=float)
+    # Trend check (Python stage), same bars as find_flatbottom._get_prices_batch
+    prices = get_bars([std_code], freq='monthly', conn=conn).tail(cfg['RECENT_LOOKBACK']).series(std_code)
 
     if len(prices) < max(12, cfg['RECENT_LOOKBACK'] // 2):
         print("\nPython trend check: insufficient recent months")
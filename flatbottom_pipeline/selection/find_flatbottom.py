@@ -19,6 +19,9 @@ import numpy as np
 from scipy import stats
 
 from data_infra.db import get_db_connection
+from data_infra.kline import timeframe
+from data_infra.names import ST_MARKERS, is_st_name
+from data_infra.query import Bars, get_bars
 from data_infra.stock_code import classify_cn_stock
 from flatbottom_pipeline.selection.config import get_config, validate_config, print_config, DEFAULT_PRESET
 from flatbottom_pipeline.selection.logger import logger
@@ -39,6 +42,8 @@ class FlatbottomScreener:
         validate_config(self.config)
         self.preset = preset or DEFAULT_PRESET
         self.code_filter = code_filter or []
+        # Join security_master and pre-filter on it (see detect_security_master)
+        self.use_security_master = True
         logger.info(f"Screener initialized with preset: {self.preset}")
 
     def run(self) -> pd.DataFrame:
@@ -78,17 +83,17 @@ class FlatbottomScreener:
         # Stage 2: Batch price fetching
         logger.info("Stage 2: Fetching price data in batch...")
         codes = candidates['code'].tolist()
-        prices_df = self._get_prices_batch(codes, self.config['RECENT_LOOKBACK'])
+        prices = self._get_prices_batch(codes, self.config['RECENT_LOOKBACK'])
 
-        if prices_df.empty:
+        if not len(prices):
             logger.warning("Failed to fetch price data. Stopping.")
             return pd.DataFrame()
 
-        logger.info(f"✓ Price data fetched: {len(prices_df)} records")
+        logger.info(f"✓ Price data fetched: {len(prices)} records")
 
         # Stage 3: Python fine screening
         logger.info("Stage 3: Python fine screening (trend analysis)...")
-        results = self._refine_candidates(candidates, prices_df)
+        results = self._refine_candidates(candidates, prices)
 
         if results.empty:
             logger.warning("Fine screening returned no results.")
@@ -109,14 +114,14 @@ class FlatbottomScreener:
         Returns:
             DataFrame with SQL screening results
         """
-        sql_query = self._build_sql_query()
-        count_query = self._build_sql_query(
-            final_query="SELECT COUNT(*) AS total FROM ScoredCandidates"
-        )
-
         conn = None
         try:
             conn = get_db_connection()
+            self.detect_security_master(conn)
+            sql_query = self._build_sql_query()
+            count_query = self._build_sql_query(
+                final_query="SELECT COUNT(*) AS total FROM ScoredCandidates"
+            )
             count_df = pd.read_sql(count_query, conn)
             total_passed = int(count_df.iloc[0, 0]) if not count_df.empty else 0
             logger.info(
@@ -132,6 +137,41 @@ class FlatbottomScreener:
             if conn is not None:
                 conn.close()
 
+    def detect_security_master(self, conn, require_names: bool = True) -> bool:
+        """
+        Use security_master only if it exists and has rows. Otherwise names come
+        from stock_name, the ST filter falls back to name markers and the
+        history pre-filter is skipped. Sets and returns use_security_master.
+
+        Raises RuntimeError when neither table has names (e.g. a database
+        loaded before stock_name existed), since the ST filter would keep every
+        stock; benchmarks that only time the query pass require_names=False.
+        """
+        with conn.cursor() as cur:
+            populated = self._has_rows(cur, 'security_master')
+            if require_names and not populated and not self._has_rows(cur, 'stock_name'):
+                raise RuntimeError(
+                    "security_master and stock_name are both missing or empty, so ST stocks cannot be "
+                    "filtered. Build them with `python -m data_infra.names --populate`, then "
+                    "`python -m data_infra.security_master --rebuild`."
+                )
+        if not populated:
+            logger.warning(
+                "security_master is missing or empty: names and ST flags fall back to stock_name, "
+                "no history pre-filter. Build it with `python -m data_infra.security_master --rebuild`."
+            )
+        self.use_security_master = populated
+        return populated
+
+    @staticmethod
+    def _has_rows(cur, table: str) -> bool:
+        """True if `table` exists and is not empty."""
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{table}",))
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        return cur.fetchone()[0]
+
     def _build_sql_query(self, final_query: Optional[str] = None) -> str:
         """Build SQL query with parameter injection."""
         cfg = self.config
@@ -146,6 +186,7 @@ class FlatbottomScreener:
 SELECT
     code,
     name,
+    is_st,
     ROUND(current_price::numeric, 2) AS current_price,
     ROUND(history_high::numeric, 2) AS history_high,
     ROUND(glory_ratio::numeric, 2) AS glory_ratio,
@@ -177,6 +218,15 @@ LIMIT {sql_limit}
             code_list_sql = ", ".join(f"'{code}'" for code in escaped_codes)
             code_filter_clause = f"AND code = ANY(ARRAY[{code_list_sql}])"
 
+        # months_of_history counts months, so the pre-filter only holds for monthly bars
+        tf = timeframe(cfg.get('TIMEFRAME'))
+        history_prefilter_clause = ''
+        if tf.name == 'monthly' and self.use_security_master:
+            history_prefilter_clause = (
+                f"AND code NOT IN (SELECT code FROM security_master "
+                f"WHERE months_of_history < {cfg['MIN_DATA_MONTHS']})"
+            )
+
         return sql_template.format(
             history_lookback_minus_1=cfg['HISTORY_LOOKBACK'] - 1,
             recent_lookback_minus_1=cfg['RECENT_LOOKBACK'] - 1,
@@ -196,53 +246,43 @@ LIMIT {sql_limit}
             price_position_max=cfg['PRICE_POSITION_MAX'],
             sql_limit=cfg['SQL_LIMIT'],
             code_filter_clause=code_filter_clause,
+            history_prefilter_clause=history_prefilter_clause,
+            security_master_join=(
+                "LEFT JOIN security_master sm ON sm.code = d.code" if self.use_security_master
+                # Same columns, no rows: the COALESCE falls through to stock_name
+                else "LEFT JOIN (SELECT NULL::text AS code, NULL::text AS name, NULL::boolean AS is_st) sm ON FALSE"
+            ),
+            kline_view=tf.view,
+            bucket_column=tf.column,
             final_query=final_query
         )
 
-    def _get_prices_batch(self, codes: list, months: int) -> pd.DataFrame:
+    def _get_prices_batch(self, codes: list, months: int) -> Bars:
         """
         Stage 2: Batch fetch prices (solve N+1 problem).
 
         Args:
             codes: List of stock codes
-            months: Number of months to fetch
+            months: Number of bars (months for the monthly TIMEFRAME) to fetch
 
         Returns:
-            DataFrame with columns: code, month, close
+            Bars (float64 arrays per code) holding the last `months` bars of each code
         """
-        if not codes:
-            return pd.DataFrame()
-
-        conn = None
+        tf = timeframe(self.config.get('TIMEFRAME'))
         try:
-            conn = get_db_connection()
-
-            # Use PostgreSQL ANY() syntax for single query
-            df = pd.read_sql("""
-                SELECT code, month, close
-                FROM stock_monthly_kline
-                WHERE code = ANY(%s)
-                ORDER BY code, month ASC
-            """, conn, params=(codes,))
-
-            # Filter to recent months (keep last N months per stock)
-            df = df.groupby('code').tail(months).reset_index(drop=True)
-
-            return df
+            # Single streamed query for all codes (see data_infra/query.py)
+            return get_bars(codes, freq=tf.name).tail(months)
         except Exception as e:
             logger.error(f"Batch price fetching failed: {e}")
             raise
-        finally:
-            if conn is not None:
-                conn.close()
 
-    def _refine_candidates(self, candidates: pd.DataFrame, prices_df: pd.DataFrame) -> pd.DataFrame:
+    def _refine_candidates(self, candidates: pd.DataFrame, prices: Bars) -> pd.DataFrame:
         """
         Stage 3: Python refinement with trend analysis.
 
         Args:
             candidates: SQL screening results
-            prices_df: Batch price data
+            prices: Batch price data
 
         Returns:
             Refined DataFrame with slope and r_squared fields
@@ -266,8 +306,8 @@ LIMIT {sql_limit}
         # Data completeness check
         # Use half of RECENT_LOOKBACK as minimum (at least 12 months for meaningful regression)
         min_months = max(12, self.config['RECENT_LOOKBACK'] // 2)
-        data_counts = prices_df.groupby('code').size()
-        insufficient_codes = data_counts[data_counts < min_months].index.tolist()
+        data_counts = prices.counts()
+        insufficient_codes = [code for code, n in data_counts.items() if n < min_months]
 
         if insufficient_codes:
             logger.warning(f"{len(insufficient_codes)} stocks lack sufficient data (< {min_months} months), removing")
@@ -284,20 +324,12 @@ LIMIT {sql_limit}
             code = row['code']
 
             # Get price series for this stock
-            stock_prices = prices_df[prices_df['code'] == code]['close'].values
+            stock_prices = prices.series(code)
 
             if len(stock_prices) < min_months:
                 logger.debug(f"{code}: Not enough recent months ({len(stock_prices)} < {min_months}), skipping")
                 continue
 
-            # Convert to float array (handles Decimal from PostgreSQL NUMERIC type)
-            try:
-                stock_prices = stock_prices.astype(float)
-            except (ValueError, TypeError) as e:
-                logger.debug(f"{code}: Failed to convert prices to float: {e}")
-                failed_count += 1
-                continue
-
             # Drop NaN/inf to avoid silent linregress failures
             finite_mask = np.isfinite(stock_prices)
             if not finite_mask.all():
@@ -339,7 +371,7 @@ LIMIT {sql_limit}
 
         # Report failures if any
         if failed_count > 0:
-            logger.warning(f"{failed_count} stocks failed trend calculation (type conversion or scipy errors)")
+            logger.warning(f"{failed_count} stocks failed trend calculation (non-finite prices or scipy errors)")
 
         # Convert to DataFrame
         if not results:
@@ -425,11 +457,12 @@ LIMIT {sql_limit}
         Filter out ST stocks (optional).
 
         ST (Special Treatment) stocks are identified by specific markers in their names
-        according to Chinese stock market regulations. This method filters stocks based
-        on name pattern matching, not from a separate ST stock table.
+        according to Chinese stock market regulations. The flag comes from the
+        security master (is_st, see data_infra.security_master); candidates without
+        it are matched on their name with the same rule (data_infra.names.is_st_name).
 
         Args:
-            df: Candidate DataFrame with 'name' column
+            df: Candidate DataFrame with 'name' column (and optionally 'is_st')
 
         Returns:
             Filtered DataFrame
@@ -443,34 +476,14 @@ LIMIT {sql_limit}
             logger.warning("'name' column not found, skipping ST filtering")
             return df
 
-        # Comprehensive ST marker list (Chinese stock market regulations)
-        st_markers = ['ST', '*ST', 'S*ST', 'SST', '退市', 'PT', '终止上市']
-
-        def is_st_stock(name: str) -> bool:
-            """Check if stock name contains ST markers (excluding false positives)."""
-            if pd.isna(name):
-                return False
-            # Use word boundary checking to avoid false positives like "BEST", "FASTEST"
-            # ST markers in Chinese stocks appear at the beginning or as standalone markers
-            name_upper = str(name).upper()
-            for marker in st_markers:
-                # Check if marker is at the beginning or is a complete word
-                if name_upper.startswith(marker) or f' {marker}' in name_upper:
-                    return True
-                # Chinese markers rely on original name
-                if marker in ['退市', '终止上市'] and marker in name:
-                    return True
-                # PT should be case-insensitive
-                if marker == 'PT' and 'PT' in name_upper:
-                    return True
-            return False
-
-        # Apply ST filtering
-        st_mask = df['name'].apply(is_st_stock)
+        # Apply ST filtering: stored flag first, name markers as fallback
+        st_mask = df['name'].apply(lambda name: not pd.isna(name) and is_st_name(name))
+        if 'is_st' in df.columns:
+            st_mask = df['is_st'].where(df['is_st'].notna(), st_mask).astype(bool)
         st_count = st_mask.sum()
 
         if st_count > 0:
-            logger.info(f"Filtering {st_count} ST stocks (markers: {', '.join(st_markers)})")
+            logger.info(f"Filtering {st_count} ST stocks (markers: {', '.join(ST_MARKERS)})")
             return df[~st_mask].reset_index(drop=True)
 
         return df
@@ -763,6 +776,8 @@ Examples:
                        help='Maximum price position in box (e.g., 0.80)')
     parser.add_argument('--sql-limit', type=int, metavar='N',
                        help='SQL candidate limit (e.g., 200)')
+    parser.add_argument('--timeframe', choices=['daily', 'weekly', 'monthly'],
+                       help='K-line timeframe; lookbacks count bars of it (default: monthly)')
 
     # Python layer parameters
     parser.add_argument('--slope-min', type=float, metavar='SLOPE',
@@ -836,6 +851,8 @@ Examples:
         overrides['PRICE_POSITION_MAX'] = args.price_position_max
     if args.sql_limit is not None:
         overrides['SQL_LIMIT'] = args.sql_limit
+    if args.timeframe is not None:
+        overrides['TIMEFRAME'] = args.timeframe
     if args.slope_min is not None:
         overrides['SLOPE_MIN'] = args.slope_min
     if args.slope_max is not None:
@@ -20,7 +20,6 @@ StockMetrics AS (
         close,
         high,
         low,
-        name,  -- 用于后续ST股票过滤
 
         -- 历史高点（默认120个月 = 10年）
         MAX(high) OVER (
@@ -71,8 +70,14 @@ StockMetrics AS (
             ROWS BETWEEN {history_lookback_minus_1} PRECEDING AND CURRENT ROW
         ) AS data_points
 
-    FROM stock_monthly_kline
+    FROM (
+        -- K线周期可选（日/周/月，见 data_infra/kline.py）：桶列统一命名为 month，窗口参数按K线根数计
+        SELECT code, {bucket_column} AS month, close, high, low
+        FROM {kline_view}
+    ) AS kline
     WHERE 1=1
+    -- 月线周期下，证券主表中历史月数不足的股票不可能满足 data_points 条件，提前排除（主表未建或为空时不排除任何股票）
+    {history_prefilter_clause}
     {code_filter_clause}
     -- 重要：不使用全局时间过滤（WHERE month >= ...）
     -- 原因：确保窗口函数能获取完整历史数据，计算准确
@@ -82,7 +87,6 @@ StockMetrics AS (
 DerivedMetrics AS (
     SELECT
         code,
-        name,
         close AS current_price,
         history_high,
         history_low,
@@ -149,8 +153,9 @@ DerivedMetrics AS (
 -- CTE 3: 只保留每股最新月份的数据
 LatestPerStock AS (
     SELECT
-        code,
-        name,
+        d.code,
+        COALESCE(sm.name, n.name) AS name,  -- 当前名称与ST状态：证券主表优先，缺行时回退到维表 stock_name，用于后续ST股票过滤
+        sm.is_st,  -- NULL 时按名称判断（见 _filter_st_stocks）
         current_price,
         history_high,
         history_low,
@@ -161,7 +166,14 @@ LatestPerStock AS (
         volatility_ratio,
         price_position,
         data_points
-    FROM DerivedMetrics
+    FROM DerivedMetrics d
+    {security_master_join}
+    LEFT JOIN LATERAL (
+        SELECT name FROM stock_name s
+        WHERE s.code = d.code
+        ORDER BY s.valid_from DESC
+        LIMIT 1
+    ) n ON TRUE
     WHERE rn = 1  -- 每股最新月份（解决停牌股被误过滤的问题）
 ),
 
@@ -170,6 +182,7 @@ ScoredCandidates AS (
     SELECT
         code,
         name,
+        is_st,
         current_price,
         history_high,
         glory_ratio,
@@ -79,6 +79,12 @@ class TestValidateConfig:
         with pytest.raises(AssertionError, match="MIN_R_SQUARED"):
             validate_config(cfg)
 
+    def test_unknown_timeframe_fails(self):
+        cfg = self._base_config()
+        cfg["TIMEFRAME"] = "hourly"
+        with pytest.raises(AssertionError, match="TIMEFRAME"):
+            validate_config(cfg)
+
     def test_r_squared_zero_fails(self):
         cfg = self._base_config()
         cfg["MIN_R_SQUARED"] = 0.0
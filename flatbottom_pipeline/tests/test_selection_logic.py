@@ -2,6 +2,7 @@
 import numpy as np
 import pandas as pd
 import pytest
+from unittest.mock import MagicMock
 
 from flatbottom_pipeline.selection.find_flatbottom import FlatbottomScreener
 
@@ -157,3 +158,37 @@ class TestFilterStStocks:
         df = self._make_df([None, "浦发银行"])
         result = s._filter_st_stocks(df)
         assert len(result) == 2
+
+
+# ===========================================================================
+# security_master detection
+# ===========================================================================
+
+class TestSecurityMaster:
+    """Tests for FlatbottomScreener.detect_security_master and the query it shapes."""
+
+    def _conn(self, *fetched):
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.side_effect = [(v,) for v in fetched]
+        return conn
+
+    def test_populated_table_is_joined(self):
+        s = _make_screener()
+        assert s.detect_security_master(self._conn(True, True)) is True
+        sql = s._build_sql_query()
+        assert "LEFT JOIN security_master sm" in sql
+        assert "COALESCE(sm.name, n.name)" in sql
+
+    @pytest.mark.parametrize("fetched", [(False,), (True, False)])
+    def test_missing_or_empty_table_falls_back_to_stock_name(self, fetched):
+        s = _make_screener()
+        assert s.detect_security_master(self._conn(*fetched, True, True)) is False
+        sql = s._build_sql_query()
+        assert "security_master" not in sql
+        assert "FROM stock_name" in sql
+
+    @pytest.mark.parametrize("stock_name", [(False,), (True, False)])
+    def test_no_name_source_fails_loudly(self, stock_name):
+        s = _make_screener()
+        with pytest.raises(RuntimeError, match="data_infra.names --populate"):
+            s.detect_security_master(self._conn(True, False, *stock_name))
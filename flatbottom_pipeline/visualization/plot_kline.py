@@ -7,6 +7,8 @@ import mplfinance as mpf
 import psycopg
 from datetime import datetime
 from data_infra.db import get_db_connection
+from data_infra.kline import timeframe
+from data_infra.query import get_bars
 from data_infra.stock_code import classify_cn_stock
 
 # 配置日志
@@ -60,33 +62,22 @@ def process_stock(raw_code, args):
         logger.error(f"Skipping invalid code '{raw_code}': {e}")
         return False
 
-    # 2. 数据查询
-    sql = """
-    SELECT month as "Date", open as "Open", high as "High", 
-           low as "Low", close as "Close", volume / 10000.0 as "Volume" 
-    FROM stock_monthly_kline
-    WHERE code = %s AND month >= %s AND month <= %s
-    ORDER BY month ASC;
-    """
-    
+    # 2. 数据查询（K线周期见 data_infra/kline.py，float64 数组见 data_infra/query.py）
+    tf = timeframe(getattr(args, 'timeframe', None))
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("SET TIME ZONE 'Asia/Shanghai';")
-        
-        # 使用原生连接读取，可能会有 Pandas UserWarning，已知且无害
-        df = pd.read_sql(sql, conn, params=(std_code, args.start, args.end))
-        conn.close()
+        bars = get_bars([std_code], args.start, args.end, freq=tf.name)
     except Exception as e:
         logger.error(f"[{std_code}] Database error: {e}")
         return False
 
-    if df.empty:
+    if not len(bars):
         logger.warning(f"[{std_code}] No data found in range {args.start}~{args.end}.")
         return False
-        
-    df['Date'] = pd.to_datetime(df['Date'])
-    df.set_index('Date', inplace=True)
+
+    df = bars.to_frame(std_code)[['open', 'high', 'low', 'close', 'volume']]
+    df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    df['Volume'] = df['Volume'] / 10000.0
+    df.index.name = 'Date'
     
     # 防御性检查
     if not (df['High'] >= df[['Open', 'Close']].max(axis=1)).all():
@@ -101,7 +92,7 @@ def process_stock(raw_code, args):
     is_batch = args.file is not None
     
     # 批量模式强制使用默认命名，防止 --out 导致覆盖
-    default_name = f"output/{std_code}_kline.png"
+    default_name = f"output/{std_code}_kline.png" if tf.name == 'monthly' else f"output/{std_code}_{tf.name}_kline.png"
     
     if is_batch:
         out_path = default_name
@@ -120,7 +111,7 @@ def process_stock(raw_code, args):
             volume=True,
             ylabel='Price (CNY)',
             ylabel_lower='Volume (10k Shares)',
-            title=f"{std_code} Monthly ({actual_start} ~ {actual_end})",
+            title=f"{std_code} {tf.name.capitalize()} ({actual_start} ~ {actual_end})",
             style='yahoo',
             savefig=out_path,
             closefig=not args.show  # show模式下不关闭，否则关闭以释放内存
@@ -134,7 +125,7 @@ def process_stock(raw_code, args):
 
 def main():
     # 参数解析调整：code 变为可选位置参数，增加 -f 可选参数
-    parser = argparse.ArgumentParser(description='Plot monthly K-line chart (Batch Support)')
+    parser = argparse.ArgumentParser(description='Plot daily/weekly/monthly K-line chart (Batch Support)')
     parser.add_argument('code', nargs='?', help='Stock code (optional if -f is used)')
     parser.add_argument('-f', '--file', help='Batch file path (one code per line)')
     parser.add_argument(
@@ -149,6 +140,8 @@ def main():
         help='Limit number of codes loaded from preselect table (-1 means no limit)'
     )
     
+    parser.add_argument('--timeframe', choices=['daily', 'weekly', 'monthly'], default='monthly',
+                        help='K-line timeframe (default: monthly)')
     parser.add_argument('--start', default='2000-01-01', help='YYYY-MM-DD')
     parser.add_argument('--end', default=datetime.now().strftime('%Y-%m-%d'))
     parser.add_argument('--out', help='Output path (only effective in single stock mode)')
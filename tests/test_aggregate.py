@@ -0,0 +1,141 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import aggregate, db, kline
+
+
+class TestHierarchy(unittest.TestCase):
+
+    def test_rollups_read_the_daily_view(self):
+        self.assertIn("FROM stock_1min_qfq", aggregate.select_sql("daily"))
+        for name in ("weekly", "monthly"):
+            sql = aggregate.select_sql(name)
+            self.assertIn("FROM stock_daily_kline", sql)
+            self.assertIn(f"AS {kline.TIMEFRAMES[name].column}", sql)
+        self.assertIn("time_bucket('1 month', time) AS month", aggregate.FLAT_MONTHLY_SELECT)
+
+    def test_weekly_window_covers_whole_weeks(self):
+        start, end = datetime(2024, 1, 1), datetime(2024, 2, 1)  # Monday, Thursday
+        self.assertEqual(aggregate.bucket_window("weekly", start, end), (start, datetime(2024, 2, 5)))
+        self.assertEqual(aggregate.bucket_window("monthly", start, end), (start, end))
+
+    def test_refresh_months_goes_bottom_up(self):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = ("view",)
+        with patch.object(db, "get_db_connection", return_value=conn):
+            aggregate.refresh_months([datetime(2024, 1, 15)])
+        calls = [c.args for c in cur.execute.call_args_list if "CALL" in c.args[0]]
+        self.assertEqual([c[0].split("'")[1] for c in calls],
+                         ["stock_daily_kline", "stock_weekly_kline", "stock_monthly_kline"])
+        self.assertEqual(calls[1][1], (datetime(2024, 1, 1), datetime(2024, 2, 5)))
+
+    def _run(self, version, flat_monthly, **kwargs):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        answers = {"extversion": (version,), "view_definition": ("SELECT ... FROM stock_1min_qfq",)
+                   if flat_monthly else ("SELECT ... FROM stock_daily_kline",),
+                   "continuous_aggregates WHERE view_name = %s": (1,),
+                   "AT TIME ZONE": (datetime(2001, 1, 1),)}
+        cur.execute.side_effect = lambda q, *a: setattr(
+            cur, "_last", next((v for k, v in answers.items() if k in q), None))
+        cur.fetchone.side_effect = lambda: cur._last
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(aggregate, "backfill", return_value=0) as backfill:
+            aggregate.run_aggregation(**kwargs)
+        return [c.args[0] for c in cur.execute.call_args_list], backfill
+
+    def test_flat_monthly_is_kept_unless_rebuilt(self):
+        statements, backfill = self._run("2.14.2", flat_monthly=True)
+        self.assertFalse(any("DROP MATERIALIZED VIEW" in s for s in statements))
+        backfill.assert_not_called()
+
+        statements, backfill = self._run("2.14.2", flat_monthly=True, rebuild_monthly=True)
+        self.assertTrue(any("DROP MATERIALIZED VIEW stock_monthly_kline" in s for s in statements))
+        backfill.assert_called_once_with("monthly", restart=True)
+
+    def test_old_timescaledb_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            self._run("2.8.1", flat_monthly=False)
+
+    def test_rerun_after_interrupted_daily_backfill_also_fills_rollups(self):
+        views, pending = set(), set()   # existing views; views with unfinished aggregate_backfill rows
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+
+        def execute(query, params=None):
+            if "extversion" in query:
+                cur._last = ("2.14.2",)
+            elif "continuous_aggregates WHERE view_name = %s" in query:
+                cur._last = (1,) if params[0] in views else None
+            elif "view_definition" in query:
+                cur._last = ("SELECT ... FROM stock_daily_kline",)
+            elif "AT TIME ZONE" in query:
+                cur._last = (datetime(2001, 1, 1),)
+            elif "status <> 'DONE' LIMIT 1" in query:
+                cur._last = (1,) if params[0] in pending else None
+            elif query.startswith("CREATE MATERIALIZED VIEW"):
+                views.add(query.split()[3])
+        cur.execute.side_effect = execute
+        cur.fetchone.side_effect = lambda: cur._last
+        cur.executemany.side_effect = lambda query, rows: pending.update(r[0] for r in rows)
+
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(aggregate, "backfill", side_effect=KeyboardInterrupt) as backfill:
+            with self.assertRaises(KeyboardInterrupt):
+                aggregate.run_aggregation()
+        backfill.assert_called_once_with("daily", restart=True)
+        self.assertEqual(pending, {tf.view for tf in kline.TIMEFRAMES.values()})
+
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(aggregate, "backfill", return_value=0) as backfill:
+            aggregate.run_aggregation()
+        self.assertEqual([c.args[0] for c in backfill.call_args_list], ["daily", "weekly", "monthly"])
+        self.assertFalse(any(c.kwargs["restart"] for c in backfill.call_args_list))
+
+
+
+class TestWindowedBackfill(unittest.TestCase):
+
+    def test_windows_are_month_aligned(self):
+        windows = aggregate.backfill_windows(datetime(2000, 1, 1), datetime(2001, 3, 10, 12), 6)
+        self.assertEqual(windows, [(datetime(2000, 1, 1), datetime(2000, 7, 1)),
+                                   (datetime(2000, 7, 1), datetime(2001, 1, 1)),
+                                   (datetime(2001, 1, 1), datetime(2001, 3, 10, 12))])
+
+    def test_only_pending_windows_run(self):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (datetime(2001, 1, 1),)
+        pending = [(datetime(2000, 7, 1), datetime(2001, 1, 1))]
+        cur.fetchall.return_value = pending
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(aggregate, "_refresh_window", side_effect=[1.0]) as refresh:
+            failed = aggregate.backfill("daily", window_months=6, workers=2)
+        self.assertEqual(failed, 0)
+        refresh.assert_called_once_with("daily", *pending[0])
+        planned = next(c.args[1] for c in cur.executemany.call_args_list)
+        self.assertEqual(planned, [("stock_daily_kline", datetime(2000, 1, 1), datetime(2000, 7, 1)),
+                                   ("stock_daily_kline", datetime(2000, 7, 1), datetime(2001, 1, 1))])
+        deletes = [c.args[0] for c in cur.execute.call_args_list if "DELETE" in c.args[0]]
+        self.assertIn("status <> 'DONE'", deletes[0])  # completed windows are kept for the resume
+
+    def test_failed_windows_are_counted(self):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (datetime(2001, 1, 1),)
+        cur.fetchall.return_value = [(datetime(2000, 1, 1), datetime(2000, 7, 1)),
+                                     (datetime(2000, 7, 1), datetime(2001, 1, 1))]
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(aggregate, "_refresh_window", side_effect=[1.0, RuntimeError("deadlock")]):
+            self.assertEqual(aggregate.backfill("daily", window_months=6, workers=1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from data_infra import audit, config, db, loader
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+GOOD = "2000-01-04 09:3{m}:00,sh600000,PFYH,10.0,10.5,11.0,9.0,100,1000.0,,2.0"
+
+
+class TestRejectRule(unittest.TestCase):
+
+    def test_rules_of_clean_row_data_errors(self):
+        cases = {
+            "column_count": ["2000-01-04 09:31:00", "sh600000"],
+            "time_format": ["2000-13-04 09:31:00", "sh600000", "N", "1", "1", "1", "1", "1", "1", "", ""],
+            "code": ["2000-01-04 09:31:00", "xx600000", "N", "1", "1", "1", "1", "1", "1", "", ""],
+            "price_missing": ["2000-01-04 09:31:00", "sh600000", "N", "", "1", "1", "1", "1", "1", "", ""],
+            "price_invalid": ["2000-01-04 09:31:00", "sh600000", "N", "x", "1", "1", "1", "1", "1", "", ""],
+            "high_low": ["2000-01-04 09:31:00", "sh600000", "N", "1", "1", "0.5", "0.9", "1", "1", "", ""],
+            "volume": ["2000-01-04 09:31:00", "sh600000", "N", "1", "1", "1", "1", "1.5", "1", "", ""],
+            "amount": ["2000-01-04 09:31:00", "sh600000", "N", "1", "1", "1", "1", "1", "1e13", "", ""],
+            "change_pct": ["2000-01-04 09:31:00", "sh600000", "N", "1", "1", "1", "1", "1", "1", "1e5", ""],
+        }
+        for rule, row in cases.items():
+            with self.assertRaises(ValueError) as ctx:
+                loader.clean_row_data(row)
+            self.assertEqual(loader.reject_rule(ctx.exception), rule, row)
+        self.assertEqual(loader.reject_rule(IndexError("list index out of range")), "other")
+
+
+class TestAudit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+        lines = [GOOD.format(m=m) for m in range(5)]
+        lines += ["2000-01-04 09:31:00,sz000001,PAYH,1,1,0.5,0.9,1,1,1,1",
+                  "2000-01-04 09:32:00,sz000001,PAYH,1,1,1,1,1,1,1,1"]
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("a.csv", "\n".join([HEADER] + lines).encode("utf-8-sig"))
+            z.writestr("b.csv", "时间,代码\n".encode("utf-8-sig"))
+        self.ok_path = os.path.join(self.tmp.name, "2001_1min.zip")
+        with zipfile.ZipFile(self.ok_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("a.csv", "\n".join([HEADER, GOOD.format(m=1)]).encode("utf-8-sig"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_audit_archive_counts_rejects_and_codes(self):
+        with zipfile.ZipFile(self.ok_path, 'a') as z:
+            z.writestr("c.csv", "\n".join([HEADER, "2001-01-04 09:31:00,sh600000,PFYH,1,1,0.5,0.9,1,1,1,1"]))
+        result = audit.audit_archive(self.ok_path)
+        self.assertEqual((result["rows"], result["skipped"], result["rejects"]), (2, 1, {"high_low": 1}))
+        self.assertEqual(result["codes"], {"600000.SH": 1})
+        self.assertEqual(result["status"], "FAILED")  # 1 of 2 rows exceeds MAX_SKIPPED_RATIO
+        self.assertIn("Exceeded threshold", result["error"])
+
+    def test_time_range_compares_times_not_strings(self):
+        with zipfile.ZipFile(self.ok_path, 'w') as z:
+            z.writestr("a.csv", "\n".join([HEADER, GOOD.replace("09:3{m}", "9:35"),
+                                            GOOD.replace("09:3{m}", "10:01")]))
+        result = audit.audit_archive(self.ok_path)
+        self.assertEqual((result["min_time"], result["max_time"]), ("2000-01-04 09:35:00", "2000-01-04 10:01:00"))
+
+    def test_header_mismatch_fails_the_archive(self):
+        result = audit.audit_archive(self.zip_path)
+        self.assertEqual(result["status"], "FAILED")
+        self.assertIn("Header mismatch", result["error"])
+
+    def test_report_without_database(self):
+        report_path = os.path.join(self.tmp.name, "audit.json")
+        with patch.object(config, "AUDIT_WORKERS", 2), \
+             patch.object(db, "get_db_connection", side_effect=AssertionError("no DB in audits")):
+            audit.run_audit([self.zip_path, self.ok_path], report_path)
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual([r["file"] for r in report["files"]], ["2000_1min.zip", "2001_1min.zip"])
+        ok = report["files"][1]
+        self.assertEqual((ok["status"], ok["rows"], ok["codes"]), ("SUCCESS", 1, {"600000.SH": 1}))
+        self.assertEqual((report["totals"]["files"], report["totals"]["failed"]), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
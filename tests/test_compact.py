@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from data_infra import compact, compression, config, db
+
+ROW = ["2000-01-04 09:31:00", "600000.SH", "PFYH", "-1.2345", "10.5", "11.0", "-9.0001", "100", "1000.0", "", "2.0"]
+
+
+class TestDoubleStorage(unittest.TestCase):
+
+    def test_table_ddl_uses_double_precision(self):
+        create, hypertable, compress = db.table_ddl(compact.COMPACT_TABLE, "double")
+        self.assertIn("open        DOUBLE PRECISION", create)
+        self.assertNotIn("NUMERIC", create)
+        self.assertIn(f"create_hypertable('{compact.COMPACT_TABLE}'", hypertable)
+        self.assertIn("NUMERIC(16, 4)", db.table_ddl()[0])
+
+    def test_binary_copy_sends_floats(self):
+        cur = MagicMock()
+        copy = cur.copy.return_value.__enter__.return_value
+        with patch.object(config, "NUMERIC_STORAGE", "double"), patch.object(config, "COPY_FORMAT", "binary"):
+            db.copy_rows(cur, "stock_1min_qfq", [list(ROW)])
+        types = copy.set_types.call_args[0][0]
+        self.assertEqual(types.count("float8"), 7)
+        self.assertNotIn("numeric", types)
+        (values,), _ = copy.write_row.call_args
+        self.assertEqual(values[3:7], [-1.2345, 10.5, 11.0, -9.0001])
+        self.assertIsNone(values[9])
+        # Four decimals round-trip through float
+        self.assertEqual(Decimal(repr(values[3])), Decimal("-1.2345"))
+
+    def test_checksum_rounds_value_columns(self):
+        values = compact._checksum_values()
+        self.assertIn("round(open::numeric, 4)", values)
+        self.assertIn("volume", values)
+        self.assertNotIn("round(volume", values)
+
+
+class TestCopyRange(unittest.TestCase):
+
+    def _copy(self, sums):
+        conn, admin = MagicMock(), MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        start, end = datetime(2000, 1, 6), datetime(2000, 1, 13)
+        with patch.object(compact, "checksum", side_effect=sums), \
+             patch.object(compression, "decompress_for_load", return_value=0) as decompress:
+            ok = compact.copy_range(conn, admin, start, end)
+        decompress.assert_called_once_with(admin, start, end, compact.COMPACT_TABLE)
+        return ok, cur.execute.call_args_list[-1].args[1]
+
+    def test_matching_checksums_are_verified(self):
+        ok, params = self._copy([(10, Decimal(42)), (10, Decimal(42))])
+        self.assertTrue(ok)
+        self.assertEqual(params[2:], (10, Decimal(42), "VERIFIED"))
+
+    def test_mismatch_is_recorded(self):
+        ok, params = self._copy([(10, Decimal(42)), (9, Decimal(40))])
+        self.assertFalse(ok)
+        self.assertEqual(params[-1], "MISMATCH")
+
+    def test_format_benchmark(self):
+        report = compact.format_benchmark([{"table": "stock_1min_qfq", "storage": "numeric", "size": 2e9,
+                                            "refresh_seconds": 3.0, "screen_seconds": 0.5, "candidates": 12}])
+        self.assertIn("2000.0", report)
+        self.assertIn("numeric", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
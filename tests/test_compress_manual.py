@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import psycopg
+
+from data_infra import compress_manual, db
+
+CHUNK = "_timescaledb_internal._hyper_1_5_chunk"
+
+
+class TestCompressOne(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.__enter__.return_value = self.conn
+        self.cur = self.conn.cursor.return_value.__enter__.return_value
+        self.cur.fetchone.return_value = (4_000_000, 1_000_000)
+        patcher = patch.object(db, "get_db_connection", return_value=self.conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def compress_calls(self):
+        return [c for c in self.cur.execute.call_args_list if "compress_chunk" in c.args[0]]
+
+    def recorded(self):
+        return next(c.args[1] for c in self.cur.execute.call_args_list if "UPDATE compression_jobs" in c.args[0])
+
+    def _fail_compress(self, *errors):
+        """Raise `errors` from the first compress_chunk calls, then succeed."""
+        errors = list(errors)
+
+        def execute(query, *args):
+            if "compress_chunk" in query and errors:
+                raise errors.pop(0)
+        self.cur.execute.side_effect = execute
+
+    def test_lock_errors_are_retried_with_backoff(self):
+        self._fail_compress(psycopg.errors.DeadlockDetected("deadlock"),
+                            psycopg.errors.LockNotAvailable("lock timeout"))
+        with patch.object(compress_manual.time, "sleep") as sleep:
+            r = compress_manual.compress_one(CHUNK, max_retries=3, retry_base=1.0)
+        self.assertEqual((r.status, r.attempts, r.error), ("DONE", 3, None))
+        self.assertEqual((r.before_bytes, r.after_bytes), (4_000_000, 1_000_000))
+        delays = [c.args[0] for c in sleep.call_args_list]
+        self.assertTrue(0.5 <= delays[0] <= 1.5 and 1.0 <= delays[1] <= 3.0)
+        self.assertEqual(self.recorded()[:4], ("DONE", 3, 4_000_000, 1_000_000))
+
+    def test_stats_error_keeps_done_without_bytes(self):
+        def execute(query, *args):
+            if "chunk_compression_stats" in query:
+                raise psycopg.errors.UndefinedFunction("no stats")
+        self.cur.execute.side_effect = execute
+        r = compress_manual.compress_one(CHUNK, max_retries=3, retry_base=1.0)
+        self.assertEqual((r.status, r.attempts, r.before_bytes, r.after_bytes), ("DONE", 1, None, None))
+        self.assertEqual(self.recorded()[:4], ("DONE", 1, None, None))
+
+    def test_exhausted_retries_stay_pending(self):
+        self._fail_compress(*[psycopg.errors.DeadlockDetected("deadlock")] * 3)
+        with patch.object(compress_manual.time, "sleep"):
+            r = compress_manual.compress_one(CHUNK, max_retries=2, retry_base=1.0)
+        self.assertEqual((r.status, r.attempts), ("PENDING", 3))
+        self.assertEqual(len(self.compress_calls()), 3)
+
+    def test_other_errors_fail_without_retry(self):
+        self._fail_compress(psycopg.errors.DiskFull("no space left"))
+        r = compress_manual.compress_one(CHUNK, max_retries=3, retry_base=1.0)
+        self.assertEqual((r.status, r.attempts), ("FAILED", 1))
+        self.assertEqual(self.recorded()[0], "FAILED")
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_failed_chunks_are_requeued_only_on_request(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [("c1",), ("c3",)]
+        self.assertEqual(compress_manual._plan(conn, ["c3", "c2", "c1"], retry_failed=False), ["c3", "c1"])
+        self.assertNotIn("FAILED", cur.executemany.call_args.args[0])
+        compress_manual._plan(conn, ["c3", "c2", "c1"], retry_failed=True)
+        self.assertIn("FAILED", cur.executemany.call_args.args[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import compression, db, scheduling
+
+Y2000 = scheduling.chunk_keys(scheduling.archive_time_range("2000_1min.zip"))
+Y2001 = scheduling.chunk_keys(scheduling.archive_time_range("2001_1min.zip"))
+
+
+def chunk_row(name, start, old_enough=True):
+    """A timescaledb_information.chunks row as selected by _compress_ready."""
+    return (name, start, start + db.CHUNK_INTERVAL, old_enough)
+
+
+class TestCompressionCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.__enter__.return_value = self.conn
+        patcher = patch.object(db, "get_db_connection", return_value=self.conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch.object(compression.threading.Thread, "start"):
+            self.coord = compression.CompressionCoordinator(
+                [(("2000_1min.zip",), Y2000), (("2000_1min.zip", "b.csv"), Y2000), (("2001_1min.zip",), Y2001)])
+
+    def executed(self, fragment):
+        return [c.args[1] for c in self.conn.execute.call_args_list if fragment in c.args[0]]
+
+    def test_decompresses_task_range_before_submit(self):
+        cur = self.conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [("_timescaledb_internal._hyper_1_5_chunk",)]
+        self.coord.before_submit(("2000_1min.zip",), Y2000)
+        table, end, start = cur.execute.call_args[0][1]
+        self.assertEqual(table, "stock_1min_qfq")
+        self.assertLessEqual(start, datetime(2000, 1, 1))
+        self.assertGreater(end, datetime(2000, 12, 31))
+        self.assertEqual(self.executed("decompress_chunk"), [("_timescaledb_internal._hyper_1_5_chunk",)])
+        self.assertEqual(self.coord.decompressed, 1)
+
+    def test_handled_ranges_reuse_one_connection_and_skip_the_lookup(self):
+        cur = self.conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = []
+        self.conn.closed = False
+        self.coord.before_submit(("2000_1min.zip",), Y2000)
+        self.coord.before_submit(("2000_1min.zip", "b.csv"), Y2000)
+        self.assertEqual(cur.execute.call_count, 1)
+        self.coord.before_submit(("2001_1min.zip",), Y2001)
+        self.assertEqual(cur.execute.call_count, 2)
+        _, end, start = cur.execute.call_args[0][1]
+        self.assertGreaterEqual(start, datetime(2000, 12, 1))
+        # The queue DDL in __init__ plus the one connection kept by before_submit
+        self.assertEqual(db.get_db_connection.call_count, 2)
+
+    def _compress_ready(self, queued, rows, compress_new=False):
+        self.coord.compress_new = compress_new
+        self.conn.execute.return_value.fetchall.side_effect = [[(q,) for q in queued], rows]
+        self.coord._compress_ready(self.conn)
+        return [a[0] for a in self.executed("compress_chunk(")]
+
+    def test_recompresses_only_when_no_task_writes_the_chunk(self):
+        rows = [chunk_row("c2000", datetime(2000, 6, 1)), chunk_row("c2001", datetime(2001, 6, 1))]
+        self.coord.task_done(Y2000)
+        self.assertEqual(self._compress_ready(["c2000", "c2001"], rows), [])
+
+        self.coord.task_done(Y2000)
+        self.assertEqual(self._compress_ready(["c2000", "c2001"], rows), ["c2000"])
+
+    def test_compress_after_load_skips_recent_and_untouched_chunks(self):
+        self.coord.task_done(Y2000)
+        self.coord.task_done(Y2000)
+        rows = [chunk_row("c2000", datetime(2000, 6, 1)),
+                chunk_row("recent", datetime(2000, 7, 1), old_enough=False),
+                chunk_row("c1999", datetime(1999, 6, 1))]
+        self.assertEqual(self._compress_ready([], rows), [])
+        self.assertEqual(self._compress_ready([], rows, compress_new=True), ["c2000"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from data_infra import db, layout, loader, synth
+
+
+class TestLayouts(unittest.TestCase):
+
+    def test_parse_layout(self):
+        self.assertEqual(layout.parse_layout("chunk-30d").chunk_days, 30)
+        parsed = layout.parse_layout("wide:chunk=90; orderby=time;index=code, time DESC;index=time")
+        self.assertEqual(parsed, layout.Layout("wide", 90, "code", "time", ("code, time DESC", "time")))
+        self.assertEqual(layout.parse_layout(f"again:{parsed.spec()}").indexes, parsed.indexes)
+        for bad in ("nope", "x:chunk", "x:fill=50", "Bad Label:chunk=1"):
+            with self.assertRaises(ValueError):
+                layout.parse_layout(bad)
+
+    def test_table_ddl_takes_the_layout(self):
+        _, hypertable, compress = db.table_ddl("t", "double", 30, "code", "time")
+        self.assertIn("INTERVAL '30 days'", hypertable)
+        self.assertIn("compress_orderby = 'time'", compress)
+        self.assertIn("INTERVAL '7 days'", db.table_ddl()[1])
+        self.assertIn("compress_orderby = 'time DESC'", db.table_ddl()[2])
+
+    def test_synthetic_rows_pass_validation(self):
+        rows = list(synth.iter_rows(2001, stocks=2, days=1))
+        self.assertEqual(len(rows), 2 * 241)
+        self.assertEqual(len(loader.clean_row_data(rows[0])), len(db.COPY_COLUMNS))
+
+
+class TestMigration(unittest.TestCase):
+
+    def test_plan_only_changes_what_differs(self):
+        self.assertEqual(layout.migration_plan(layout.PRESETS["current"], layout.Layout("same", orderby="time  desc")),
+                         [])
+        steps = layout.migration_plan(layout.PRESETS["current"],
+                                      layout.Layout("new", 30, "code", "time", ("code, time DESC",)))
+        statements = [s for _, s in steps]
+        self.assertIn("set_chunk_time_interval('stock_1min_qfq', INTERVAL '30 days')", statements[0])
+        self.assertIn("stock_1min_qfq_code_time_desc_idx", statements[1])
+        self.assertIn("transaction_per_chunk", statements[1])
+        self.assertIn("compress_orderby = 'time'", statements[2])
+
+    def test_current_layout_reads_the_catalog(self):
+        cur = MagicMock()
+        cur.fetchone.return_value = (timedelta(days=7),)
+        cur.fetchall.return_value = [("time", None, 1, False), ("code", 1, None, None)]
+        self.assertEqual(layout.current_layout(cur), layout.Layout("current", 7))
+
+    def test_current_preset_keeps_the_table_interval(self):
+        migrated = layout.Layout("current", 30)
+        self.assertEqual(layout.migration_plan(migrated, layout.PRESETS["current"]), [])
+        with patch.object(db, "CHUNK_INTERVAL", timedelta(days=30)):
+            self.assertIn("chunk=30;", layout.PRESETS["current"].spec())
+            self.assertIn("INTERVAL '30 days'", db.table_ddl("t", chunk_days=layout.PRESETS["current"].chunk_days)[1])
+
+    def test_format_benchmark(self):
+        report = layout.format_benchmark([{
+            "layout": "chunk-30d", "spec": "chunk=30", "rows": 1000, "chunks": 2, "load_s": 1.0,
+            "raw_bytes": 8e6, "compressed_bytes": 1e6, "compress_s": 0.5, "refresh_s": 0.2,
+            "scan_p50_ms": 3.0, "scan_p95_ms": 9.0, "screen_s": 0.1, "candidates": 4}])
+        self.assertIn("8.0", report)
+        self.assertIn("chunk-30d: chunk=30", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
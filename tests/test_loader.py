@@ -1,7 +1,31 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+import csv
+import io
 import math
-from data_infra import loader, config
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from data_infra import loader, config, db, bulk_load, names, security_master
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+
+
+def write_zip(path, members):
+    """Write a zip of {member_name: [csv lines]} (header prepended)."""
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, lines in members.items():
+            z.writestr(name, "\n".join([HEADER] + lines).encode("utf-8-sig"))
+
+def capture_into(captured):
+    """Fake db.stream_insert/direct_insert collecting rows; every row counts as inserted."""
+    def insert(conn, rows):
+        rows = list(rows)
+        captured.extend(rows)
+        return len(rows)
+    return insert
 
 class TestLoaderCleaning(unittest.TestCase):
     
@@ -85,5 +109,368 @@ class TestLoaderCleaning(unittest.TestCase):
         with self.assertRaises(ValueError):
             loader.clean_row_data(row)
 
+class TestIngestModes(unittest.TestCase):
+    """process_zip_file must deliver the same rows and log status in every ingest mode."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+        good = "2000-01-04 09:3{m}:00,sh600000,PFYH,10.0,10.5,11.0,9.0,100,1000.0,,2.0"
+        write_zip(self.zip_path, {
+            "a.csv": [good.format(m=m) for m in range(5)],
+            "b.csv": ["2000-01-04 09:31:00,sz000001,PAYH,1,1,0.5,0.9,1,1,1,1",  # High < Low
+                      good.format(m=9).replace("sh600000", "bj430090")],
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _run(self, mode, engine="row", stream_error=None):
+        captured = []
+
+        def fake_bulk_insert(conn, data_io):
+            rows = list(csv.reader(io.StringIO(data_io.getvalue())))
+            captured.extend(rows)
+            return len(rows)
+
+        def fake_stream_insert(conn, rows):
+            if stream_error:
+                raise stream_error
+            rows = list(rows)
+            captured.extend(rows)
+            return len(rows)
+
+        conn = MagicMock()
+        with patch.object(config, "INGEST_MODE", mode), \
+             patch.object(config, "VALIDATION_ENGINE", engine), \
+             patch.object(config, "VALIDATION_BLOCK_SIZE", 3), \
+             patch.object(config, "BATCH_SIZE", 2), \
+             patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(db, "bulk_insert", side_effect=fake_bulk_insert), \
+             patch.object(db, "stream_insert", side_effect=fake_stream_insert):
+            loader.process_zip_file(self.zip_path)
+
+        log_params = conn.cursor.return_value.__enter__.return_value.execute.call_args[0][1]
+        return captured, log_params
+
+    def test_stream_matches_buffer(self):
+        buffered, buffered_log = self._run("buffer")
+        streamed, streamed_log = self._run("stream")
+        self.assertEqual(len(streamed), 6)
+        self.assertEqual(buffered, streamed)
+        # status, skipped_lines
+        self.assertEqual(buffered_log[1:3], streamed_log[1:3])
+        self.assertEqual(streamed_log[2], 1)
+        self.assertEqual(buffered_log[-7:], streamed_log[-7:-1] + buffered_log[-1:])
+
+    def test_provenance_logged(self):
+        _, log_params = self._run("stream")
+        total, inserted, conflicts, min_time, max_time, codes, elapsed = log_params[-7:]
+        self.assertEqual((total, inserted, conflicts, codes), (7, 6, 0, 2))
+        self.assertEqual((min_time, max_time), ("2000-01-04 09:30:00", "2000-01-04 09:39:00"))
+        self.assertGreaterEqual(elapsed, 0)
+
+    def test_block_provenance_matches_per_row_tracking(self):
+        bars = [("2000-01-04 9:59:00", "600000.SH", "PFYH"), ("2000-01-04 10:01:00", "600000.SH", "PFYH"),
+                ("2000-02-01 09:31:00", "600000.SH", "ST PFYH"), ("2000-02-01 09:32:00", "600000.SH", ""),
+                ("2000-01-04 09:31:00", "000001.SZ", "PAYH"), ("2000-03-01 09:31:00", "600000.SH", "ST PFYH")]
+        provenance = loader.Provenance()
+        with patch.object(config, "BATCH_SIZE", 4):
+            self.assertEqual(len(list(provenance.observe(iter([list(b) for b in bars])))), 6)
+        self.assertEqual(provenance.rows_copied, 0)  # nothing committed yet
+        provenance.commit()
+
+        runs, coverage = names.NameRuns(), security_master.BarCoverage()
+        for t, code, name in bars:
+            t = loader.sortable_time(t)
+            runs.add(code, t, name)
+            coverage.add(code, t)
+        self.assertEqual(sorted(provenance.name_runs.runs()), sorted(runs.runs()))
+        self.assertEqual({c: s[:2] for c, s in provenance.coverage.spans.items()},
+                         {c: s[:2] for c, s in coverage.spans.items()})
+        self.assertEqual(provenance.coverage.months, coverage.months)
+        self.assertEqual((provenance.rows_copied, provenance.min_time, provenance.max_time, provenance.codes),
+                         (6, "2000-01-04 09:31:00", "2000-03-01 09:31:00", {"600000.SH", "000001.SZ"}))
+
+    def test_rolled_back_batch_is_not_recorded(self):
+        calls = []
+
+        def insert(conn, rows):
+            calls.append(1)
+            if len(calls) == 3:     # the last batch: a4 and the bj430090 row
+                raise RuntimeError("copy failed")
+            return len(list(rows) if not isinstance(rows, io.StringIO) else rows.getvalue().splitlines())
+
+        for mode in ("stream", "pipeline", "buffer"):
+            calls.clear()
+            conn = MagicMock()
+            with self.subTest(mode=mode), patch.object(config, "INGEST_MODE", mode), \
+                 patch.object(config, "BATCH_SIZE", 2), \
+                 patch.object(db, "get_db_connection", return_value=conn), \
+                 patch.object(db, "bulk_insert", side_effect=insert), \
+                 patch.object(db, "stream_insert", side_effect=insert), \
+                 patch.object(loader, "record_security") as record:
+                loader.process_zip_file(self.zip_path)
+                provenance = record.call_args.args[1]
+                self.assertEqual((provenance.rows_copied, provenance.rows_inserted), (4, 4))
+                self.assertEqual(set(provenance.coverage.spans), {"600000.SH"})
+                self.assertEqual(provenance.max_time, "2000-01-04 09:33:00")
+
+    def test_pipeline_matches_buffer(self):
+        buffered, buffered_log = self._run("buffer")
+        piped, piped_log = self._run("pipeline")
+        self.assertEqual(buffered, piped)
+        self.assertEqual(buffered_log[1:4], piped_log[1:4])
+
+    def test_pipeline_copy_error_fails_file(self):
+        with patch.object(config, "PIPELINE_QUEUE_SIZE", 1):
+            _, log_params = self._run("pipeline", stream_error=RuntimeError("copy failed"))
+        self.assertEqual(log_params[1], "FAILED")
+        self.assertEqual(log_params[3], "copy failed")
+
+    def test_vectorized_engine_matches_row_engine(self):
+        row_rows, row_log = self._run("stream", "row")
+        vec_rows, vec_log = self._run("stream", "vectorized")
+        self.assertEqual(row_rows, vec_rows)
+        self.assertEqual(row_log[1:4], vec_log[1:4])
+
+    def test_header_mismatch_fails_file(self):
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            z.writestr("a.csv", "foo,bar\n".encode("utf-8"))
+        for mode in ("stream", "pipeline"):
+            _, log_params = self._run(mode)
+            self.assertEqual(log_params[1], "FAILED")
+            self.assertIn("Header mismatch in a.csv", log_params[3])
+
+
+class TestMemberTasks(unittest.TestCase):
+    """Per-(zip, csv member) loading and the roll-up into load_log."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+        good = "2000-01-04 09:3{m}:00,sh600000,PFYH,10.0,10.5,11.0,9.0,100,1000.0,,2.0"
+        write_zip(self.zip_path, {
+            "a.csv": [good.format(m=m) for m in range(5)],
+            "b.csv": ["bad,row"],
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_list_members(self):
+        with zipfile.ZipFile(self.zip_path) as z:
+            self.assertEqual(loader.list_csv_members(z), ["a.csv", "b.csv"])
+
+    def test_process_single_member(self):
+        captured = []
+        conn = MagicMock()
+        with patch.object(config, "INGEST_MODE", "stream"), \
+             patch.object(loader, "_get_worker_connection", return_value=conn), \
+             patch.object(db, "stream_insert", side_effect=capture_into(captured)):
+            result = loader.process_zip_member(self.zip_path, "a.csv")
+            bad = loader.process_zip_member(self.zip_path, "b.csv")
+
+        self.assertEqual(len(captured), 5)
+        self.assertEqual(result["status"], "SUCCESS")
+        self.assertEqual(result["total_rows"], 5)
+        self.assertEqual(bad["status"], "FAILED")  # 1 of 1 rows skipped > MAX_SKIPPED_RATIO
+        params = conn.cursor.return_value.__enter__.return_value.execute.call_args[0][1]
+        self.assertEqual(params[:4], ("2000_1min.zip", "b.csv", "FAILED", 1))
+        self.assertEqual(params[-7], 1)  # total_rows
+
+    def test_scanned_file_stat_is_not_recomputed(self):
+        conn = MagicMock()
+        scanned = (123, datetime(2024, 1, 2), "f" * 40)
+        with patch.object(config, "INGEST_MODE", "stream"), \
+             patch.object(loader, "_get_worker_connection", return_value=conn), \
+             patch.object(db, "stream_insert", side_effect=capture_into([])), \
+             patch.object(loader, "archive_fingerprint") as fingerprint:
+            loader.process_zip_member(self.zip_path, "a.csv", file_stat=scanned)
+        fingerprint.assert_not_called()
+        params = conn.cursor.return_value.__enter__.return_value.execute.call_args[0][1]
+        self.assertEqual(params[5:8], scanned)
+
+    def _finalize(self, member_rows, members, **kwargs):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = member_rows
+        with patch.object(db, "get_db_connection", return_value=conn):
+            loader.finalize_zip(self.zip_path, members, **kwargs)
+        return cur.execute.call_args[0][1]
+
+    def test_finalize_aggregates_members(self):
+        rows = [("a.csv", "SUCCESS", 0, 50000, 49000, 1000, datetime(2000, 1, 4), datetime(2000, 6, 30), 1, 2.0),
+                ("b.csv", "WARNING", 3, 50000, 49997, 0, datetime(2000, 1, 5), datetime(2000, 12, 29), 1, 3.0)]
+        params = self._finalize(rows, ["a.csv", "b.csv"])
+        self.assertEqual(params[:4], ("2000_1min.zip", "WARNING", 3, "Skipped 3 lines"))
+        self.assertEqual(params[-7:], (100000, 98997, 1000, datetime(2000, 1, 4), datetime(2000, 12, 29), 2, 5.0))
+
+    def test_finalize_missing_or_failed_member(self):
+        params = self._finalize([("a.csv", "SUCCESS", 0, 10, 10, 0, None, None, 1, 0.1)], ["a.csv", "b.csv"])
+        self.assertEqual(params[1], "FAILED")
+        self.assertIn("b.csv", params[3])
+
+    def test_finalize_unreadable_archive(self):
+        params = self._finalize([], [], error_msg="File is not a zip file")
+        self.assertEqual(params[1:4], ("FAILED", 0, "File is not a zip file"))
+
+
+class TestChangeDetection(unittest.TestCase):
+    """Content fingerprints of archives and their use in checkpointing."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+        write_zip(self.zip_path, {"a.csv": ["x"], "b.csv": ["y"]})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint_survives_copy_and_touch(self):
+        fp = loader.archive_fingerprint(self.zip_path)
+        copy = os.path.join(self.tmp.name, "copy.zip")
+        with open(self.zip_path, 'rb') as src, open(copy, 'wb') as dst:
+            dst.write(src.read())
+        os.utime(copy, (0, 0))
+        self.assertEqual(loader.archive_fingerprint(copy), fp)
+
+        write_zip(self.zip_path, {"a.csv": ["x"], "b.csv": ["z"]})
+        self.assertNotEqual(loader.archive_fingerprint(self.zip_path), fp)
+        self.assertIsNone(loader.archive_fingerprint(os.path.join(self.tmp.name, "missing.zip")))
+
+    def test_metadata_change_prefers_fingerprint(self):
+        from data_infra.main import metadata_change, scan_archives
+        size, mtime, fp = scan_archives([self.zip_path])[self.zip_path]
+        logged = {'size': size, 'mtime': datetime(1999, 1, 1), 'fingerprint': fp}
+        self.assertIsNone(metadata_change(logged, size, mtime, fp))
+        self.assertIn("fingerprint", metadata_change(dict(logged, fingerprint="0" * 40), size, mtime, fp))
+        # Rows from before fingerprints fall back to size + mtime
+        self.assertIsNotNone(metadata_change(dict(logged, fingerprint=None), size, mtime, fp))
+
+
+class TestBulkLoad(unittest.TestCase):
+    """Bulk initial load: direct COPY into the hypertable, then per-chunk de-duplication."""
+
+    def test_direct_load_bypasses_staging(self):
+        rows = [["2000-01-04 09:31:00", "600000.SH", "", "1", "1", "1", "1", "1", "", "", ""]] * 3
+        for mode in ("buffer", "stream", "pipeline"):
+            captured = []
+            with patch.object(config, "INGEST_MODE", mode), \
+                 patch.object(config, "BATCH_SIZE", 2), \
+                 patch.object(db, "stream_insert", side_effect=AssertionError("staging used")), \
+                 patch.object(db, "bulk_insert", side_effect=AssertionError("staging used")), \
+                 patch.object(db, "direct_insert", side_effect=lambda c, r: captured.extend(r)):
+                loader._load_rows(MagicMock(), iter(rows), "x.zip", direct=True)
+            self.assertEqual(captured, rows, msg=mode)
+
+    def test_direct_insert_copies_into_hypertable(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        db.direct_insert(conn, iter([["2000-01-04 09:31:00", "600000.SH", "", "1", "1", "1", "1", "1", "", "", ""]]))
+        self.assertIn('"stock_1min_qfq"', cur.copy.call_args[0][0].as_string(None))
+
+    def _finalize(self, chunks, done, dedupe):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = [(c,) for c in done]
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(bulk_load, "list_chunks", return_value=chunks), \
+             patch.object(bulk_load, "dedupe_chunk", side_effect=dedupe) as dedupe_mock, \
+             patch.object(bulk_load, "rebuild_unique_index") as rebuild:
+            ok = bulk_load.finalize_bulk_load(workers=2)
+        return ok, sorted(c.args for c in dedupe_mock.call_args_list), rebuild
+
+    def test_finalize_resumes_and_rebuilds(self):
+        chunks = [("_timescaledb_internal", "_hyper_1_1_chunk", False),
+                  ("_timescaledb_internal", "_hyper_1_2_chunk", False),
+                  ("_timescaledb_internal", "_hyper_1_3_chunk", True)]
+        ok, deduped, rebuild = self._finalize(chunks, ["_timescaledb_internal._hyper_1_1_chunk"], lambda s, n, c: 4)
+        self.assertTrue(ok)
+        # The compressed chunk is de-duplicated too (decompressed first), not skipped
+        self.assertEqual(deduped, [("_timescaledb_internal", "_hyper_1_2_chunk", False),
+                                   ("_timescaledb_internal", "_hyper_1_3_chunk", True)])
+        rebuild.assert_called_once_with(2)
+
+    def test_dedupe_decompresses_compressed_chunk(self):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.rowcount = 3
+        with patch.object(db, "get_db_connection", return_value=conn):
+            self.assertEqual(bulk_load.dedupe_chunk("s", "_hyper_1_3_chunk", compressed=True), 3)
+        first = cur.execute.call_args_list[0].args
+        self.assertIn("decompress_chunk", first[0])
+        self.assertEqual(first[1], ("s._hyper_1_3_chunk",))
+
+    def test_bulk_load_refused_on_loaded_table(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (True,)
+        with patch.object(db, "has_unique_key", return_value=True):
+            self.assertIn("--bulk-initial-load", bulk_load.bulk_load_blocker(conn))
+            conn.__enter__.return_value = conn
+            with patch.object(db, "get_db_connection", return_value=conn), \
+                 patch.object(db, "drop_unique_key") as drop:
+                with self.assertRaises(RuntimeError):
+                    bulk_load.prepare_bulk_load()
+            drop.assert_not_called()
+        cur.fetchone.return_value = (False,)
+        with patch.object(db, "has_unique_key", return_value=True):
+            self.assertIsNone(bulk_load.bulk_load_blocker(conn))
+        # Resuming: the key is already dropped, the loaded rows are this bulk load's
+        with patch.object(db, "has_unique_key", return_value=False):
+            self.assertIsNone(bulk_load.bulk_load_blocker(conn))
+
+    def test_failed_chunk_keeps_key_dropped(self):
+        def dedupe(schema, name, compressed):
+            if name.endswith("2_chunk"):
+                raise RuntimeError("canceling statement")
+            return 0
+        chunks = [("s", "_hyper_1_1_chunk", False), ("s", "_hyper_1_2_chunk", False)]
+        ok, deduped, rebuild = self._finalize(chunks, [], dedupe)
+        self.assertFalse(ok)
+        self.assertEqual(len(deduped), 2)
+        rebuild.assert_not_called()
+
+
+class TestStreamInsert(unittest.TestCase):
+
+    def test_empty_fields_sent_as_null(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        copy = cur.copy.return_value.__enter__.return_value
+        cur.rowcount = 1  # rows inserted by the merge
+        n = db.stream_insert(conn, iter([["2000-01-04 09:31:00", "600000.SH", "", "1", "1", "1", "1", "1", "", "", ""]]))
+        self.assertEqual(n, 1)
+        written = copy.write_row.call_args[0][0]
+        self.assertIsNone(written[2])
+        self.assertEqual(written[3], "1")
+        self.assertIsNone(written[10])
+
+    def test_binary_format_sends_typed_values(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        copy = cur.copy.return_value.__enter__.return_value
+        row = ["2000-01-04 09:31:00", "600000.SH", "PFYH", "10.0", "10.5", "11.0", "-9.0", "100", "1000.0", "", "2.0"]
+        with patch.object(config, "COPY_FORMAT", "binary"):
+            db.stream_insert(conn, iter([row]))
+        copy.set_types.assert_called_once_with(db.COPY_COLUMN_TYPES)
+        written = copy.write_row.call_args[0][0]
+        self.assertEqual(written[0], datetime(2000, 1, 4, 9, 31))
+        self.assertEqual(written[6], Decimal("-9.0"))
+        self.assertEqual(written[7], 100)
+        self.assertIsNone(written[9])
+        self.assertIn("BINARY", cur.copy.call_args[0][0].as_string(None))
+
+    def test_typed_row_accepts_scalar_time_formats(self):
+        row = loader.clean_row_data(["2000-1-4 9:31:00", "sz000001", "PAYH", "1e1", "10", "10", "10", "1e3", "", "", ""])
+        typed = db.to_typed_row(row)
+        self.assertEqual(typed[0], datetime(2000, 1, 4, 9, 31))
+        self.assertEqual(typed[3], Decimal("1e1"))
+        self.assertEqual(typed[7], 1000)
+
+
 if __name__ == '__main__':
     unittest.main()
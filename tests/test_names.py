@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import config, db, names
+
+ROW = ["2000-01-04 09:31:00", "600000.SH", "PFYH", "10.0", "10.5", "11.0", "9.0", "100", "1000.0", "", "2.0"]
+
+
+class TestNameRuns(unittest.TestCase):
+
+    def test_runs_follow_renames(self):
+        runs = names.NameRuns()
+        for t, name in (("2000-01-04 09:31:00", "PFYH"), ("2000-01-04 09:32:00", "PFYH"),
+                        ("2000-01-05 09:31:00", "ST PFYH"), ("2000-01-05 09:32:00", ""),
+                        ("2000-01-06 09:31:00", "ST PFYH")):
+            runs.add("600000.SH", t, name)
+        runs.add("000001.SZ", "2000-01-04 09:31:00", "PAYH")
+        self.assertEqual(sorted(runs.runs()), [
+            ("000001.SZ", "PAYH", "2000-01-04 09:31:00", "2000-01-04 09:31:00"),
+            ("600000.SH", "PFYH", "2000-01-04 09:31:00", "2000-01-04 09:32:00"),
+            ("600000.SH", "ST PFYH", "2000-01-05 09:31:00", "2000-01-06 09:31:00"),
+        ])
+
+    def test_merge_runs_joins_same_name(self):
+        d = lambda day: datetime(2000, 1, day)
+        merged = names.merge_runs([(d(1), d(3), "A"), (d(10), d(12), "B"), (d(4), d(8), "A"), (d(10), d(11), "B")])
+        self.assertEqual(merged, [(d(1), d(8), "A"), (d(10), d(11), "B")])
+
+    def test_record_runs_skips_unchanged_codes(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [(datetime(2000, 1, 4, 9, 31), datetime(2000, 1, 4, 9, 32), "PFYH")]
+        runs = [("600000.SH", "PFYH", "2000-01-04 09:31:00", "2000-01-04 09:32:00")]
+        self.assertEqual(names.record_runs(conn, runs), 0)
+        cur.executemany.assert_not_called()
+
+        runs.append(("600000.SH", "ST PFYH", "2000-01-05 09:31:00", "2000-01-05 09:32:00"))
+        self.assertEqual(names.record_runs(conn, runs), 1)
+        self.assertEqual(len(cur.executemany.call_args[0][1]), 2)
+
+    def test_format_report(self):
+        report = names.format_report({"before": {"size": 2e9, "aggregate_seconds": 10.0},
+                                      "after": {"size": 1.5e9, "aggregate_seconds": 8.0}})
+        self.assertIn("-25.0%", report)
+        self.assertIn("-20.0%", report)
+
+
+class TestDimensionStorage(unittest.TestCase):
+
+    def _copy(self, fmt):
+        cur = MagicMock()
+        copy = cur.copy.return_value.__enter__.return_value
+        with patch.object(config, "NAME_STORAGE", "dimension"), patch.object(config, "COPY_FORMAT", fmt):
+            db.copy_rows(cur, "stock_1min_qfq", [list(ROW)])
+        return cur, copy
+
+    def test_copy_rows_drops_name(self):
+        for fmt in ("text", "binary"):
+            cur, copy = self._copy(fmt)
+            (values,), _ = copy.write_row.call_args
+            self.assertEqual(len(values), len(ROW) - 1)
+            self.assertNotIn("PFYH", values)
+            self.assertNotIn('"name"', cur.copy.call_args[0][0].as_string(None))
+        self.assertEqual(len(copy.set_types.call_args[0][0]), len(ROW) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
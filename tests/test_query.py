@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from data_infra import db, query
+
+
+def epoch_us(*args):
+    return int((datetime(*args) - datetime(1970, 1, 1)).total_seconds() * 1_000_000)
+
+
+ROWS = [
+    (1, epoch_us(2024, 1, 1), 10.0, 11.0, 9.5, 10.5, 1000, 10500.0),
+    (1, epoch_us(2024, 2, 1), 10.5, 12.0, 10.0, 11.5, 2000, 23000.0),
+    (1, epoch_us(2024, 3, 1), 11.5, 12.5, 11.0, 12.0, 1500, 18000.0),
+    (3, epoch_us(2024, 1, 1), -2.0, -1.0, -2.5, -1.5, 300, 450.0),
+]
+
+
+class TestGetBars(unittest.TestCase):
+
+    def _get_bars(self, rows, codes, **kwargs):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        with patch.object(db, "get_db_connection", return_value=conn):
+            bars = query.get_bars(codes, **kwargs)
+        return bars, cur
+
+    def test_rows_become_typed_arrays_grouped_by_code(self):
+        bars, cur = self._get_bars(ROWS, ["600000.SH", "000001.SZ", "300750.SZ", "600000.SH"])
+        self.assertEqual(bars.codes, ["600000.SH", "000001.SZ", "300750.SZ"])
+        self.assertEqual(bars.counts(), {"600000.SH": 3, "000001.SZ": 0, "300750.SZ": 1})
+        self.assertEqual(bars.close.dtype, np.float64)
+        self.assertEqual(bars.volume.dtype, np.int64)
+        self.assertTrue(bars.close.flags["C_CONTIGUOUS"])
+        self.assertEqual(bars.time[0], np.datetime64("2024-01-01T00:00:00"))
+        np.testing.assert_array_equal(bars.series("600000.SH"), [10.5, 11.5, 12.0])
+        np.testing.assert_array_equal(bars.series("300750.SZ", "low"), [-2.5])
+        self.assertEqual(len(bars.series("000001.SZ")), 0)
+        query_sql, params = cur.execute.call_args.args
+        self.assertIn("FROM stock_monthly_kline", query_sql)
+        self.assertNotIn("%(start)s", query_sql)
+        self.assertEqual(params["codes"], bars.codes)
+
+    def test_range_and_freq(self):
+        _, cur = self._get_bars([], ["600000.SH"], start="2024-01-01", end="2024-06-30", freq="daily")
+        query_sql, params = cur.execute.call_args.args
+        self.assertIn("FROM stock_daily_kline", query_sql)
+        self.assertIn("day >= %(start)s AND day <= %(end)s", query_sql)
+        with self.assertRaises(ValueError):
+            query.get_bars(["600000.SH"], freq="hourly")
+
+    def test_tail_and_frames(self):
+        bars, _ = self._get_bars(ROWS, ["600000.SH", "000001.SZ", "300750.SZ"])
+        last = bars.tail(2)
+        self.assertEqual(last.counts(), {"600000.SH": 2, "000001.SZ": 0, "300750.SZ": 1})
+        np.testing.assert_array_equal(last.close, [11.5, 12.0, -1.5])
+        frame = last.to_frame()
+        self.assertEqual(frame["code"].tolist(), ["600000.SH", "600000.SH", "300750.SZ"])
+        one = bars.to_frame("600000.SH")
+        self.assertEqual(one.index[0], datetime(2024, 1, 1))
+        self.assertEqual(one["volume"].tolist(), [1000, 2000, 1500])
+
+    def test_no_rows(self):
+        bars, _ = self._get_bars([], ["600000.SH"])
+        self.assertEqual(len(bars), 0)
+        self.assertEqual(len(bars.tail(5)), 0)
+        self.assertEqual(query.get_bars([]).codes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import aggregate, compression, db, readjust
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+
+
+def bar(t, close="10.5"):
+    return f"{t},sh600000,PFYH,10.0,{close},11.0,9.0,100,1000.0,,2.0"
+
+
+class TestDayDigests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, lines):
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            z.writestr("sh600000.csv", "\n".join([HEADER] + lines).encode("utf-8-sig"))
+
+    def test_group_days_orders_bars(self):
+        rows = [[t, "600000.SH", "", "1", "1", "1", "1", "1", "", "", ""]
+                for t in ("2000-01-04 09:32:00", "2000-1-4 9:31:00", "2000-01-05 09:31:00")]
+        days = readjust.group_days(iter(rows))
+        self.assertEqual(sorted(days), [("600000.SH", date(2000, 1, 4)), ("600000.SH", date(2000, 1, 5))])
+        self.assertEqual([r[0] for r in days[("600000.SH", date(2000, 1, 4))]],
+                         ["2000-1-4 9:31:00", "2000-01-04 09:32:00"])
+        day = days[("600000.SH", date(2000, 1, 4))]
+        self.assertEqual(readjust.day_digest(day), readjust.day_digest(list(day)))
+        self.assertNotEqual(readjust.day_digest(day), readjust.day_digest(day[:1]))
+
+    def _readjust(self, stored, seed=False):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = stored
+        inserted = []
+
+        def stream_insert(conn, rows):
+            rows = list(rows)
+            inserted.extend(rows)
+            return len(rows)
+
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(db, "stream_insert", side_effect=stream_insert), \
+             patch.object(compression, "decompress_for_load", return_value=0) as decompress:
+            result = readjust.readjust_archive(self.zip_path, seed=seed)
+        return result, inserted, cur, decompress
+
+    def test_only_changed_days_are_rewritten(self):
+        self.write([bar("2000-01-04 09:31:00"), bar("2000-01-05 09:31:00")])
+        _, _, cur, _ = self._readjust([], seed=True)
+        stored = [(code, day, digest) for code, day, digest, _ in cur.executemany.call_args[0][1]]
+        code = stored[0][0]
+        # Re-adjusted prices on 01-05 only
+        self.write([bar("2000-01-04 09:31:00"), bar("2000-01-05 09:31:00", close="10.4")])
+
+        result, inserted, cur, decompress = self._readjust(stored)
+        self.assertEqual((result["status"], result["days"], result["changed"]), ("SUCCESS", 2, 1))
+        self.assertEqual(result["months"], {date(2000, 1, 1)})
+        self.assertEqual([r[0] for r in inserted], ["2000-01-05 09:31:00"])
+        deleted = [c.args[1] for c in cur.executemany.call_args_list if "DELETE" in c.args[0]]
+        self.assertEqual(deleted, [[(code, date(2000, 1, 5), date(2000, 1, 6))]])
+        decompress.assert_called_once()
+
+    def test_seed_records_digests_without_rewriting(self):
+        self.write([bar("2000-01-04 09:31:00"), bar("2000-01-05 09:31:00")])
+        result, inserted, cur, decompress = self._readjust([], seed=True)
+        self.assertEqual((result["days"], result["changed"], inserted), (2, 0, []))
+        (stmt, params), = [c.args for c in cur.executemany.call_args_list]
+        self.assertIn("DO NOTHING", stmt)
+        self.assertEqual(len(params), 2)
+        decompress.assert_not_called()
+
+
+class TestMonthRanges(unittest.TestCase):
+
+    def test_contiguous_months_are_merged(self):
+        months = [date(2000, 12, 1), date(2000, 11, 15), date(2001, 1, 1), date(2001, 3, 1)]
+        self.assertEqual(aggregate.month_ranges(months), [
+            (datetime(2000, 11, 1), datetime(2001, 2, 1)),
+            (datetime(2001, 3, 1), datetime(2001, 4, 1)),
+        ])
+        self.assertEqual(aggregate.month_ranges([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
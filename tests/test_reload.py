@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import aggregate, compression, db, reload
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+
+
+def write_member(z, raw_code, times):
+    lines = [f"{t},{raw_code},X,10.0,10.5,11.0,9.0,100,1000.0,,2.0" for t in times]
+    z.writestr(f"{raw_code}_2020.csv", "\n".join([HEADER] + lines).encode("utf-8-sig"))
+
+
+class TestTargetedReload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with zipfile.ZipFile(os.path.join(self.tmp.name, "2020_1min.zip"), 'w') as z:
+            write_member(z, "sh600000", ["2020-03-02 09:31:00", "2020-03-03 09:31:00", "2020-05-06 09:31:00"])
+            write_member(z, "sz000001", ["2020-03-02 09:31:00"])
+        with zipfile.ZipFile(os.path.join(self.tmp.name, "2019_1min.zip"), 'w') as z:
+            write_member(z, "sh600000", ["2019-03-01 09:31:00"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_codes_and_members(self):
+        self.assertEqual(reload.normalize_code("sh600000"), "600000.SH")
+        self.assertEqual(reload.normalize_code("600000.SH"), "600000.SH")
+        self.assertEqual(reload.member_code("sz000001_2020.csv"), "000001.SZ")
+        self.assertIsNone(reload.member_code("data.csv"))
+        self.assertEqual([os.path.basename(p) for p in reload.find_archives(
+            date(2020, 1, 1), date(2020, 3, 31), self.tmp.name)], ["2020_1min.zip"])
+
+    def _reload(self, codes, start, end):
+        conn = MagicMock()
+        conn.__enter__.return_value = conn
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.rowcount = 5
+        inserted = []
+
+        def stream_insert(conn, rows):
+            inserted.extend(rows)
+            return len(inserted)
+
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(db, "stream_insert", side_effect=stream_insert), \
+             patch.object(compression, "decompress_for_load", return_value=1) as decompress, \
+             patch.object(compression, "recompress_queued"), \
+             patch.object(aggregate, "refresh_months") as refresh:
+            result = reload.reload_window(codes, start, end, self.tmp.name)
+        return result, inserted, cur, decompress, refresh
+
+    def test_reload_replaces_only_the_window(self):
+        result, inserted, cur, decompress, refresh = self._reload(["sh600000"], date(2020, 3, 1), date(2020, 4, 30))
+        self.assertEqual(result, {"archives": 1, "days": 2, "deleted": 5, "inserted": 2})
+        self.assertEqual([(r[0], r[1]) for r in inserted],
+                         [("2020-03-02 09:31:00", "600000.SH"), ("2020-03-03 09:31:00", "600000.SH")])
+        self.assertEqual(decompress.call_args[0][1:], (datetime(2020, 3, 1), datetime(2020, 5, 1)))
+        delete, = [c.args for c in cur.execute.call_args_list if "DELETE FROM stock_1min_qfq" in c.args[0]]
+        self.assertEqual(delete[1], (["600000.SH"], datetime(2020, 3, 1), datetime(2020, 5, 1)))
+        self.assertEqual(list(refresh.call_args[0][0]), [date(2020, 3, 1), date(2020, 4, 1)])
+
+    def test_codes_without_bars_are_not_deleted(self):
+        _, _, cur, _, _ = self._reload(["sh600000", "sh600004"], date(2020, 3, 1), date(2020, 4, 30))
+        for table in ("stock_1min_qfq", "day_digest"):
+            delete, = [c.args for c in cur.execute.call_args_list if f"DELETE FROM {table}" in c.args[0]]
+            self.assertEqual(delete[1][0], ["600000.SH"])
+
+    def test_year_without_archive_aborts(self):
+        self.assertEqual(reload.missing_years(reload.find_archives(date(2018, 6, 1), date(2020, 1, 31), self.tmp.name),
+                                              date(2018, 6, 1), date(2020, 1, 31)), [2018])
+        with self.assertRaises(FileNotFoundError):
+            self._reload(["sh600000"], date(2018, 6, 1), date(2020, 1, 31))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from data_infra import db, scheduling
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+
+
+class TestTimeRanges(unittest.TestCase):
+
+    def test_yearly_archive_name(self):
+        start, end = scheduling.archive_time_range("/data/2001_1min.zip")
+        self.assertEqual((start, end.year), (datetime(2001, 1, 1), 2001))
+        keys = scheduling.chunk_keys((start, end))
+        self.assertIn(len(keys), (53, 54))
+        self.assertFalse(keys & scheduling.chunk_keys(scheduling.archive_time_range("2003_1min.zip")))
+
+    def test_quick_scan_for_other_names(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "extra.zip")
+            with zipfile.ZipFile(path, 'w') as z:
+                z.writestr("a.csv", "\n".join([
+                    HEADER,
+                    "2005-03-01 09:31:00,sh600000,PFYH,1,1,1,1,1,1,1,1",
+                    "2005-03-20 15:00:00,sh600000,PFYH,1,1,1,1,1,1,1,1",
+                ]).encode("utf-8-sig"))
+            self.assertEqual(scheduling.archive_time_range(path),
+                             (datetime(2005, 3, 1, 9, 31), datetime(2005, 3, 20, 15, 0)))
+            self.assertIsNone(scheduling.archive_time_range(os.path.join(tmp, "missing.zip")))
+        self.assertEqual(scheduling.chunk_keys(None), frozenset())
+
+    def test_chunk_keys_follow_the_table_interval(self):
+        # After `layout --migrate chunk-30d --apply` the CLIs sync the 30-day interval at startup
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = (timedelta(days=30),)
+        with patch.object(db, "CHUNK_INTERVAL", db.chunk_interval(conn)):
+            keys = scheduling.chunk_keys(scheduling.archive_time_range("2001_1min.zip"))
+            self.assertIn(len(keys), (13, 14))
+            start, end = scheduling.key_window(keys)
+            self.assertEqual(end - start, timedelta(days=30 * len(keys)))
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = None
+        self.assertEqual(db.chunk_interval(conn), db.CHUNK_INTERVAL)
+
+
+class TestChunkAffinityScheduler(unittest.TestCase):
+
+    def tasks(self):
+        y2000, y2001 = frozenset({1, 2}), frozenset({3, 4})
+        return [(("2000", m), y2000) for m in "abc"] + [(("2001", m), y2001) for m in "ab"]
+
+    def test_running_tasks_avoid_shared_chunks(self):
+        s = scheduling.ChunkAffinityScheduler(self.tasks())
+        first, second = s.next_task(), s.next_task()
+        self.assertEqual((first[0], second[0]), ("2000", "2001"))
+        s.release(first)
+        self.assertEqual(s.next_task(), ("2000", "b"))
+        # Both years busy: overlap is unavoidable, the earliest group wins the tie
+        self.assertEqual(s.next_task(), ("2000", "c"))
+        self.assertEqual(len(s), 1)
+
+    def test_fifo_policy_keeps_file_order(self):
+        s = scheduling.ChunkAffinityScheduler(self.tasks(), policy="fifo")
+        order = [s.next_task() for _ in range(5)]
+        self.assertEqual(order, [t for t, _ in self.tasks()])
+        self.assertIsNone(s.next_task())
+
+    def test_run_tasks_bounds_in_flight(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def work(year, member):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            with lock:
+                running[0] -= 1
+            return year + member
+
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            results = [f.result() for _, f in scheduling.run_tasks(ex, work, self.tasks(), max_in_flight=2)]
+        self.assertEqual(sorted(results), ["2000a", "2000b", "2000c", "2001a", "2001b"])
+        self.assertLessEqual(peak[0], 2)
+
+    def test_run_tasks_calls_on_submit_with_original_keys(self):
+        seen = []
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            list(scheduling.run_tasks(ex, lambda y, m: None, self.tasks(), max_in_flight=2, policy="fifo",
+                                      on_submit=lambda args, keys: seen.append((args, keys))))
+        self.assertEqual(seen, self.tasks())
+
+    def test_on_submit_can_replace_call_args(self):
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            done = {args: f.result() for args, f in scheduling.run_tasks(
+                ex, lambda y, m: y + m, self.tasks(), max_in_flight=2,
+                on_submit=lambda args, keys: ("staged-" + args[0], args[1]))}
+        self.assertEqual(done[("2000", "a")], "staged-2000a")
+
+
+class TestLockWaitSampler(unittest.TestCase):
+
+    def test_report(self):
+        sampler = scheduling.LockWaitSampler(interval=0.5)
+        sampler.record([("fin_loader-11", "Lock", "relation"), ("fin_loader-12", None, None)])
+        sampler.record([("fin_loader-11", "LWLock", "BufferContent"), ("fin_loader-12", "IO", "DataFileRead")])
+        report = sampler.report()
+        self.assertIn("fin_loader-11", report)
+        self.assertIn("100.0%", report)
+        self.assertIn("1.0s of 2.0s", report)
+        self.assertEqual(scheduling.LockWaitSampler().report(), "Lock waits: no samples.")
+
+
+if __name__ == '__main__':
+    unittest.main()
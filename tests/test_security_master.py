@@ -0,0 +1,50 @@
+import unittest
+from datetime import date
+from unittest.mock import MagicMock
+
+from data_infra import names, security_master
+
+
+class TestBarCoverage(unittest.TestCase):
+
+    def test_spans_and_months(self):
+        coverage = security_master.BarCoverage()
+        for t in ("2000-02-01 09:31:00", "2000-01-04 09:31:00", "2000-03-01 09:31:00", "2000-03-02 09:31:00"):
+            coverage.add("600000.SH", t)
+        coverage.add("000001.SZ", "2000-01-04 09:31:00")
+        self.assertEqual(coverage.spans["600000.SH"][:2], ["2000-01-04 09:31:00", "2000-03-02 09:31:00"])
+        self.assertEqual(sorted(coverage.months), [("000001.SZ", "2000-01"), ("600000.SH", "2000-01"),
+                                                   ("600000.SH", "2000-02"), ("600000.SH", "2000-03")])
+
+    def test_classify(self):
+        self.assertEqual(security_master.classify("688001.SH"), ("688001", "SH", "STAR"))
+        self.assertEqual(security_master.classify("sz300750"), ("300750", "SZ", "CHINEXT"))
+        self.assertEqual(security_master.classify("HSI"), (None, None, None))
+
+    def test_record_coverage(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        coverage = security_master.BarCoverage()
+        coverage.add("600000.SH", "2000-01-04 09:31:00")
+        coverage.add("600000.SH", "2000-02-01 09:31:00")
+        self.assertEqual(security_master.record_coverage(conn, coverage), 1)
+        (master_sql, master_rows), (month_sql, month_rows) = [c.args for c in cur.executemany.call_args_list]
+        self.assertIn("LEAST(security_master.first_bar", master_sql)
+        self.assertEqual(master_rows, [("600000.SH", "600000", "SH", "SH_MAIN",
+                                        "2000-01-04 09:31:00", "2000-02-01 09:31:00")])
+        self.assertEqual(month_rows, [("600000.SH", date(2000, 1, 1)), ("600000.SH", date(2000, 2, 1))])
+        self.assertEqual(cur.execute.call_args.args[1], (["600000.SH"],))
+        self.assertEqual(security_master.record_coverage(conn, security_master.BarCoverage()), 0)
+
+
+class TestStNames(unittest.TestCase):
+
+    def test_is_st_name(self):
+        for name in ("ST通葡", "*ST海润", "S*ST前锋", "SST天一", "退市大控"):
+            self.assertTrue(names.is_st_name(name), name)
+        for name in ("通葡股份", "BEST股份", "FASTEST科技", "", None):
+            self.assertFalse(names.is_st_name(name), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
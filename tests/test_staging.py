@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+
+from data_infra import staging
+
+
+class TestArchiveStager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src")
+        self.stage = os.path.join(self.tmp.name, "stage")
+        os.makedirs(self.src)
+        self.paths = []
+        for year in (2000, 2001, 2002):
+            path = os.path.join(self.src, f"{year}_1min.zip")
+            with zipfile.ZipFile(path, 'w') as z:
+                z.writestr("a.csv", "x" * 1000)
+            os.utime(path, (1_000_000_000, 1_000_000_000))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def wait_staged(self, stager, path):
+        deadline = time.time() + 5
+        while not stager.is_staged(path) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_stage_resolve_release(self):
+        stager = staging.ArchiveStager(self.paths, stage_dir=self.stage, ahead=1, max_bytes=10**9)
+        stager.start()
+        self.wait_staged(stager, self.paths[0])
+        # Only one archive is copied ahead of the workers
+        self.assertEqual(os.listdir(self.stage), ["2000_1min.zip"])
+
+        args = stager.stage_args((self.paths[0], "a.csv"))
+        self.assertEqual(args, (os.path.join(self.stage, "2000_1min.zip"), "a.csv"))
+        st_src, st_stage = os.stat(self.paths[0]), os.stat(args[0])
+        self.assertEqual((st_src.st_size, st_src.st_mtime), (st_stage.st_size, st_stage.st_mtime))
+
+        self.wait_staged(stager, self.paths[1])
+        stager.release(self.paths[0])
+        self.assertFalse(os.path.exists(args[0]))
+        stager.close()
+        self.assertEqual(os.listdir(self.stage), [])
+        self.assertGreater(stager.source_stats.bytes, 0)
+
+    def test_archives_over_the_cap_are_read_from_source(self):
+        stager = staging.ArchiveStager(self.paths, stage_dir=self.stage, ahead=2, max_bytes=10)
+        stager.start()
+        self.assertEqual(stager.resolve(self.paths[0]), self.paths[0])
+        stager.close()
+        self.assertEqual(os.listdir(self.stage), [])
+
+    def test_open_timed_counts_reads(self):
+        stats = staging.ReadStats()
+        with staging.open_timed(self.paths[0], stats) as z:
+            self.assertEqual(z.read("a.csv"), b"x" * 1000)
+        self.assertGreaterEqual(stats.bytes, 1000)
+        self.assertIn("MB", stats.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from data_infra import audit, bench_load, loader, synth
+
+
+class TestSyntheticArchives(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_codes_cover_all_exchanges(self):
+        codes = synth.stock_codes(20)
+        self.assertEqual(len(codes), 20)
+        self.assertEqual({c[:2] for c in codes}, {"sh", "sz", "bj"})
+        self.assertIn("sz000001", codes)
+
+    def test_layout_matches_the_real_archives(self):
+        archives = synth.generate(self.tmp.name, [2003], stocks=3, days=2, negative_share=1.0)
+        path, stats = next(iter(archives.items()))
+        self.assertEqual(os.path.basename(path), "2003_1min.zip")
+        self.assertEqual(stats.rows, 3 * 2 * 241)
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(z.namelist()[0], f"{stats.codes[0]}_2003.csv")
+            header, first = z.read(z.namelist()[0]).decode("utf-8-sig").splitlines()[:2]
+        loader.check_header(header.split(","))
+        row = loader.clean_row_data(first.split(","))
+        self.assertEqual(row[0], "2003-01-01 09:30:00")
+        self.assertTrue(row[3].startswith("-"))
+
+    def test_injected_bad_rows_match_the_audit(self):
+        path = os.path.join(self.tmp.name, "2001_1min.zip")
+        stats = synth.write_archive(path, 2001, stocks=5, days=3, bad_ratio=0.05)
+        self.assertEqual(set(stats.bad), set(synth.BAD_ROWS))
+        result = audit.audit_archive(path)
+        self.assertEqual(result["rejects"], dict(stats.bad))
+        self.assertEqual(sum(result["codes"].values()), stats.valid_rows)
+
+
+class TestBenchLoad(unittest.TestCase):
+
+    def test_parse_variant(self):
+        self.assertEqual(bench_load.parse_variant("sb:INGEST_MODE=stream, COPY_FORMAT=binary"),
+                         ("sb", {"INGEST_MODE": "stream", "COPY_FORMAT": "binary"}))
+        self.assertEqual(bench_load.parse_variant("default:"), ("default", {}))
+        with self.assertRaises(ValueError):
+            bench_load.parse_variant("x:INGEST_MODE")
+
+    def test_regressions_against_the_same_spec(self):
+        spec = {"years": [2001], "stocks": 10, "days": 5, "bad_ratio": 0.0}
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write('{"variant": "a", "spec": %s, "rows_per_sec": 1000}\n' % str(spec).replace("'", '"'))
+            f.write('{"variant": "a", "spec": {"stocks": 1}, "rows_per_sec": 5000}\n')
+        try:
+            previous = bench_load.previous_results(f.name, spec)
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(previous["a"]["rows_per_sec"], 1000)
+        records = [{"variant": "a", "rows_per_sec": 850}, {"variant": "b", "rows_per_sec": 1}]
+        self.assertEqual(bench_load.regressions(records, previous, 0.10), [("a", 1000, 850)])
+        self.assertEqual(bench_load.regressions(records, previous, 0.20), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest.mock import MagicMock, patch
+
+from data_infra import config, db, loader, telemetry
+
+HEADER = "时间,代码,名称,开盘,收盘,最高,最低,成交量,成交额,涨幅,振幅"
+GOOD = "2000-01-04 09:3{m}:00,sh600000,PFYH,10.0,10.5,11.0,9.0,100,1000.0,,2.0"
+
+
+class TestStageClock(unittest.TestCase):
+
+    def test_nested_time_is_taken_out_of_the_outer_stage(self):
+        clock = telemetry.StageClock()
+
+        def rows():
+            for i in range(3):
+                time.sleep(0.01)
+                clock.add("validate", 0.004)
+                yield i
+
+        with patch.object(config, "METRICS_FILE", "metrics.jsonl"):
+            with clock.stage("copy"):
+                self.assertEqual(list(clock.timed_rows(rows())), [0, 1, 2])
+        self.assertAlmostEqual(clock.seconds["validate"], 0.012)
+        self.assertGreaterEqual(clock.seconds["parse"], 0.03 - 0.012 - 0.005)
+        self.assertGreaterEqual(clock.seconds["copy"], 0)
+        self.assertLess(clock.seconds["copy"], 0.01)
+
+    def test_disabled_stage_records_nothing(self):
+        clock = telemetry.StageClock()
+        with patch.object(config, "METRICS_FILE", ""):
+            with clock.stage("copy"):
+                pass
+        self.assertEqual(dict(clock.seconds), {})
+
+
+class TestLoadMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "2000_1min.zip")
+        self.metrics = os.path.join(self.tmp.name, "metrics.jsonl")
+        lines = [GOOD.format(m=m) for m in range(5)] + ["2000-01-04 09:31:00,sz000001,PAYH,1,1,0.5,0.9,1,1,1,1"]
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("a.csv", "\n".join([HEADER] + lines).encode("utf-8-sig"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _load(self, mode):
+        def fake_stream_insert(conn, rows):
+            with telemetry.clock.stage("copy"):
+                return len(list(rows))
+
+        with patch.object(config, "METRICS_FILE", self.metrics), \
+             patch.object(config, "INGEST_MODE", mode), \
+             patch.object(config, "BATCH_SIZE", 2), \
+             patch.object(db, "get_db_connection", return_value=MagicMock()), \
+             patch.object(db, "stream_insert", side_effect=fake_stream_insert):
+            loader.process_zip_file(self.zip_path)
+
+    def test_one_line_per_load(self):
+        reporter = telemetry.MetricsReporter(self.metrics, prom_path="", interval=60)
+        for mode in ("stream", "pipeline"):
+            self._load(mode)
+        with open(self.metrics, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        record = records[0]
+        self.assertEqual((record["label"], record["status"], record["rows"], record["skipped"], record["inserted"]),
+                         ("2000_1min.zip", "FAILED", 6, 1, 5))  # 1 of 6 rows skipped exceeds MAX_SKIPPED_RATIO
+        self.assertGreater(record["decompressed_bytes"], 0)
+        for stage in telemetry.STAGES:
+            self.assertGreaterEqual(record[f"{stage}_s"], 0)
+
+        self.assertEqual(reporter.poll(), 2)
+        self.assertEqual(reporter.total()["rows"], 12)
+        self.assertEqual(reporter.poll(), 0)
+        self.assertIn(f'loader_rows_total{{worker="{os.getpid()}"}} 12', reporter.prometheus())
+        self.assertIn("total", reporter.summary())
+
+    def test_off_by_default(self):
+        with patch.object(config, "METRICS_FILE", ""):
+            telemetry.emit({"rows": 1})
+        self.assertFalse(os.path.exists(self.metrics))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Parity tests: validation.clean_block must accept/reject exactly like loader.clean_row_data."""
+import random
+import unittest
+from unittest.mock import patch
+
+from data_infra import config, loader, validation
+
+BASE_ROW = [
+    "2000-01-04 09:31:00", "sh600000", "浦发银行",
+    "10.0", "10.5", "11.0", "9.0",
+    "100", "1000.0", "5.0", "2.0",
+]
+
+# (column index, candidate values) used to build adversarial rows
+VARIANTS = {
+    loader.IDX_TIME: [
+        "2000-01-04 09:31:00", " 2000-01-04 09:31:00 ", "2000-01-04 09:31:00.000",
+        "2000-1-4 9:31:00", "2000-02-29 09:31:00", "2001-02-29 09:31:00", "1900-02-29 00:00:00",
+        "0000-01-01 00:00:00", "2000-01-01 23:59:60", "2000-01-01 24:00:00", "2000-13-01 00:00:00",
+        "2000-00-10 00:00:00", "2000-04-31 00:00:00", "2000/01/04 09:31:00", "", "   ",
+        "2000-01-04T09:31:00", "１９９９-01-04 09:31:00", "9999-12-31 23:59:59",
+    ],
+    loader.IDX_CODE: [
+        "sh600000", "SZ000001", "bj430090", " sh600000 ", "Sh600000", "600000", "hk00700",
+        "", " ", "sh", "sz00000a", "sh600000.", "ＳＨ600000",
+    ],
+    loader.IDX_NAME: ["浦发银行", "", "ST 测试", " *ST股 "],
+    loader.IDX_OPEN: ["10.0", "10", "-3.25", "", " ", "1e2", "inf", "nan", "abc", "+1.5", " 10.0", "1_0", "1" * 400],
+    loader.IDX_CLOSE: ["10.5", "0", "-0.0001", "", ".5", "5.", "NaN"],
+    loader.IDX_HIGH: ["11.0", "9.0", "8.99", "10", "", "-1"],
+    loader.IDX_LOW: ["9.0", "9", "11.0", "11.01", "", "-2"],
+    loader.IDX_VOL: [
+        "100", "", " ", "-0", "007", "123.0", "1.5", "1e6", "1e16", "100000000000",
+        "100000000001", "-100000000001", "99999999999999999999", "+5", " 5 ", "abc", "inf",
+    ],
+    loader.IDX_AMT: ["1000.0", "", " ", "1000000000000", "1000000000000.01", "-5", "inf", "x", "1e3"],
+    loader.IDX_PCT: ["5.0", "", "10000", "10000.0001", "-10000", "-10000.5", "nan"],
+    loader.IDX_AMP: ["2.0", "", "10000", "20000", "-inf", " 2.0"],
+}
+
+
+def scalar_result(row):
+    try:
+        return loader.clean_row_data(row)
+    except (ValueError, IndexError) as e:
+        return e
+
+
+def assert_parity(test, rows):
+    vectorized = validation.clean_block(rows)
+    test.assertEqual(len(vectorized), len(rows))
+    for row, got in zip(rows, vectorized):
+        expected = scalar_result(row)
+        if isinstance(expected, Exception):
+            test.assertIsInstance(got, Exception, msg=f"row accepted but scalar rejects: {row}")
+            test.assertEqual(str(got), str(expected), msg=f"row: {row}")
+        else:
+            test.assertNotIsInstance(got, Exception, msg=f"row rejected but scalar accepts: {row}: {got}")
+            test.assertEqual(list(got), expected, msg=f"row: {row}")
+
+
+class TestCleanBlockParity(unittest.TestCase):
+
+    def test_single_field_variants(self):
+        rows = []
+        for idx, values in VARIANTS.items():
+            for v in values:
+                row = BASE_ROW.copy()
+                row[idx] = v
+                rows.append(row)
+        assert_parity(self, rows)
+
+    def test_column_counts(self):
+        rows = [[], [""], BASE_ROW[:10], BASE_ROW + ["extra"], BASE_ROW.copy()]
+        assert_parity(self, rows)
+
+    def test_random_combinations(self):
+        rng = random.Random(20240101)
+        rows = []
+        for _ in range(5000):
+            row = BASE_ROW.copy()
+            for idx in rng.sample(list(VARIANTS), rng.randint(0, 4)):
+                row[idx] = rng.choice(VARIANTS[idx])
+            rows.append(row)
+        assert_parity(self, rows)
+
+    def test_random_decimal_prices(self):
+        # High/Low compared right at the rounding boundary, incl. >15 significant digits
+        rng = random.Random(7)
+        rows = []
+        for _ in range(5000):
+            digits = "".join(rng.choice("0123456789") for _ in range(rng.randint(1, 20)))
+            cut = rng.randint(0, len(digits))
+            value = (digits[:cut] or "0") + ("." + digits[cut:] if digits[cut:] else "")
+            other = value + rng.choice(["", "0", "1", "00000000000000001"])
+            if "." not in value and other != value:
+                other = value + "." + other[len(value):]
+            row = BASE_ROW.copy()
+            sign = rng.choice(["", "-"])
+            row[loader.IDX_HIGH], row[loader.IDX_LOW] = rng.sample([sign + value, sign + other], 2)
+            rows.append(row)
+        assert_parity(self, rows)
+
+    def test_all_valid_block(self):
+        rows = []
+        for m in range(60):
+            row = BASE_ROW.copy()
+            row[loader.IDX_TIME] = f"2000-01-04 10:{m:02d}:00"
+            rows.append(row)
+        result = validation.clean_block(rows)
+        self.assertFalse(any(isinstance(r, Exception) for r in result))
+        self.assertEqual(result[0][1], "600000.SH")
+        assert_parity(self, rows)
+
+    def test_valid_rows_skip_scalar_path(self):
+        rows = [BASE_ROW.copy() for _ in range(10)]
+        with patch.object(loader, "clean_row_data", side_effect=AssertionError("scalar path used")):
+            result = validation.clean_block(rows)
+        self.assertEqual(result[0], scalar_result(BASE_ROW))
+
+    def test_without_code_standardization(self):
+        rows = [BASE_ROW.copy(), [v if i != loader.IDX_CODE else " 600000 " for i, v in enumerate(BASE_ROW)]]
+        with patch.object(config, "STANDARDIZE_CODE", False):
+            assert_parity(self, rows)
+
+    def test_empty_block(self):
+        self.assertEqual(validation.clean_block([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
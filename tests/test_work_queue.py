@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from data_infra import config, db, loader, work_queue
+
+
+def mock_conn():
+    conn = MagicMock()
+    conn.__enter__.return_value = conn
+    return conn, conn.cursor.return_value.__enter__.return_value
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def test_worker_drains_queue(self):
+        conn, cur = mock_conn()
+        cur.fetchone.return_value = (0,)  # no RUNNING leases left
+        claimed_at = datetime(2024, 1, 1)
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(config, "DATA_DIR", "/data"), \
+             patch.object(config, "QUEUE_HEARTBEAT_SECONDS", 60), \
+             patch.object(work_queue, "claim_task", side_effect=[("2000_1min.zip", 1, claimed_at), None]), \
+             patch.object(work_queue, "complete_task") as complete, \
+             patch.object(loader, "process_zip_file") as process:
+            self.assertEqual(work_queue.run_queue_worker(), 1)
+        process.assert_called_once_with("/data/2000_1min.zip")
+        self.assertEqual(complete.call_args[0][1], "2000_1min.zip")
+        self.assertEqual(complete.call_args[0][3], claimed_at)
+
+    def test_idle_worker_waits_for_live_leases(self):
+        conn, cur = mock_conn()
+        cur.fetchone.side_effect = [(2,), (0,)]
+        with patch.object(db, "get_db_connection", return_value=conn), \
+             patch.object(work_queue, "claim_task", return_value=None), \
+             patch.object(work_queue.time, "sleep") as sleep:
+            self.assertEqual(work_queue.run_queue_worker(), 0)
+        sleep.assert_called_once_with(config.QUEUE_POLL_SECONDS)
+
+    def test_claim_uses_skip_locked(self):
+        conn, cur = mock_conn()
+        cur.fetchone.return_value = ("2000_1min.zip", 1, datetime(2024, 1, 1))
+        self.assertEqual(work_queue.claim_task(conn, "host:1")[0], "2000_1min.zip")
+        claim_sql = cur.execute.call_args_list[-1][0][0]
+        self.assertIn("FOR UPDATE SKIP LOCKED", claim_sql)
+        self.assertIn("lease_until < NOW()", claim_sql)
+
+    def test_heartbeat_detects_lost_lease(self):
+        conn, cur = mock_conn()
+        cur.rowcount = 0
+        self.assertFalse(work_queue.heartbeat(conn, "2000_1min.zip", "host:1"))
+        cur.rowcount = 1
+        self.assertTrue(work_queue.heartbeat(conn, "2000_1min.zip", "host:1"))
+
+    def test_complete_maps_load_log_status(self):
+        for row, expected in [(("WARNING", "Skipped 3 lines"), "DONE"), (("FAILED", "boom"), "FAILED"), (None, "FAILED")]:
+            conn, cur = mock_conn()
+            cur.fetchone.return_value = row
+            work_queue.complete_task(conn, "2000_1min.zip", "host:1", datetime(2024, 1, 1))
+            self.assertEqual(cur.execute.call_args[0][1][0], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()